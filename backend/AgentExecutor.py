@@ -0,0 +1,178 @@
+"""
+Agent loop for Bedrock converse tool calling
+
+- All toolUse blocks of one model turn run concurrently (thread pool), results are sent back in
+  the order the model asked for them
+- Bounded: at most max_steps model round trips and one deadline for the whole run; a tool that
+  fails or misses the deadline is reported to the model as an error result
+- Every model call and tool call is recorded as a step with its duration
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional
+
+from observability import span
+
+TIMEOUT_ANSWER = "ขออภัย ใช้เวลาประมวลผลนานเกินกำหนด กรุณาลองใหม่อีกครั้ง"
+MAX_STEPS_ANSWER = "ขออภัย ไม่สามารถสรุปคำตอบได้ภายในจำนวนขั้นตอนที่กำหนด กรุณาถามให้เจาะจงมากขึ้น"
+
+
+@dataclass
+class AgentStep:
+    step: int
+    type: str  # model | tool
+    name: str
+    duration_ms: float
+    status: str  # stop reason for model steps, ok / error / timeout for tool steps
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class AgentResult:
+    text: str
+    stop_reason: str  # end_turn | max_steps | deadline | max_tokens | ...
+    steps: List[AgentStep] = field(default_factory=list)
+    duration_ms: float = 0.0
+
+    @property
+    def tools_used(self) -> List[str]:
+        return [s.name for s in self.steps if s.type == "tool"]
+
+    def to_dict(self) -> Dict:
+        return {"stop_reason": self.stop_reason, "tools_used": self.tools_used,
+                "duration_ms": round(self.duration_ms, 1), "steps": [asdict(s) for s in self.steps]}
+
+
+class AgentExecutor:
+    """
+    Args:
+        client: bedrock-runtime client (converse)
+        model_id: model / inference profile used for the loop
+        system_prompt: converse `system` blocks
+        tools: tool name -> callable(input dict) -> JSON-serialisable result
+        tool_specs: converse toolSpec entries for the same tools
+        max_steps: max model round trips per run
+        deadline_s: wall-clock budget for one run
+        max_parallel_tools: concurrent tool calls
+    """
+
+    def __init__(self, client, model_id: str, system_prompt: List[Dict], tools: Dict[str, Callable[[Dict], Dict]],
+                 tool_specs: List[Dict], max_steps: int = 5, deadline_s: float = 60.0, max_parallel_tools: int = 4):
+        self.client = client
+        self.model_id = model_id
+        self.system_prompt = system_prompt
+        self.tools = tools
+        self.tool_config = {"tools": tool_specs}
+        self.max_steps = max_steps
+        self.deadline_s = deadline_s
+        self.pool = ThreadPoolExecutor(max_workers=max_parallel_tools, thread_name_prefix="agent-tool")
+
+    def _converse(self, conversation: List[Dict]) -> Dict:
+        with span("llm_call", model=self.model_id):
+            return self.client.converse(
+                modelId=self.model_id,
+                messages=conversation,
+                system=self.system_prompt,
+                toolConfig=self.tool_config,
+            )
+
+    def _call_tool(self, name: str, tool_input: Dict):
+        """(status, result, error, duration_ms); never raises"""
+        start = time.perf_counter()
+        try:
+            if name not in self.tools:
+                raise ValueError(f"Tool {name} not found")
+            with span("tool_call", tool=name):
+                result = self.tools[name](tool_input)
+            return "ok", result, None, (time.perf_counter() - start) * 1000
+        except Exception as e:
+            # HTTPException raised inside the tools carries its message in .detail
+            error = getattr(e, "detail", None) or str(e)
+            return "error", None, error, (time.perf_counter() - start) * 1000
+
+    def _run_tools(self, tool_uses: List[Dict], step: int, deadline: float, steps: List[AgentStep]) -> List[Dict]:
+        """Run one turn's tool calls concurrently; returns toolResult blocks in request order"""
+        start = time.perf_counter()
+        # copy_context: spans inside the tools are recorded on the current request
+        futures = [self.pool.submit(contextvars.copy_context().run, self._call_tool, t["name"], t.get("input", {}))
+                   for t in tool_uses]
+        wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+        results = []
+        for tool_use, future in zip(tool_uses, futures):
+            if future.done():
+                status, content, error, duration_ms = future.result()
+            else:
+                # Still running: the thread finishes in the background, its result is dropped
+                future.cancel()
+                status, content, error = "timeout", None, "deadline exceeded"
+                duration_ms = (time.perf_counter() - start) * 1000
+            steps.append(AgentStep(step, "tool", tool_use["name"], duration_ms, status, error=error))
+
+            if status == "ok":
+                result = {"toolUseId": tool_use["toolUseId"], "content": [{"json": content}]}
+            else:
+                print(f"⚠️ Tool {tool_use['name']} {status}: {error}")
+                result = {"toolUseId": tool_use["toolUseId"], "status": "error",
+                          "content": [{"json": {"error": True, "message": error}}]}
+            results.append({"toolResult": result})
+        return results
+
+    def run(self, conversation: List[Dict]) -> AgentResult:
+        """
+        Run the model / tool loop on a conversation (appended to in place)
+
+        Returns:
+            AgentResult with the final text, why the loop stopped, and per-step timings
+        """
+        run_start = time.perf_counter()
+        deadline = time.monotonic() + self.deadline_s
+        start_len = len(conversation)
+        steps: List[AgentStep] = []
+        text, stop_reason = "", "max_steps"
+
+        for step in range(1, self.max_steps + 1):
+            if time.monotonic() >= deadline:
+                stop_reason = "deadline"
+                break
+            t0 = time.perf_counter()
+            response = self._converse(conversation)
+            usage = response.get("usage", {})
+            message = response["output"]["message"]
+            conversation.append(message)
+            steps.append(AgentStep(step, "model", self.model_id, (time.perf_counter() - t0) * 1000,
+                                   response["stopReason"], usage.get("inputTokens"), usage.get("outputTokens")))
+
+            tool_uses = [block["toolUse"] for block in message["content"] if "toolUse" in block]
+            if response["stopReason"] != "tool_use" or not tool_uses:
+                # Only a turn that did not ask for tools is an answer; text next to a toolUse is interim
+                text = "\n".join(block["text"] for block in message["content"] if "text" in block)
+                stop_reason = response["stopReason"]
+                break
+            if step == self.max_steps:
+                break
+            conversation.append({"role": "user", "content": self._run_tools(tool_uses, step, deadline, steps)})
+
+        if stop_reason in ("deadline", "max_steps"):
+            text = TIMEOUT_ANSWER if stop_reason == "deadline" else MAX_STEPS_ANSWER
+            # Drop the unfinished tool exchange so the conversation stays valid for a follow-up turn
+            del conversation[start_len:]
+            conversation.append({"role": "assistant", "content": [{"text": text}]})
+        result = AgentResult(text, stop_reason, steps, (time.perf_counter() - run_start) * 1000)
+        print(f"🤖 Agent {stop_reason}: {len([s for s in steps if s.type == 'model'])} model calls, "
+              f"{len(result.tools_used)} tool calls, {result.duration_ms:.0f} ms")
+        return result
+
+
+def executor_settings() -> Dict:
+    """max_steps / deadline_s / max_parallel_tools from the environment"""
+    return {
+        "max_steps": int(os.getenv("AGENT_MAX_STEPS", "5")),
+        "deadline_s": float(os.getenv("AGENT_DEADLINE_S", "60")),
+        "max_parallel_tools": int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4")),
+    }
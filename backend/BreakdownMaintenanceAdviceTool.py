@@ -3,6 +3,8 @@ from typing import Dict, List, Optional
 # Sensor threshold analysis
 class BreakdownMaintenanceAdviceTool:
 
+    NORMAL_STATUSES = ("ปกติ", "Very Good", "Good", "No information")
+
     @staticmethod
     def get_tool_spec():
         return {
@@ -173,6 +175,7 @@ class BreakdownMaintenanceAdviceTool:
         temp_v = sensor_data.get('Temperator_Winding_Motor_Phase_V', 0)
         temp_w = sensor_data.get('Temperator_Winding_Motor_Phase_W', 0)
 
+        status_winding = {}
         for phase, temp in [('U', temp_u), ('V', temp_v), ('W', temp_w)]:
             if temp < 105:
                 status_temp_phase = "ปกติ"
@@ -185,6 +188,7 @@ class BreakdownMaintenanceAdviceTool:
             else:
                 status_temp_phase = "เสียหาย"
                 alerts.append(f"TempWindingMotorPhase_{phase}: มีสถานะเป็น{status_temp_phase} มีค่า {temp}°C คือ มีความเสี่ยงที่เครื่องหยุดทำงานโดยสมบูรณ์")
+            status_winding[phase] = status_temp_phase
 
         # Vibration (mm/s)
         vibration = sensor_data.get('Vibration')
@@ -202,9 +206,7 @@ class BreakdownMaintenanceAdviceTool:
         else:
             vib_status = "No information"
 
-        return {
-            "alerts": alerts,
-            "status_summary": {
+        status_summary = {
                 "Power_Moto": status_power,
                 "Current_Motor": status_current,
                 "Temperator_Brass_bearing_DE": status_brass_de,
@@ -214,9 +216,17 @@ class BreakdownMaintenanceAdviceTool:
                 "Speed_Motor": status_speed,
                 "Speed_Roller": status_speed_roller,    
                 "Temperator_Oil_Gear": status_oil,
-                "Temperator_Winding_Motor_Phase_U": status_temp_phase,
-                "Temperator_Winding_Motor_Phase_V": status_temp_phase,    
-                "Temperator_Winding_Motor_Phase_W": status_temp_phase,        
-                "Vibration": vib_status,    
-          }
+                "Temperator_Winding_Motor_Phase_U": status_winding['U'],
+                "Temperator_Winding_Motor_Phase_V": status_winding['V'],
+                "Temperator_Winding_Motor_Phase_W": status_winding['W'],
+                "Vibration": vib_status,
+        }
+
+        return {
+            "alerts": alerts,
+            "status_summary": status_summary,
+            # Structured alert codes (sensor -> status band) for dedupe; unlike the alert text
+            # they do not change with every small change in the sensor values
+            "alert_codes": {sensor: status for sensor, status in status_summary.items()
+                            if status not in BreakdownMaintenanceAdviceTool.NORMAL_STATUSES}
         }
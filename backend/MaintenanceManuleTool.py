@@ -1,18 +1,94 @@
-from retrivals import load_embeddings_from_file, search_query_in_embeddings
+from retrivals import load_embeddings_from_file, search_manual
 from fastapi import FastAPI, HTTPException, UploadFile, File
-import boto3
+from llm_gateway import get_llm_gateway
+from chunker import chunk_text
+from uploads import generate_embeddings
+from prompt_builder import build_repair_prompt, record_usage, select_snippets
+import json
 import os
+import threading
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# AWS Bedrock client
-bedrock_runtime = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2',
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-)
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MANUAL_SOURCE = "manuls.txt"
+
+# retrieval = return ranked manual snippets, the orchestrating model writes the answer (one LLM generation)
+# generate  = retrieve + Qwen writes the advice inside the tool (two sequential generations per turn)
+MANUAL_TOOL_MODE = os.getenv("MANUAL_TOOL_MODE", "retrieval")
+
+REPAIR_QUESTIONS_NUMBERED = """กรุณาตอบคำถามเกี่ยวกับการซ่อมบำรุงอย่างละเอียด รวมถึง:
+1. ขั้นตอนการซ่อม
+2. อุปกรณ์ที่ต้องใช้
+3. ข้อควรระวัง
+4. เวลาที่ใช้โดยประมาณ"""
+
+
+MANUAL_CHUNKS_PATH = os.getenv("MANUAL_CHUNKS_PATH", os.path.join(BACKEND_DIR, "data", "manual_chunks.json"))
+MANUAL_EMBED_RETRY_S = float(os.getenv("MANUAL_EMBED_RETRY_S", "60"))
+
+_manual_cache = {}
+_manual_lock = threading.Lock()
+_manual_fallback = {"retry_at": 0.0, "manual": None}
+
+
+def _chunk_embeddings(chunks):
+    """Embeddings of the manual chunks: reused from MANUAL_CHUNKS_PATH while the chunks are unchanged, else Titan"""
+    path = MANUAL_CHUNKS_PATH
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("texts") == chunks:
+            return data["embeddings"]
+    embeddings = generate_embeddings(chunks)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"metadata": {"source_file": MANUAL_SOURCE, "created_at": datetime.now().isoformat(),
+                                "num_texts": len(chunks)},
+                   "texts": chunks, "embeddings": embeddings}, f, ensure_ascii=False)
+    return embeddings
+
+
+def load_manual():
+    """
+    (embeddings, texts) of the manual, split by chunker.chunk_text
+
+    Cached until manuls.txt changes. When chunk embeddings cannot be produced (no Bedrock), falls
+    back to the line-split manual with the precomputed embeddings.json and tries the chunks again
+    after MANUAL_EMBED_RETRY_S.
+    """
+    manual_path = os.path.join(BACKEND_DIR, MANUAL_SOURCE)
+    key = os.path.getmtime(manual_path)
+    cached = _manual_cache.get(key)
+    if cached is not None:
+        return cached
+    with _manual_lock:
+        cached = _manual_cache.get(key)
+        if cached is not None:
+            return cached
+        if _manual_fallback["manual"] is not None and time.monotonic() < _manual_fallback["retry_at"]:
+            return _manual_fallback["manual"]
+        with open(manual_path, "r", encoding="utf-8") as file:
+            text = file.read()
+        chunks = chunk_text(text)
+        try:
+            manual = (_chunk_embeddings(chunks), chunks)
+        except Exception as e:
+            print(f"⚠️ Manual chunk embeddings unavailable, using line embeddings: {str(e)}")
+            embeddings = load_embeddings_from_file(os.path.join(BACKEND_DIR, "embeddings.json"))
+            _manual_fallback["manual"] = (embeddings, [line for line in text.split("\n") if line.strip()])
+            _manual_fallback["retry_at"] = time.monotonic() + MANUAL_EMBED_RETRY_S
+            return _manual_fallback["manual"]
+        _manual_cache.clear()
+        _manual_cache[key] = manual
+        return manual
+
+
+# AWS Bedrock client (shared connection pool, identical in-flight calls coalesced)
+bedrock_runtime = get_llm_gateway('us-west-2')
 
 class MaintenanceManuleTool:
 
@@ -38,21 +114,78 @@ class MaintenanceManuleTool:
         }
 
     @staticmethod
-    def maintenance_manules(input_data):
-        try:
-            # Load embeddings from file
-            embeddings_file_path = "embeddings.json"
-            embeddings = load_embeddings_from_file(embeddings_file_path)
+    def get_retrieval_tool_spec():
+        """Same tool name, retrieval-only contract: returns manual excerpts, not a written answer"""
+        return {
+            "toolSpec": {
+                "name": "Maintenance_Manule_Tool",
+                "description": "Searches the Feed Mill maintenance manual and returns the most relevant excerpts ranked by relevance (text, source, score). score is a 0-1 relevance that is only comparable within one response; retriever says how it was computed (vector = cosine similarity, lexical = keyword BM25 relative to the best match, hybrid = both combined). Use the excerpts to write repair steps, required tools, safety precautions and estimated time; do not add steps that are not in the excerpts.",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            "query_text": {
+                                "type": "string",
+                                "description": "What to look up in the manual, e.g. the symptom or the part to repair."
+                            },
+                            "top_k": {
+                                "type": "integer",
+                                "description": "Number of excerpts to return (default 4)."
+                            }
+                        },
+                        "required": ["query_text"]
+                    }
+                }
+            }
+        }
+
+    @staticmethod
+    def retrieve_manuals(input_data):
+        """
+        Retrieval-only variant: ranked manual snippets, no LLM generation
+
+        Args:
+            input_data: {"query_text": str, "top_k": int (optional)}
+
+        Returns:
+            dict: {"query", "retriever", "snippets": [{"rank", "text", "source", "score"}]}
+        """
+        query_text = input_data.get('query_text', "")
+        if not query_text:
+            raise HTTPException(status_code=400, detail="query_text is required")
+        top_k = max(1, min(int(input_data.get('top_k') or 4), 10))
+
+        embeddings, texts = load_manual()
+        results = search_manual(query_text, embeddings, texts, top_k=top_k)
+        # Same de-duplication and token budget as the RAG prompts
+        results = select_snippets(results)
 
-            # Open and read the manual file
-            with open("manuls.txt", "r", encoding="utf-8") as file:
-                text_fitz = file.read()
+        return {
+            "query": query_text,
+            "retriever": results[0]["retriever"] if results else None,
+            "snippets": [
+                {
+                    "rank": rank,
+                    "text": result["text"],
+                    "source": f"{MANUAL_SOURCE} chunk {result['index'] + 1}",
+                    "score": round(float(result["similarity"]), 4)
+                }
+                for rank, result in enumerate(results, 1)
+            ]
+        }
 
-            # Split the text by new lines (or paragraphs)
-            texts_strip = text_fitz.split("\n")
+    @staticmethod
+    def get_active_tool(mode=None):
+        """(toolSpec, handler) for MANUAL_TOOL_MODE, or for an explicit mode"""
+        if (mode or MANUAL_TOOL_MODE) == "generate":
+            return MaintenanceManuleTool.get_tool_spec(), MaintenanceManuleTool.maintenance_manules
+        return MaintenanceManuleTool.get_retrieval_tool_spec(), MaintenanceManuleTool.retrieve_manuals
 
-            # Filter out empty lines
-            texts = [text for text in texts_strip if text.strip()]
+    @staticmethod
+    def maintenance_manules(input_data):
+        try:
+            # Manual chunks + embeddings (cached)
+            embeddings, texts = load_manual()
 
             # Get query text from input data (message from the user)
             query_text = input_data.get('query_text', "")
@@ -60,20 +193,11 @@ class MaintenanceManuleTool:
             if not query_text:
                 raise HTTPException(status_code=400, detail="query_text is required")
 
-            # Search the query text in the embeddings and retrieve results
-            results = search_query_in_embeddings(query_text, embeddings, texts)
-
-            # Construct the prompt for the model
-            prompt = f"""คุณเป็นผู้เชี่ยวชาญด้านการซ่อมบำรุงเครื่องจักรโรงงานน้ำตาล โดยเฉพาะระบบ Feed Mill
+            # Search the manual (BM25 / embeddings per RETRIEVAL_MODE) and retrieve results
+            results = search_manual(query_text, embeddings, texts)
 
-คำถาม: {query_text}
-โดยใช้เนื้อหาจาก: {results}
-
-กรุณาตอบคำถามเกี่ยวกับการซ่อมบำรุงอย่างละเอียด รวมถึง:
-1. ขั้นตอนการซ่อม
-2. อุปกรณ์ที่ต้องใช้
-3. ข้อควรระวัง
-4. เวลาที่ใช้โดยประมาณ"""
+            # Construct the prompt for the model (compact, de-duplicated, token-budgeted context)
+            prompt = build_repair_prompt(query_text, results, instructions=REPAIR_QUESTIONS_NUMBERED)
 
             # Send the request to the model via Bedrock API
             response_body = bedrock_runtime.converse(
@@ -81,20 +205,23 @@ class MaintenanceManuleTool:
                 messages=[
                     {
                         "role": "user",
-                        "content": [{"text": prompt}]
+                        "content": [{"text": prompt.text}]
                     }
                 ],
                 inferenceConfig={
                     "maxTokens": 1024
                 }
             )
+            record_usage(prompt, response_body, model="qwen.qwen3-32b-v1:0")
             # Get the manual content from the response
             manual_content = response_body['output']['message']['content'][0]['text']
 
             return {
                 "manual_content": manual_content,
                 "query": query_text,
-                "results_from_embeddings": results
+                "results_from_embeddings": [
+                    {"text": r["text"], "similarity": round(float(r["similarity"]), 4)} for r in results
+                ]
             }
 
         except Exception as e:
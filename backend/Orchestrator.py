@@ -1,8 +1,9 @@
-import boto3
 import os
 from dotenv import load_dotenv
-from typing import Dict
+from typing import Dict, List, Optional
 from configs import SupportedModels
+from AgentExecutor import AgentExecutor, AgentResult, executor_settings
+from llm_gateway import get_llm_gateway
 from BreakdownMaintenanceAdviceTool import BreakdownMaintenanceAdviceTool
 from BreakdownPredictionTool import BreakdownPredictionTool
 from MaintenanceManuleTool import MaintenanceManuleTool
@@ -15,92 +16,48 @@ SYSTEM_PROMPT = """
 You are an assistant that provides maintenance advice and breakdown predictions using only the Maintenance_Manule_Tool, and Breakdown_Prediction_Tool.
 - Always call Maintenance_Manule_Tool to provide maintenance advice based on sensor data.
 - Always call Breakdown_Prediction_Tool to predict the likelihood of breakdowns based on sensor readings and machine data.
+- When both tools are needed, request them in the same turn; they run in parallel.
 - Never generate or guess results on your own; always rely on the respective tools.
 - Provide accurate and precise results based on the tool outputs.
 - Never hallucinate data.
 - Always respond in Thai language (ภาษาไทย).
 """
 
+# Added when Maintenance_Manule_Tool is retrieval-only (MANUAL_TOOL_MODE=retrieval)
+RETRIEVAL_PROMPT = """
+- Maintenance_Manule_Tool returns manual excerpts, not a finished answer. Write the repair steps, required tools, safety precautions and estimated time from those excerpts only, and mention the source of each step.
+"""
+
 class Orchestrator:
-    def __init__(self):
-        self.system_prompt = [{"text": SYSTEM_PROMPT}]
+    def __init__(self, manual_tool_mode=None):
+        """
+        Args:
+            manual_tool_mode: "retrieval" or "generate"; defaults to MANUAL_TOOL_MODE
+        """
+        manual_tool_spec, manual_tool = MaintenanceManuleTool.get_active_tool(manual_tool_mode)
+        retrieval_only = manual_tool is MaintenanceManuleTool.retrieve_manuals
+        self.system_prompt = [{"text": SYSTEM_PROMPT + (RETRIEVAL_PROMPT if retrieval_only else "")}]
         self.tool_config = {
             "tools": [
                 BreakdownPredictionTool.get_tool_spec(),
-                MaintenanceManuleTool.get_tool_spec()
+                manual_tool_spec
             ]
         }
-        self.bedrockRuntimeClient = boto3.client(
-            "bedrock-runtime",
-            region_name=AWS_REGION,
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+        # Shared, thread-safe client (connection pool reused across requests)
+        self.bedrockRuntimeClient = get_llm_gateway(AWS_REGION)
+        # Tool calls of one model turn run concurrently; loop bounded by steps and deadline
+        self.executor = AgentExecutor(
+            client=self.bedrockRuntimeClient,
+            model_id=MODEL_ID,
+            system_prompt=self.system_prompt,
+            tools={
+                "Breakdown_Prediction_Tool": BreakdownPredictionTool.analyze_sensors,
+                "Maintenance_Manule_Tool": manual_tool,
+            },
+            tool_specs=self.tool_config["tools"],
+            **executor_settings()
         )
 
-    def run(self):
-        conversation = []
-
-        user_input = self._get_user_input()
-        while user_input is not None:
-            message = {"role": "user", "content": [{"text": user_input}]}
-            conversation.append(message)
-            bedrock_response = self._send_conversation_to_bedrock(conversation)
-            self._process_model_response(bedrock_response, conversation)
-            user_input = self._get_user_input()
-
-    def _send_conversation_to_bedrock(self, conversation):
-        return self.bedrockRuntimeClient.converse(
-            modelId=MODEL_ID,
-            messages=conversation,
-            system=self.system_prompt,
-            toolConfig=self.tool_config,
-        )
-
-    def _process_model_response(self, model_response, conversation):
-        message = model_response["output"]["message"]
-        conversation.append(message)
-
-        if model_response["stopReason"] == "tool_use":
-            self._handle_tool_use(message, conversation)
-        elif model_response["stopReason"] == "end_turn":
-            print("Model response: ", message["content"][0]["text"])
-
-    def _handle_tool_use(self, model_response, conversation):
-        tool_results = []
-        for content_block in model_response["content"]:
-            if "text" in content_block:
-                print(content_block["text"])  # Output model response
-
-            if "toolUse" in content_block:
-                tool_response = self._invoke_tool(content_block["toolUse"])
-                tool_results.append({
-                    "toolResult": {
-                        "toolUseId": tool_response["toolUseId"],
-                        "content": [{"json": tool_response["content"]}],
-                    }
-                })
-
-        conversation.append({"role": "user", "content": tool_results})
-        response = self._send_conversation_to_bedrock(conversation)
-        self._process_model_response(response, conversation)
-
-    def _invoke_tool(self, payload):
-        tool_name = payload["name"]
-        if tool_name == "Breakdown_Prediction_Tool":
-            input_data = payload["input"]
-            response = BreakdownPredictionTool.analyze_sensors(input_data)
-        elif tool_name == "Maintenance_Manule_Tool":
-            input_data = payload.get("input", {})
-            response = MaintenanceManuleTool.maintenance_manules(input_data)
-        else:
-            response = {"error": True, "message": f"Tool {tool_name} not found"}
-        return {"toolUseId": payload["toolUseId"], "content": response}
-
-    @staticmethod
-    def _get_user_input():
-        # This should be replaced with actual input handling (e.g., from a UI or a form)
-        return "Sample user input"  # Placeholder for testing
-
     def run(self, user_input=None):
         """
         Run orchestrator with user input
@@ -108,70 +65,39 @@ class Orchestrator:
         Args:
             user_input: Optional user input from UI/API. If None, uses _get_user_input()
         """
-        conversation = []
+        return self.run_with_trace(user_input).text
 
-        user_input = self._get_user_input(user_input)
-
-
-        message = {"role": "user", "content": [{"text": user_input}]}
-        conversation.append(message)
-        bedrock_response = self._send_conversation_to_bedrock(conversation)
-        response_text = self._process_model_response(bedrock_response, conversation)
-
-        return response_text
+    def run_with_trace(self, user_input=None, history: Optional[List[Dict]] = None) -> AgentResult:
+        """
+        Same as run(), but returns the AgentResult (answer, stop reason, per-step timings)
 
+        Args:
+            user_input: user message
+            history: earlier converse messages of the chat session (not modified)
+        """
+        conversation = list(history or [])
 
-    def _send_conversation_to_bedrock(self, conversation):
-        return self.bedrockRuntimeClient.converse(
-            modelId=MODEL_ID,
-            messages=conversation,
-            system=self.system_prompt,
-            toolConfig=self.tool_config,
-        )
+        user_input = self._get_user_input(user_input)
 
-    def _process_model_response(self, model_response, conversation):
-        message = model_response["output"]["message"]
+        message = {"role": "user", "content": [{"text": user_input}]}
         conversation.append(message)
+        result = self.executor.run(conversation)
+        print("Model response: ", result.text)
+        return result
 
-        if model_response["stopReason"] == "tool_use":
-            return self._handle_tool_use(message, conversation)
-        elif model_response["stopReason"] == "end_turn":
-            response_text = message["content"][0]["text"]
-            print("Model response: ", response_text)
-            return response_text
-
-    def _handle_tool_use(self, model_response, conversation):
-        tool_results = []
-        for content_block in model_response["content"]:
-            if "text" in content_block:
-                print(content_block["text"])  # Output model response
+    @staticmethod
+    def _get_user_input(user_input):
+        # This should be replaced with actual input handling (e.g., from a UI or a form)
+        return user_input if user_input else "Sample user input"
 
-            if "toolUse" in content_block:
-                tool_response = self._invoke_tool(content_block["toolUse"])
-                tool_results.append({
-                    "toolResult": {
-                        "toolUseId": tool_response["toolUseId"],
-                        "content": [{"json": tool_response["content"]}],
-                    }
-                })
 
-        conversation.append({"role": "user", "content": tool_results})
-        response = self._send_conversation_to_bedrock(conversation)
-        return self._process_model_response(response, conversation)
+# Singleton: the orchestrator holds no per-chat state, sessions pass their history in
+_orchestrator = None
 
-    def _invoke_tool(self, payload):
-        tool_name = payload["name"]
-        if tool_name == "Breakdown_Prediction_Tool":
-            input_data = payload["input"]
-            response = BreakdownPredictionTool.analyze_sensors(input_data)
-        elif tool_name == "Maintenance_Manule_Tool":
-            input_data = payload.get("input", {})
-            response = MaintenanceManuleTool.maintenance_manules(input_data)
-        else:
-            response = {"error": True, "message": f"Tool {tool_name} not found"}
-        return {"toolUseId": payload["toolUseId"], "content": response}
 
-    @staticmethod
-    def _get_user_input(user_input):
-        # This should be replaced with actual input handling (e.g., from a UI or a form)
-        return user_input if user_input else "Sample user input"
\ No newline at end of file
+def get_orchestrator() -> Orchestrator:
+    """Get orchestrator singleton"""
+    global _orchestrator
+    if _orchestrator is None:
+        _orchestrator = Orchestrator()
+    return _orchestrator
@@ -0,0 +1,138 @@
+"""
+Alert de-duplication / suppression
+
+Keyed on structured alert codes (sensor -> severity band from analyze_sensors), not on the
+formatted alert text, so a reading that moves from 86.1°C to 86.4°C inside the same band does
+not trigger a new LLM call and LINE push.
+
+Per machine:
+- first alert (or first after recovery / expiry)   -> send ("new")
+- any sensor in a higher band, or a new sensor     -> send immediately ("escalation")
+- same or lower bands within the cooldown window   -> suppress
+- still alerting after the cooldown window         -> send a reminder ("reminder")
+- all sensors back to normal                       -> state cleared ("recovered")
+
+State is an LRU bounded to max_machines; entries not seen for ttl seconds expire.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+# analyze_sensors status bands -> severity rank
+SEVERITY_RANK = {
+    "ปกติ": 0, "Very Good": 0, "Good": 0, "No information": 0,
+    "ผิดปกติ": 1, "Satisfactory": 1,
+    "เสี่ยง": 2,
+    "เสียหาย": 3, "Unsatisfactory": 3,
+}
+
+
+def severity_codes(alert_codes: Dict[str, str]) -> Dict[str, int]:
+    """{sensor: status band} -> {sensor: severity rank} for the sensors that are not normal"""
+    ranks = {sensor: SEVERITY_RANK.get(status, 1) for sensor, status in alert_codes.items()}
+    return {sensor: rank for sensor, rank in ranks.items() if rank > 0}
+
+
+@dataclass
+class AlertDecision:
+    send: bool
+    reason: str  # new | escalation | reminder | suppressed | recovered | no_alert
+    escalated: List[str] = field(default_factory=list)
+    max_severity: int = 0
+
+
+@dataclass
+class _MachineState:
+    sent_codes: Dict[str, int]
+    last_sent: float
+    last_seen: float
+
+
+class AlertDeduper:
+    """
+    Args:
+        cooldown_s: minimum seconds between notifications for an unchanged/de-escalated alert
+        ttl_s: forget a machine not seen for this long
+        max_machines: bound on tracked machines (least recently seen evicted first)
+        clock: time source (seconds), injectable for tests
+    """
+
+    def __init__(self, cooldown_s: float = 1800, ttl_s: float = 86400, max_machines: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.cooldown_s = cooldown_s
+        self.ttl_s = ttl_s
+        self.max_machines = max_machines
+        self.clock = clock
+        self._state: "OrderedDict[str, _MachineState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"new": 0, "escalation": 0, "reminder": 0, "suppressed": 0, "recovered": 0,
+                         "expired": 0, "evicted": 0}
+
+    def _expire(self, now: float):
+        # OrderedDict is kept in last-seen order, so expired entries are at the front
+        while self._state:
+            machine_id, state = next(iter(self._state.items()))
+            if now - state.last_seen < self.ttl_s:
+                break
+            del self._state[machine_id]
+            self.counters["expired"] += 1
+
+    def evaluate(self, machine_id: str, alert_codes: Dict[str, str]) -> AlertDecision:
+        """
+        Decide whether the current alerts of a machine should be notified; a "send" decision is
+        recorded immediately so concurrent requests do not notify twice
+
+        Args:
+            machine_id: machine identifier
+            alert_codes: {sensor: status band} from analyze_sensors()["alert_codes"]
+        """
+        codes = severity_codes(alert_codes)
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            state = self._state.get(machine_id)
+
+            if not codes:
+                if state is not None:
+                    del self._state[machine_id]
+                    self.counters["recovered"] += 1
+                    return AlertDecision(False, "recovered")
+                return AlertDecision(False, "no_alert")
+
+            max_severity = max(codes.values())
+            if state is None:
+                reason, escalated = "new", sorted(codes)
+            else:
+                escalated = sorted(s for s, rank in codes.items() if rank > state.sent_codes.get(s, 0))
+                if escalated:
+                    reason = "escalation"
+                elif now - state.last_sent >= self.cooldown_s:
+                    reason = "reminder"
+                else:
+                    state.last_seen = now
+                    self._state.move_to_end(machine_id)
+                    self.counters["suppressed"] += 1
+                    return AlertDecision(False, "suppressed", max_severity=max_severity)
+
+            self._state[machine_id] = _MachineState(sent_codes=codes, last_sent=now, last_seen=now)
+            self._state.move_to_end(machine_id)
+            while len(self._state) > self.max_machines:
+                self._state.popitem(last=False)
+                self.counters["evicted"] += 1
+            self.counters[reason] += 1
+            return AlertDecision(True, reason, escalated, max_severity)
+
+    def forget(self, machine_id: str):
+        """Drop a machine's state (e.g. its notification could not be delivered) so the next alert is sent"""
+        with self._lock:
+            self._state.pop(machine_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._state.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"tracked_machines": len(self._state), "cooldown_s": self.cooldown_s, **self.counters}
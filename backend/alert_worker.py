@@ -0,0 +1,176 @@
+"""
+Background alert pipeline
+
+GET /api/machine-data only detects alerts and enqueues an AlertEvent; a pool of asyncio workers
+does repair-advice generation (RAG + LLM) and LINE fan-out off the request path.
+Whether an alert should be notified at all is decided upstream (alert_dedupe.AlertDeduper).
+
+- Bounded queue: when it is full new events are rejected (backpressure) instead of piling up
+- The same (machine, alert set) is never queued twice while it is pending / in flight
+- Advice / delivery are blocking (boto3, requests) and run in threads so the event loop stays free
+- Failed deliveries are retried with exponential backoff; every attempt passes the event's
+  delivery_id to deliver_fn, so LINE batches keep their retry key and are not sent twice
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from observability import span
+
+
+def alert_hash(alerts: List[str]) -> str:
+    """Identity of an alert set (order-independent)"""
+    return hashlib.md5("|".join(sorted(alerts)).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class AlertEvent:
+    machine_id: str
+    alerts: List[str]
+    sensor_readings: Dict[str, float]
+    risk_score: int
+    risk_level: str
+    timestamp: str
+    alert_hash: str = ""
+    attempts: int = 0
+    delivery_id: str = field(default_factory=lambda: uuid.uuid4().hex)  # same on every delivery retry
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.alert_hash = self.alert_hash or alert_hash(self.alerts)
+
+
+class AlertWorker:
+    """
+    Args:
+        advice_fn: AlertEvent -> repair advice text (blocking, runs in a thread)
+        deliver_fn: (AlertEvent, advice) -> number of users reached (blocking, runs in a thread);
+            raise to trigger a retry; use event.delivery_id to make retries idempotent
+        on_delivered: called with (AlertEvent, users reached) after a successful delivery
+        on_failure: called with the AlertEvent when delivery is given up
+        queue_size: max pending events before enqueue() rejects
+        workers: concurrent events in flight
+        max_retries: delivery retries after the first attempt
+        retry_backoff: seconds before the first retry, doubled each time
+    """
+
+    def __init__(self, advice_fn: Callable[[AlertEvent], str], deliver_fn: Callable[[AlertEvent, str], int],
+                 queue_size: int = 100, workers: int = 4, max_retries: int = 3, retry_backoff: float = 1.0,
+                 on_delivered: Optional[Callable[[AlertEvent, int], None]] = None,
+                 on_failure: Optional[Callable[[AlertEvent], None]] = None):
+        self.advice_fn = advice_fn
+        self.deliver_fn = deliver_fn
+        self.queue_size = queue_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_delivered = on_delivered
+        self.on_failure = on_failure
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending = set()  # (machine_id, alert_hash) queued or in flight
+        self.counters = {"enqueued": 0, "duplicate": 0, "rejected": 0, "delivered": 0,
+                         "retried": 0, "failed": 0}
+
+    # =========================
+    # Producer side (request path, non-blocking)
+    # =========================
+    def is_duplicate(self, machine_id: str, hash_: str) -> bool:
+        return (machine_id, hash_) in self._pending
+
+    def enqueue(self, event: AlertEvent) -> str:
+        """
+        Queue an alert event without waiting
+
+        Returns:
+            "queued", "duplicate", "queue_full" or "not_running"
+        """
+        if self.queue is None:
+            return "not_running"
+        key = (event.machine_id, event.alert_hash)
+        if self.is_duplicate(*key):
+            self.counters["duplicate"] += 1
+            return "duplicate"
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            print(f"⚠️ Alert queue full ({self.queue_size}), dropping alert for {event.machine_id}")
+            return "queue_full"
+        self._pending.add(key)
+        self.counters["enqueued"] += 1
+        return "queued"
+
+    # =========================
+    # Consumer side
+    # =========================
+    async def _process(self, event: AlertEvent):
+        advice = await asyncio.to_thread(self.advice_fn, event)
+        while True:
+            event.attempts += 1
+            try:
+                with span("alert_delivery", machine=event.machine_id):
+                    sent = await asyncio.to_thread(self.deliver_fn, event, advice)
+                break
+            except Exception as e:
+                if event.attempts > self.max_retries:
+                    self.counters["failed"] += 1
+                    print(f"❌ Alert for {event.machine_id} failed after {event.attempts} attempts: {str(e)}")
+                    if self.on_failure:
+                        self.on_failure(event)
+                    return
+                self.counters["retried"] += 1
+                delay = self.retry_backoff * 2 ** (event.attempts - 1)
+                print(f"⚠️ Alert delivery failed for {event.machine_id} ({str(e)}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        if self.on_delivered:
+            await asyncio.to_thread(self.on_delivered, event, sent)
+        self.counters["delivered"] += 1
+        print(f"📤 Alert for {event.machine_id} sent to {sent} LINE users "
+              f"({(time.monotonic() - event.enqueued_at) * 1000:.0f} ms after detection)")
+
+    async def _run(self):
+        while True:
+            event = await self.queue.get()
+            try:
+                await self._process(event)
+            except Exception as e:
+                self.counters["failed"] += 1
+                print(f"⚠️ Alert pipeline error for {event.machine_id}: {str(e)}")
+                if self.on_failure:
+                    self.on_failure(event)
+            finally:
+                self._pending.discard((event.machine_id, event.alert_hash))
+                self.queue.task_done()
+
+    def start(self):
+        """Create the queue and worker tasks on the running event loop"""
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.get_running_loop().create_task(self._run()) for _ in range(self.workers)]
+        print(f"✓ Alert worker started ({self.workers} workers, queue {self.queue_size})")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Finish queued alerts (up to drain_timeout seconds), then cancel the workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Alert worker stopped with {self.queue.qsize()} alerts still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.queue = None
+
+    def stats(self) -> Dict:
+        return {"running": bool(self._tasks), "workers": self.workers,
+                "queue_depth": self.queue.qsize() if self.queue else 0, "queue_size": self.queue_size,
+                "in_flight": len(self._pending), **self.counters}
@@ -0,0 +1,45 @@
+"""
+Shared AWS Bedrock runtime client
+
+boto3 clients are thread-safe; one client per region with a connection pool sized for the
+API's concurrency replaces a new client (new TLS connections) per request / per module.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_REGION = "us-west-2"
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_bedrock_runtime(region_name: str = DEFAULT_REGION):
+    """Get the bedrock-runtime client singleton for a region"""
+    client = _clients.get(region_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(region_name)
+            if client is None:
+                client = boto3.client(
+                    "bedrock-runtime",
+                    region_name=region_name,
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    config=Config(
+                        max_pool_connections=int(os.getenv("BEDROCK_MAX_CONNECTIONS", "50")),
+                        # Bounds calls abandoned by the resilience layer's deadline (botocore default 60s)
+                        connect_timeout=float(os.getenv("BEDROCK_CONNECT_TIMEOUT_S", "5")),
+                        read_timeout=float(os.getenv("BEDROCK_READ_TIMEOUT_S", "60")),
+                        # Rate limits are enforced before the call (llm_scheduler) and failed calls are
+                        # hedged (llm_resilience): no botocore retries on top, throttling included
+                        retries={"mode": "standard", "total_max_attempts": int(os.getenv("BEDROCK_MAX_ATTEMPTS", "1"))}
+                    )
+                )
+                _clients[region_name] = client
+    return client
@@ -0,0 +1,108 @@
+"""
+Chat agent latency benchmark: Maintenance_Manule_Tool in "generate" vs "retrieval" mode
+
+generate  - the tool retrieves manual lines and has Qwen write advice; the orchestrator model
+            then writes its answer from that prose (two sequential generations per turn)
+retrieval - the tool returns ranked manual snippets; the orchestrator model writes the only answer
+
+Bedrock is replaced by the local stub with per-model injected latency, so the difference comes
+from the call structure only.
+
+Usage:
+    cd backend
+    python benchmarks/agent_latency.py --turns 20 --haiku-ms 900 --qwen-ms 2500 --embed-ms 40
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import Latency, StubBedrockRuntime
+from load_test import MANUAL_QUESTIONS, latency_stats
+
+MODES = ["generate", "retrieval"]
+
+
+def run_mode(mode: str, bedrock: StubBedrockRuntime, turns: int) -> Dict:
+    import retrivals
+    import MaintenanceManuleTool as manual_module
+    from Orchestrator import Orchestrator
+
+    retrivals.bedrock = bedrock
+    manual_module.bedrock_runtime = bedrock
+    orchestrator = Orchestrator(manual_tool_mode=mode)
+    orchestrator.executor.client = bedrock
+
+    calls_before = dict(bedrock.calls)
+    latencies, model_calls, input_tokens, tool_ms = [], [], [], []
+    for i in range(turns):
+        t0 = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = orchestrator.run_with_trace(MANUAL_QUESTIONS[i % len(MANUAL_QUESTIONS)])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        model_steps = [s for s in result.steps if s.type == "model"]
+        model_calls.append(len(model_steps))
+        input_tokens.append(sum(s.input_tokens or 0 for s in model_steps))
+        tool_ms.append(max((s.duration_ms for s in result.steps if s.type == "tool"), default=0.0))
+
+    return {"mode": mode, "turns": turns, "latency": latency_stats(latencies),
+            "tool_stage_ms": statistics.mean(tool_ms),
+            "orchestrator_calls_per_turn": statistics.mean(model_calls),
+            "orchestrator_input_tokens_per_turn": statistics.mean(input_tokens),
+            "upstream_calls": {k: v - calls_before.get(k, 0) for k, v in bedrock.calls.items()}}
+
+
+def to_markdown(report: Dict) -> str:
+    cfg = report["config"]
+    lines = [f"# Chat agent latency ({report['timestamp']})", "",
+             f"{cfg['turns']} turns per mode; injected latency: Haiku {cfg['haiku_ms']} ms, Qwen {cfg['qwen_ms']} ms, "
+             f"embeddings {cfg['embed_ms']} ms (±{cfg['jitter']:.0%})", "",
+             "| mode | p50 (ms) | p90 (ms) | mean (ms) | tool stage (ms) | converse calls | orchestrator input tokens/turn |",
+             "|---|---|---|---|---|---|---|"]
+    for r in report["modes"]:
+        s = r["latency"]
+        lines.append(f"| {r['mode']} | {s['p50_ms']:.0f} | {s['p90_ms']:.0f} | {s['mean_ms']:.0f} | "
+                     f"{r['tool_stage_ms']:.0f} | {r['upstream_calls'].get('converse', 0)} | "
+                     f"{r['orchestrator_input_tokens_per_turn']:.0f} |")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare manual tool modes in the chat agent")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--haiku-ms", type=float, default=900.0, help="orchestrator model latency per call")
+    parser.add_argument("--qwen-ms", type=float, default=2500.0, help="Qwen generation latency inside the tool")
+    parser.add_argument("--embed-ms", type=float, default=40.0, help="Titan query embedding latency")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out-dir", default="agent_latency_results")
+    args = parser.parse_args()
+
+    bedrock = StubBedrockRuntime(embed_latency=Latency(args.embed_ms, args.jitter, args.seed),
+                                 model_latency={"claude": Latency(args.haiku_ms, args.jitter, args.seed + 1),
+                                                "qwen": Latency(args.qwen_ms, args.jitter, args.seed + 2)})
+    results = []
+    for mode in args.modes:
+        print(f"▶ {mode}: {args.turns} turns", file=sys.stderr)
+        results.append(run_mode(mode, bedrock, args.turns))
+        print(f"  p50 {results[-1]['latency']['p50_ms']:.0f} ms", file=sys.stderr)
+
+    report = {"timestamp": datetime.now().isoformat(timespec="seconds"), "config": vars(args), "modes": results}
+    os.makedirs(args.out_dir, exist_ok=True)
+    with open(os.path.join(args.out_dir, "agent_latency_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    markdown = to_markdown(report)
+    with open(os.path.join(args.out_dir, "agent_latency_report.md"), "w", encoding="utf-8") as f:
+        f.write(markdown)
+    print(markdown)
@@ -0,0 +1,110 @@
+"""
+Manual chunking benchmark: line split (one embedding per line) vs chunker.chunk_pages
+
+For the manual (manuls.txt, or --pdf) reports how many texts / estimated tokens go to the
+embedding model, and retrieval quality on the labelled queries in manual_queries.json: a query
+is answered when a retrieved text contains its expected phrase (hit@1, hit@3, MRR), plus the
+tokens of the top-k texts that would be put into the prompt.
+
+lexical (default) runs locally with BM25; vector / hybrid embed the texts and queries with Titan
+(real Bedrock, AWS credentials needed).
+
+Usage:
+    cd backend
+    python benchmarks/chunking_eval.py --max-tokens 64 128 256
+    python benchmarks/chunking_eval.py --mode hybrid --pdf manual.pdf
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from chunker import CHUNK_MIN_TOKENS, CHUNK_OVERLAP_TOKENS, chunk_pages, chunk_stats
+from retrivals import search_manual
+from tokens import estimate_tokens
+
+MODES = ["lexical", "vector", "hybrid"]
+
+
+def load_pages(pdf_path: str) -> List[str]:
+    if pdf_path:
+        from uploads import extract_pages_fitz
+        return extract_pages_fitz(pdf_path)
+    with open(os.path.join(BACKEND_DIR, "manuls.txt"), "r", encoding="utf-8") as f:
+        return [f.read()]
+
+
+def evaluate(texts: List[str], queries: List[Dict], mode: str, top_k: int) -> Dict:
+    embeddings = []
+    if mode != "lexical":
+        from uploads import generate_embeddings
+        embeddings = generate_embeddings(texts)
+    hits_1 = hits_3 = 0
+    reciprocal_ranks, context_tokens = [], []
+    for q in queries:
+        results = search_manual(q["query"], embeddings, texts, top_k=top_k, mode=mode)
+        rank = next((i + 1 for i, r in enumerate(results) if q["expected"] in r["text"]), None)
+        hits_1 += rank == 1
+        hits_3 += rank is not None and rank <= 3
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        context_tokens.append(sum(estimate_tokens(r["text"]) for r in results))
+    n = len(queries)
+    return {"hit_at_1": round(hits_1 / n, 3), "hit_at_3": round(hits_3 / n, 3),
+            "mrr": round(sum(reciprocal_ranks) / n, 3),
+            "context_tokens_at_k": round(sum(context_tokens) / n, 1)}
+
+
+def to_markdown(report: Dict) -> str:
+    cfg = report["config"]
+    lines = [f"# Manual chunking ({report['timestamp']})", "",
+             f"{report['source']}, {report['queries']} labelled queries, {cfg['mode']} retrieval, top_k={cfg['top_k']}", "",
+             "| split | texts | tokens embedded | hit@1 | hit@3 | MRR | context tokens@k |",
+             "|---|---|---|---|---|---|---|"]
+    for r in report["variants"]:
+        lines.append(f"| {r['split']} | {r['texts']} | {r['tokens']} | {r['hit_at_1']:.2f} | {r['hit_at_3']:.2f} | "
+                     f"{r['mrr']:.2f} | {r['context_tokens_at_k']:.0f} |")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Line split vs length-aware chunks for the manual")
+    parser.add_argument("--mode", default="lexical", choices=MODES)
+    parser.add_argument("--max-tokens", nargs="+", type=int, default=[128, 256])
+    parser.add_argument("--min-tokens", type=int, default=CHUNK_MIN_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--pdf", default="", help="PDF to chunk instead of manuls.txt")
+    parser.add_argument("--queries", default=os.path.join(BENCH_DIR, "manual_queries.json"))
+    parser.add_argument("--out-dir", default="chunking_results")
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    pages = load_pages(args.pdf)
+    lines = [line.strip() for page in pages for line in page.split("\n") if line.strip()]
+
+    variants = [{"split": "lines", "texts": len(lines), "tokens": sum(estimate_tokens(t) for t in lines),
+                 **evaluate(lines, queries, args.mode, args.top_k)}]
+    for max_tokens in args.max_tokens:
+        chunks = chunk_pages(pages, max_tokens=max_tokens, min_tokens=min(args.min_tokens, max_tokens),
+                             overlap_tokens=args.overlap_tokens)
+        stats = chunk_stats(lines, chunks)
+        variants.append({"split": f"chunks ≤{max_tokens}", "texts": stats["chunks"], "tokens": stats["chunk_tokens"],
+                         "reduction": stats["reduction"], **evaluate(chunks, queries, args.mode, args.top_k)})
+
+    report = {"timestamp": datetime.now().isoformat(timespec="seconds"), "config": vars(args),
+              "source": args.pdf or "manuls.txt", "queries": len(queries), "variants": variants}
+    os.makedirs(args.out_dir, exist_ok=True)
+    with open(os.path.join(args.out_dir, "chunking_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    markdown = to_markdown(report)
+    with open(os.path.join(args.out_dir, "chunking_report.md"), "w", encoding="utf-8") as f:
+        f.write(markdown)
+    print(markdown)
@@ -0,0 +1,330 @@
+"""
+API load test / latency benchmark
+
+Runs the FastAPI app in-process (httpx ASGITransport) with Bedrock and LINE replaced by
+local stubs with injected latency, drives concurrent workloads and reports per endpoint:
+throughput, p50/p90/p99/max latency, and event-loop lag (how long the loop was blocked).
+
+Each endpoint is measured alone (so loop blocking can be attributed to it), then as a
+weighted mix.
+
+Usage:
+    cd backend
+    python benchmarks/load_test.py --concurrency 16 --duration 20 --converse-ms 800 --embed-ms 40 --line-ms 120
+    python benchmarks/load_test.py --phases mixed --rate 20   # open loop, includes queueing delay
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import Latency, StubBedrockRuntime, StubLINEAPI, install_stubs
+from line_store import SQLiteLineStore
+
+ENDPOINTS = ["machine-data", "analyze-sensors", "predict-ml-breakdown", "repair-manual", "line-webhook"]
+DEFAULT_MIX = {"machine-data": 45, "analyze-sensors": 25, "predict-ml-breakdown": 20, "repair-manual": 5,
+               "line-webhook": 5}
+
+# Normal operating ranges (same as the prompts in main.py); abnormal readings land outside them
+NORMAL_RANGES = {
+    "PowerMotor": (292, 313), "CurrentMotor": (285, 315), "SpeedMotor": (1482, 1493), "SpeedRoller": (5.2, 5.8),
+    "TempBrassBearingDE": (55, 72), "TempBearingMotorNDE": (55, 80), "TempOilGear": (50, 62),
+    "TempWindingMotorPhase_U": (70, 100), "TempWindingMotorPhase_V": (70, 100),
+    "TempWindingMotorPhase_W": (70, 100), "Vibration": (0.8, 1.7),
+}
+ABNORMAL = {"PowerMotor": 328, "CurrentMotor": 345, "TempBrassBearingDE": 88, "TempOilGear": 72, "Vibration": 3.2}
+
+MANUAL_QUESTIONS = [
+    "Bearing ลูกหีบร้อนผิดปกติ ต้องตรวจสอบอะไรบ้าง",
+    "วิธีเปลี่ยนน้ำมันเกียร์ Feed Mill",
+    "มอเตอร์กินกระแสสูงเกิน 320A แก้ไขอย่างไร",
+    "ขั้นตอนการตรวจสอบ Coupling ชุดขับ Mill",
+]
+LINE_COMMANDS = ["สถานะ", "ช่วยเหลือ", "แจ้งเตือน", "แจ้งเตือน เปิด", "สวัสดี"]
+
+
+# =========================
+# Workload
+# =========================
+def random_readings(rng: random.Random, abnormal_rate: float) -> Dict[str, float]:
+    readings = {k: round(rng.uniform(lo, hi), 2) for k, (lo, hi) in NORMAL_RANGES.items()}
+    if rng.random() < abnormal_rate:
+        for sensor in rng.sample(list(ABNORMAL), k=rng.randint(1, 3)):
+            readings[sensor] = ABNORMAL[sensor] * rng.uniform(0.98, 1.05)
+    return readings
+
+
+def machine_dataframe(n_machines: int, rows_per_machine: int, abnormal_rate: float, seed: int = 42) -> pd.DataFrame:
+    """Uploaded-CSV equivalent for uploaded_data_store['dataframe']"""
+    rng = random.Random(seed)
+    start = datetime(2025, 10, 1)
+    rows = []
+    for m in range(n_machines):
+        for i in range(rows_per_machine):
+            rows.append({"Machine_ID": f"Feed Mill {m + 1}", "Timestamp": start + timedelta(minutes=i),
+                         **random_readings(rng, abnormal_rate)})
+    return pd.DataFrame(rows)
+
+
+def line_webhook_body(rng: random.Random, n_users: int) -> bytes:
+    """Signed-payload body of a LINE webhook call with 1-3 text message events"""
+    events = []
+    for _ in range(rng.randint(1, 3)):
+        events.append({"type": "message", "webhookEventId": "%032x" % rng.getrandbits(128),
+                       "replyToken": "%032x" % rng.getrandbits(128),
+                       "source": {"type": "user", "userId": f"U{rng.randrange(max(n_users, 1)):032d}"},
+                       "message": {"type": "text", "text": rng.choice(LINE_COMMANDS)}})
+    return json.dumps({"destination": "bench", "events": events}).encode("utf-8")
+
+
+def build_request(endpoint: str, rng: random.Random, machines: List[str], abnormal_rate: float,
+                  line_users: int = 5):
+    """(method, url, httpx request kwargs) for one request to endpoint"""
+    if endpoint == "machine-data":
+        return "GET", f"/api/machine-data/{rng.choice(machines)}", {}
+    if endpoint == "repair-manual":
+        return "POST", "/api/repair-manual", {"json": {"message": rng.choice(MANUAL_QUESTIONS)}}
+    if endpoint == "line-webhook":
+        import main
+        body = line_webhook_body(rng, line_users)
+        digest = hmac.new(main.get_line_notifier().channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+        return "POST", "/api/line/webhook", {"content": body, "headers": {
+            "Content-Type": "application/json", "X-Line-Signature": base64.b64encode(digest).decode("utf-8")}}
+    body = {"timestamp": datetime.now().isoformat(), "machine_type": rng.choice(machines),
+            "sensor_readings": random_readings(rng, abnormal_rate)}
+    if endpoint == "analyze-sensors":
+        return "POST", "/api/analyze-sensors", {"json": body}
+    return "POST", "/api/predict-ml-breakdown", {"json": body}
+
+
+# =========================
+# Event-loop lag probe
+# =========================
+class LoopLagProbe:
+    """Sleeps interval_s in a loop; any overshoot is time the event loop was blocked"""
+
+    def __init__(self, interval_s: float = 0.005):
+        self.interval_s = interval_s
+        self.lags_ms: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval_s)
+            self.lags_ms.append(max(0.0, (loop.time() - t0 - self.interval_s) * 1000))
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> Dict:
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        lags = np.array(self.lags_ms or [0.0])
+        return {"samples": len(self.lags_ms), "p50_ms": float(np.percentile(lags, 50)),
+                "p99_ms": float(np.percentile(lags, 99)), "max_ms": float(lags.max()),
+                "blocked_ms": float(lags.sum())}
+
+
+# =========================
+# Runner
+# =========================
+def latency_stats(latencies_ms: List[float]) -> Dict:
+    if not latencies_ms:
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None, "mean_ms": None}
+    a = np.array(latencies_ms)
+    return {"p50_ms": float(np.percentile(a, 50)), "p90_ms": float(np.percentile(a, 90)),
+            "p99_ms": float(np.percentile(a, 99)), "max_ms": float(a.max()), "mean_ms": float(a.mean())}
+
+
+async def run_phase(client, name: str, mix: Dict[str, float], concurrency: int, duration_s: float,
+                    machines: List[str], abnormal_rate: float, reset_dedupe: bool, seed: int,
+                    bedrock: StubBedrockRuntime, line_api: StubLINEAPI, rate: float = 0.0,
+                    line_users: int = 5) -> Dict:
+    """
+    Closed loop (rate=0): every worker sends its next request as soon as the previous one returns.
+    Open loop (rate>0): Poisson arrivals at `rate` req/s served by `concurrency` workers; latency is
+    measured from the scheduled arrival, so time spent queued behind a blocked loop is included.
+    """
+    import main
+
+    endpoints, weights = list(mix), list(mix.values())
+    records = []
+    calls_before = (dict(bedrock.calls), dict(line_api.calls))
+    probe = LoopLagProbe()
+    probe.start()
+    loop = asyncio.get_running_loop()
+    t_start = loop.time()
+    deadline = t_start + duration_s
+    arrivals = random.Random(seed)
+    next_arrival = [t_start]
+
+    async def worker(i: int):
+        rng = random.Random(seed * 1000 + i)
+        while loop.time() < deadline:
+            if rate:
+                scheduled = next_arrival[0]
+                if scheduled >= deadline:
+                    break
+                next_arrival[0] += arrivals.expovariate(rate)
+                await asyncio.sleep(max(0.0, scheduled - loop.time()))
+            endpoint = rng.choices(endpoints, weights)[0]
+            method, url, kwargs = build_request(endpoint, rng, machines, abnormal_rate, line_users)
+            if reset_dedupe and endpoint == "machine-data":
+                main.alert_deduper.clear()
+            t0 = time.perf_counter() - (max(0.0, loop.time() - scheduled) if rate else 0.0)
+            try:
+                status = (await client.request(method, url, **kwargs)).status_code
+            except Exception:
+                status = 0
+            records.append((endpoint, (time.perf_counter() - t0) * 1000, status))
+            # In-process requests that never wait on real I/O don't yield; a socket read would
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = loop.time() - t_start
+    loop_lag = await probe.stop()
+
+    per_endpoint = {}
+    for endpoint in endpoints:
+        rows = [r for r in records if r[0] == endpoint]
+        per_endpoint[endpoint] = {"requests": len(rows), "errors": sum(1 for r in rows if not 200 <= r[2] < 300),
+                                  "throughput_rps": len(rows) / elapsed, **latency_stats([r[1] for r in rows])}
+    upstream = {k: v - calls_before[0].get(k, 0) for k, v in bedrock.calls.items()}
+    upstream.update({f"line_{k}": v - calls_before[1].get(k, 0) for k, v in line_api.calls.items()})
+    return {"phase": name, "concurrency": concurrency, "rate": rate, "elapsed_s": elapsed, "requests": len(records),
+            "throughput_rps": len(records) / elapsed, "latency": latency_stats([r[1] for r in records]),
+            "endpoints": per_endpoint, "loop_lag": {**loop_lag, "blocked_pct": loop_lag["blocked_ms"] / (elapsed * 10)},
+            "upstream_calls": upstream}
+
+
+async def run_benchmark(args) -> Dict:
+    import httpx
+    import main
+
+    bedrock = StubBedrockRuntime(converse_latency=Latency(args.converse_ms, args.jitter, args.seed),
+                                 embed_latency=Latency(args.embed_ms, args.jitter, args.seed + 1))
+    line_api = StubLINEAPI(latency=Latency(args.line_ms, args.jitter, args.seed + 2))
+    install_stubs(bedrock, line_api)
+
+    df = machine_dataframe(args.machines, args.rows_per_machine, args.abnormal_rate, args.seed)
+    main.uploaded_data_store["dataframe"] = df
+    main.uploaded_data_store["machines"] = sorted(df["Machine_ID"].unique().tolist())
+    # Fresh SQLite store per run (same backend as production, nothing left behind)
+    main.line_store = SQLiteLineStore(os.path.join(tempfile.mkdtemp(prefix="load_test_"), "line_store.db"))
+    for i in range(args.line_users):
+        main.line_store.add_user(f"U{i:032d}")
+    machines = main.uploaded_data_store["machines"]
+
+    phases = [(p, DEFAULT_MIX if p == "mixed" else {p: 1}) for p in args.phases]
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    # ASGITransport does not send lifespan events; run the app's startup/shutdown hooks (alert worker) here
+    await main.app.router.startup()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, mix in phases:
+            print(f"▶ {name}: concurrency={args.concurrency}, {args.rate or 'closed-loop'} req/s, {args.duration}s",
+                  file=sys.stderr)
+            main.alert_deduper.clear()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = await run_phase(client, name, mix, args.concurrency, args.duration, machines,
+                                         args.abnormal_rate, args.reset_dedupe, args.seed, bedrock, line_api, args.rate,
+                                         args.line_users)
+            print(f"  {result['requests']} requests, {result['throughput_rps']:.1f} req/s, "
+                  f"p99 {result['latency']['p99_ms']:.0f} ms, loop blocked {result['loop_lag']['blocked_pct']:.0f}%",
+                  file=sys.stderr)
+            results.append(result)
+    await main.app.router.shutdown()
+    return {"meta": environment(args), "phases": results}
+
+
+# =========================
+# Report
+# =========================
+def environment(args) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {"commit": commit, "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k != "out_dir"}}
+
+
+def to_markdown(report: Dict) -> str:
+    meta, cfg = report["meta"], report["meta"]["config"]
+    mode = f"{cfg['rate']} req/s open loop" if cfg["rate"] else "closed loop"
+    lines = [f"# API load test ({meta['commit'] or 'unknown commit'}, {meta['timestamp']})", "",
+             f"concurrency {cfg['concurrency']}, {mode}, "
+             f"{cfg['duration']}s per phase; injected latency: converse "
+             f"{cfg['converse_ms']} ms, embeddings {cfg['embed_ms']} ms, LINE push {cfg['line_ms']} ms (±{cfg['jitter']:.0%})", "",
+             "| phase | endpoint | requests | errors | req/s | p50 (ms) | p90 (ms) | p99 (ms) | max (ms) |",
+             "|---|---|---|---|---|---|---|---|---|"]
+    fmt = lambda v: "–" if v is None else f"{v:.1f}"
+    for phase in report["phases"]:
+        for endpoint, s in phase["endpoints"].items():
+            lines.append(f"| {phase['phase']} | {endpoint} | {s['requests']} | {s['errors']} | {s['throughput_rps']:.1f} | "
+                         f"{fmt(s['p50_ms'])} | {fmt(s['p90_ms'])} | {fmt(s['p99_ms'])} | {fmt(s['max_ms'])} |")
+    lines += ["", "## Event-loop blocking", "",
+              "| phase | loop lag p50 (ms) | loop lag p99 (ms) | max (ms) | blocked | upstream calls |",
+              "|---|---|---|---|---|---|"]
+    for phase in report["phases"]:
+        lag = phase["loop_lag"]
+        calls = ", ".join(f"{k}={v}" for k, v in phase["upstream_calls"].items() if v)
+        lines.append(f"| {phase['phase']} | {lag['p50_ms']:.1f} | {lag['p99_ms']:.1f} | {lag['max_ms']:.1f} | "
+                     f"{lag['blocked_pct']:.0f}% | {calls or '–'} |")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API with stubbed Bedrock / LINE")
+    parser.add_argument("--phases", nargs="+", default=ENDPOINTS + ["mixed"], choices=ENDPOINTS + ["mixed"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="open-loop arrival rate in req/s (0 = closed loop, one request in flight per worker)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per phase")
+    parser.add_argument("--converse-ms", type=float, default=800.0, help="Bedrock converse latency")
+    parser.add_argument("--embed-ms", type=float, default=40.0, help="Titan embedding latency")
+    parser.add_argument("--line-ms", type=float, default=120.0, help="LINE push latency")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency jitter as a fraction of the base")
+    parser.add_argument("--machines", type=int, default=4)
+    parser.add_argument("--rows-per-machine", type=int, default=500)
+    parser.add_argument("--line-users", type=int, default=5)
+    parser.add_argument("--abnormal-rate", type=float, default=0.3, help="share of requests with out-of-range sensors")
+    parser.add_argument("--reset-dedupe", action="store_true",
+                        help="clear alert dedupe state before every machine-data call (every alert goes out to LINE)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out-dir", default="load_test_results")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    os.makedirs(args.out_dir, exist_ok=True)
+    with open(os.path.join(args.out_dir, "load_test_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    markdown = to_markdown(report)
+    with open(os.path.join(args.out_dir, "load_test_report.md"), "w", encoding="utf-8") as f:
+        f.write(markdown)
+    print(markdown)
@@ -0,0 +1,90 @@
+"""
+Bedrock resilience benchmark: deadlines + hedging vs. plain calls under injected faults
+
+Calls go through llm_resilience.ResilientClient in front of FaultInjectingBedrock(StubBedrockRuntime):
+a fraction of calls stall (slow_ms) or fail, then a full outage shows the circuit breaker opening
+and closing again after the reset timeout.
+
+Usage:
+    cd backend
+    python benchmarks/resilience.py --calls 300 --latency-ms 400 --slow-rate 0.05 --slow-ms 8000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import FaultInjectingBedrock, Latency, StubBedrockRuntime
+from load_test import latency_stats
+from llm_resilience import LLMUnavailable, ResilientClient
+
+MODEL_ID = "qwen.qwen3-32b-v1:0"
+
+
+def run_calls(client: ResilientClient, calls: int) -> Dict:
+    latencies, failures = [], {}
+    for i in range(calls):
+        t0 = time.perf_counter()
+        try:
+            client.converse(modelId=MODEL_ID, messages=[{"role": "user", "content": [{"text": f"q{i}"}]}])
+        except LLMUnavailable as e:
+            failures[e.reason] = failures.get(e.reason, 0) + 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return {"latency": latency_stats(latencies), "failures": failures}
+
+
+def run_variant(name: str, args, hedge_min_s: float) -> Dict:
+    stub = StubBedrockRuntime(converse_latency=Latency(args.latency_ms, args.jitter, args.seed))
+    faulty = FaultInjectingBedrock(stub, error_rate=args.error_rate, slow_rate=args.slow_rate,
+                                   slow_ms=args.slow_ms, seed=args.seed)
+    client = ResilientClient(faulty, deadline_s=args.deadline_s, hedge_min_s=hedge_min_s,
+                             failure_threshold=args.breaker_failures, reset_timeout_s=args.breaker_reset_s,
+                             max_workers=64)
+    result = run_calls(client, args.calls)
+
+    # Outage: every call fails until the breaker opens; calls then fail fast without reaching Bedrock
+    faulty.down = True
+    upstream_before = faulty.faults["down"]
+    outage = run_calls(client, args.outage_calls)
+    outage["upstream_attempts"] = faulty.faults["down"] - upstream_before
+    faulty.down = False
+    time.sleep(args.breaker_reset_s)
+    recovery = run_calls(client, 1)
+
+    return {"variant": name, **result, "upstream_calls": stub.calls["converse"], "faults": dict(faulty.faults),
+            "outage": outage, "recovered": not recovery["failures"], "breaker": client.stats()[MODEL_ID]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hedging / deadline / circuit breaker under injected faults")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=400.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=8000.0)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--deadline-s", type=float, default=5.0)
+    parser.add_argument("--hedge-min-s", type=float, default=0.2)
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    parser.add_argument("--breaker-reset-s", type=float, default=2.0)
+    parser.add_argument("--outage-calls", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    report = [run_variant("deadline only", args, hedge_min_s=args.deadline_s),
+              run_variant("deadline + hedging", args, hedge_min_s=args.hedge_min_s)]
+    print("| variant | p50 (ms) | p99 (ms) | max (ms) | failed | upstream calls | outage attempts |")
+    print("|---|---|---|---|---|---|---|")
+    for r in report:
+        s = r["latency"]
+        print(f"| {r['variant']} | {s['p50_ms']:.0f} | {s['p99_ms']:.0f} | {s['max_ms']:.0f} | "
+              f"{sum(r['failures'].values())} | {r['upstream_calls']} | "
+              f"{r['outage']['upstream_attempts']}/{args.outage_calls} |")
+    print(json.dumps(report, indent=2, ensure_ascii=False), file=sys.stderr)
@@ -0,0 +1,209 @@
+"""
+Local stand-ins for AWS Bedrock and the LINE Messaging API used by the benchmarks
+
+Both stubs block the calling thread for an injected latency, the same way the real
+boto3 / requests calls do, so event-loop blocking shows up exactly as in production.
+"""
+import io
+import json
+import random
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+class Latency:
+    """Injected latency: base_ms +/- jitter (fraction of base_ms), uniform"""
+
+    def __init__(self, base_ms: float = 0.0, jitter: float = 0.2, seed: Optional[int] = None):
+        self.base_ms = base_ms
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_ms(self) -> float:
+        with self._lock:
+            spread = self.base_ms * self.jitter
+            return max(0.0, self.base_ms + self._rng.uniform(-spread, spread))
+
+    def wait(self) -> float:
+        ms = self.sample_ms()
+        if ms:
+            time.sleep(ms / 1000)
+        return ms
+
+
+class StubBedrockRuntime:
+    """
+    Drop-in for boto3.client('bedrock-runtime'): converse() and invoke_model() (Titan embeddings)
+
+    A converse call with a toolConfig whose last message is not a tool result answers like an
+    agent model: one turn requesting every configured tool at once; the next turn ends.
+
+    Args:
+        converse_latency: Latency for converse calls
+        embed_latency: Latency for invoke_model calls
+        embedding_dim: dimension of the returned embeddings (Titan v2 = 1024)
+        model_latency: {substring of modelId: Latency} overriding converse_latency per model
+    """
+
+    def __init__(self, converse_latency: Latency = None, embed_latency: Latency = None,
+                 embedding_dim: int = 1024, answer: str = "ขั้นตอนการซ่อม: ตรวจสอบ bearing และระบบหล่อลื่น",
+                 model_latency: Optional[Dict[str, Latency]] = None):
+        self.converse_latency = converse_latency or Latency()
+        self.embed_latency = embed_latency or Latency()
+        self.embedding_dim = embedding_dim
+        self.answer = answer
+        self.model_latency = model_latency or {}
+        self.calls = {"converse": 0, "invoke_model": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+    def converse(self, modelId: str, messages: List[Dict], toolConfig: Optional[Dict] = None, **kwargs) -> Dict:
+        self._count("converse")
+        latency = next((lat for key, lat in self.model_latency.items() if key in modelId), self.converse_latency)
+        latency.wait()
+        usage = {"inputTokens": len(json.dumps(messages, ensure_ascii=False)) // 4,
+                 "outputTokens": len(self.answer) // 4}
+        if toolConfig and not any("toolResult" in c for c in messages[-1]["content"]):
+            question = next((c["text"] for c in messages[-1]["content"] if "text" in c), "")
+            content = [{"toolUse": {"toolUseId": f"tool-{i}", "name": tool["toolSpec"]["name"],
+                                    "input": self._tool_input(tool["toolSpec"], question)}}
+                       for i, tool in enumerate(toolConfig["tools"])]
+            return {"output": {"message": {"role": "assistant", "content": content}},
+                    "stopReason": "tool_use", "usage": usage}
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": self.answer}]}},
+            "stopReason": "end_turn",
+            "usage": usage,
+        }
+
+    @staticmethod
+    def _tool_input(spec: Dict, question: str) -> Dict:
+        """Required string fields get the user's question, numbers 0"""
+        schema = spec["inputSchema"]["json"]
+        return {name: question if schema["properties"][name]["type"] == "string" else 0
+                for name in schema.get("required", [])}
+
+    def invoke_model(self, modelId: str, body: str, **kwargs) -> Dict:
+        self._count("invoke_model")
+        self.embed_latency.wait()
+        # Deterministic pseudo-embedding per input text
+        rng = random.Random(zlib.crc32(json.loads(body).get("inputText", "").encode("utf-8")))
+        embedding = [rng.uniform(-0.1, 0.1) for _ in range(self.embedding_dim)]
+        return {"body": io.BytesIO(json.dumps({"embedding": embedding}).encode("utf-8"))}
+
+
+class ThrottlingException(Exception):
+    """Same class name as botocore's modeled Bedrock throttling error"""
+
+
+class InjectedFault(Exception):
+    pass
+
+
+class FaultInjectingBedrock:
+    """
+    Wraps a Bedrock client (usually StubBedrockRuntime) and injects faults per call
+
+    Args:
+        client: the client to wrap
+        error_rate: fraction of calls failing at once with a server error
+        throttle_rate: fraction of calls failing at once with ThrottlingException
+        slow_rate: fraction of calls stalling for slow_ms before they are passed on
+        slow_ms: stall duration
+        seed: random seed
+
+    Set `down = True` at runtime to fail every call (outage), back to False to recover.
+    """
+
+    def __init__(self, client, error_rate: float = 0.0, throttle_rate: float = 0.0, slow_rate: float = 0.0,
+                 slow_ms: float = 10000.0, seed: Optional[int] = None):
+        self.client = client
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.down = False
+        self.faults = {"error": 0, "throttle": 0, "slow": 0, "down": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _inject(self):
+        with self._lock:
+            roll = self._rng.random()
+            if self.down:
+                fault = "down"
+            elif roll < self.error_rate:
+                fault = "error"
+            elif roll < self.error_rate + self.throttle_rate:
+                fault = "throttle"
+            elif roll < self.error_rate + self.throttle_rate + self.slow_rate:
+                fault = "slow"
+            else:
+                return
+            self.faults[fault] += 1
+        if fault == "slow":
+            time.sleep(self.slow_ms / 1000)
+        elif fault == "throttle":
+            raise ThrottlingException("Too many requests, please wait before trying again.")
+        else:
+            raise InjectedFault(f"injected {fault}")
+
+    def converse(self, **kwargs) -> Dict:
+        self._inject()
+        return self.client.converse(**kwargs)
+
+    def invoke_model(self, **kwargs) -> Dict:
+        self._inject()
+        return self.client.invoke_model(**kwargs)
+
+
+class StubLINEAPI:
+    """
+    Drop-in for the `requests` module used by line_bot.LINENotifier (only `post` is used)
+    and for the pooled session of line_delivery.LINEDelivery
+
+    Every call sleeps for the injected latency and answers 200; calls are counted per endpoint.
+    """
+
+    def __init__(self, latency: Latency = None):
+        self.latency = latency or Latency()
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def post(self, url: str, headers: Dict = None, json: Dict = None, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        self.latency.wait()
+        return SimpleNamespace(status_code=200, text="{}", headers={}, json=lambda: {})
+
+    def mount(self, prefix, adapter):
+        pass
+
+
+def install_stubs(bedrock: StubBedrockRuntime, line_api: StubLINEAPI,
+                  channel_access_token: str = "bench-token", channel_secret: str = "bench-secret") -> None:
+    """Patch the already-imported backend modules to use the stubs"""
+    import main
+    import llm_gateway
+    import line_bot
+    import line_delivery
+
+    # The backend modules all call Bedrock through the gateway layers: swap the client at the bottom,
+    # so coalescing, scheduling, deadlines and hedging stay in the measured path
+    llm_gateway.replace_upstream(bedrock)
+    line_bot.requests = line_api
+
+    notifier = line_bot.get_line_notifier()
+    notifier.channel_access_token = channel_access_token
+    notifier.channel_secret = channel_secret
+    delivery = line_delivery.get_line_delivery()
+    delivery.session = line_api
+    delivery.channel_access_token = channel_access_token
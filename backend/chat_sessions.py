@@ -0,0 +1,146 @@
+"""
+Chat sessions for the orchestrator chat
+
+- One session per session_id: the conversation so far, so follow-up questions keep context
+- History kept to a token budget: a finished turn is stored compacted (question + final answer,
+  tool calls / tool results dropped); when the budget is exceeded the oldest turns are folded into
+  a short extractive summary that is sent ahead of the retained turns
+- Bounded memory: LRU over max_sessions, sessions idle for ttl seconds expire
+- One turn at a time per session (per-session lock); different sessions run concurrently
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from tokens import estimate_tokens, messages_tokens
+
+SUMMARY_HEADER = "สรุปบทสนทนาก่อนหน้า:"
+
+
+def _text_of(message: Dict) -> str:
+    return "\n".join(block["text"] for block in message.get("content", []) if "text" in block)
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+@dataclass
+class ChatTurn:
+    question: str
+    answer: str
+    tokens: int = 0
+
+    def __post_init__(self):
+        self.tokens = messages_tokens(self.messages())
+
+    def messages(self) -> List[Dict]:
+        return [{"role": "user", "content": [{"text": self.question}]},
+                {"role": "assistant", "content": [{"text": self.answer}]}]
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    turns: List[ChatTurn] = field(default_factory=list)
+    summary: List[str] = field(default_factory=list)  # one line per folded turn
+    last_used: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def summary_text(self) -> str:
+        return SUMMARY_HEADER + "\n" + "\n".join(self.summary) if self.summary else ""
+
+    def history_tokens(self) -> int:
+        return sum(t.tokens for t in self.turns) + estimate_tokens(self.summary_text())
+
+    def context_messages(self) -> List[Dict]:
+        """Retained turns as converse messages; the summary goes in front of the first user message"""
+        messages = [m for turn in self.turns for m in turn.messages()]
+        if self.summary:
+            if messages:
+                first = messages[0]
+                messages[0] = {"role": "user", "content": [{"text": self.summary_text()}] + first["content"]}
+            else:
+                # Summary only: keep user / assistant alternation valid
+                messages = [{"role": "user", "content": [{"text": self.summary_text()}]},
+                            {"role": "assistant", "content": [{"text": "รับทราบ"}]}]
+        return messages
+
+
+class ChatSessionStore:
+    """
+    Args:
+        max_sessions: sessions kept in memory (least recently used evicted first)
+        ttl_s: drop a session idle for this long
+        history_token_budget: max estimated tokens of history (summary + retained turns) per session
+        summary_token_budget: max estimated tokens of the summary (oldest lines dropped first)
+        answer_chars_in_summary: characters of each folded answer kept in the summary
+        clock: time source (seconds), injectable for tests
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_s: float = 3600, history_token_budget: int = 2000,
+                 summary_token_budget: int = 400, answer_chars_in_summary: int = 160,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.answer_chars_in_summary = answer_chars_in_summary
+        self.clock = clock
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"created": 0, "expired": 0, "evicted": 0, "turns": 0, "folded_turns": 0}
+
+    def _expire(self, now: float):
+        # OrderedDict is kept in last-used order, so expired sessions are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.ttl_s:
+                break
+            del self._sessions[session_id]
+            self.counters["expired"] += 1
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ChatSession:
+        """Existing session for session_id, or a new one (new ID when none / unknown / expired)"""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                # Never adopt a client-chosen ID: two clients sending the same string would share history
+                session = ChatSession(session_id=uuid.uuid4().hex)
+                self._sessions[session.session_id] = session
+                self.counters["created"] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.counters["evicted"] += 1
+            session.last_used = now
+            self._sessions.move_to_end(session.session_id)
+            return session
+
+    def record_turn(self, session: ChatSession, question: str, answer: str):
+        """Store a finished turn (compacted) and bring the history back under the token budget"""
+        session.turns.append(ChatTurn(question, answer))
+        self.counters["turns"] += 1
+        # Always keep the latest turn; fold older ones into the summary until within budget
+        while len(session.turns) > 1 and session.history_tokens() > self.history_token_budget:
+            oldest = session.turns.pop(0)
+            session.summary.append(f"- ถาม: {_clip(oldest.question, 120)} | ตอบ: "
+                                   f"{_clip(oldest.answer, self.answer_chars_in_summary)}")
+            self.counters["folded_turns"] += 1
+            while len(session.summary) > 1 and estimate_tokens(session.summary_text()) > self.summary_token_budget:
+                session.summary.pop(0)
+        session.last_used = self.clock()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions,
+                    "history_token_budget": self.history_token_budget, **self.counters}
@@ -0,0 +1,136 @@
+"""
+Length-aware chunking of manual / PDF text before embedding
+
+Splitting on "\\n" makes every PDF line - single words, page numbers, running headers - its own
+embedding. Here lines are cleaned and merged first:
+
+- Boilerplate dropped: page-number lines ("12", "หน้า 3", "Page 2 of 9") and lines that repeat on
+  many pages (running headers / footers)
+- Sections: a blank line or a numbered / titled heading ("2. การตรวจสอบฉนวน") starts a new one
+- Sections shorter than min_tokens are merged with the next; a section longer than max_tokens is
+  split at line boundaries into windows that repeat the last overlap_tokens of the previous window
+- Token counts are the local estimates from tokens.py (Thai-aware)
+"""
+import os
+import re
+from collections import Counter
+from typing import Dict, List
+
+from tokens import estimate_tokens
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+PAGE_NUMBER = re.compile(r"^(?:(?:page|p\.|หน้า(?:ที่)?)\s*)?\d{1,4}(?:\s*(?:/|of|จาก)\s*\d{1,4})?$", re.IGNORECASE)
+HEADING = re.compile(r"^(?:\d{1,2}(?:\.\d{1,2})*[.)]\s+\S|(?:บทที่|ส่วนที่|หมวดที่?|chapter|section)\s*\S)", re.IGNORECASE)
+
+
+def clean_lines(pages: List[str], repeat_fraction: float = 0.5, min_pages: int = 3) -> List[str]:
+    """
+    Stripped lines of all pages, boilerplate removed; "" marks a paragraph break
+
+    A line counts as a running header / footer when it appears on at least repeat_fraction of the
+    pages (only checked for documents of min_pages pages or more).
+    """
+    page_lines = [[line.strip() for line in page.split("\n")] for page in pages]
+    repeated = set()
+    if len(pages) >= min_pages:
+        seen_on = Counter(line for lines in page_lines for line in set(lines) if line)
+        repeated = {line for line, n in seen_on.items() if n >= max(2, repeat_fraction * len(pages))}
+
+    cleaned = []
+    for lines in page_lines:
+        for line in lines:
+            if not line:
+                if cleaned and cleaned[-1]:
+                    cleaned.append("")
+            elif not PAGE_NUMBER.match(line) and line not in repeated:
+                cleaned.append(line)
+    return cleaned
+
+
+def split_sections(lines: List[str]) -> List[List[str]]:
+    """Group lines into sections at paragraph breaks and headings"""
+    sections, current = [], []
+    for line in lines:
+        if not line or HEADING.match(line):
+            if current:
+                sections.append(current)
+            current = [line] if line else []
+        else:
+            current.append(line)
+    if current:
+        sections.append(current)
+    return sections
+
+
+def _split_long_line(line: str, max_tokens: int) -> List[str]:
+    tokens = estimate_tokens(line)
+    if tokens <= max_tokens:
+        return [line]
+    step = max(1, len(line) * max_tokens // tokens)
+    return [line[i:i + step] for i in range(0, len(line), step)]
+
+
+def _windows(lines: List[str], max_tokens: int, overlap_tokens: int) -> List[List[str]]:
+    """Line windows of at most max_tokens, each starting with the previous window's tail"""
+    lines = [piece for line in lines for piece in _split_long_line(line, max_tokens)]
+    windows, current, size = [], [], 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if current and size + cost > max_tokens:
+            windows.append(current)
+            tail, tail_size = [], 0
+            for previous in reversed(current):
+                previous_cost = estimate_tokens(previous)
+                if tail_size + previous_cost > overlap_tokens or tail_size + previous_cost + cost > max_tokens:
+                    break
+                tail.insert(0, previous)
+                tail_size += previous_cost
+            current, size = tail, tail_size
+        current.append(line)
+        size += cost
+    if current:
+        windows.append(current)
+    return windows
+
+
+def chunk_pages(pages: List[str], max_tokens: int = CHUNK_MAX_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Chunks (lines joined with "\\n") of a document given as a list of page texts"""
+    chunks, pending, pending_size = [], [], 0
+    for section in split_sections(clean_lines(pages)):
+        size = sum(estimate_tokens(line) for line in section)
+        if pending and pending_size + size > max_tokens:
+            chunks.append(pending)
+            pending, pending_size = [], 0
+        if size > max_tokens:
+            windows = _windows(pending + section, max_tokens, overlap_tokens)
+            chunks.extend(windows[:-1])
+            pending = windows[-1]
+            pending_size = sum(estimate_tokens(line) for line in pending)
+        else:
+            pending += section
+            pending_size += size
+        if pending_size >= min_tokens:
+            chunks.append(pending)
+            pending, pending_size = [], 0
+    if pending:
+        chunks.append(pending)
+    return ["\n".join(chunk) for chunk in chunks]
+
+
+def chunk_text(text: str, **kwargs) -> List[str]:
+    """chunk_pages for a single-page text (e.g. manuls.txt)"""
+    return chunk_pages([text], **kwargs)
+
+
+def chunk_stats(lines: List[str], chunks: List[str]) -> Dict:
+    """Line split vs chunks: counts and estimated tokens sent to the embedding model"""
+    line_tokens = sum(estimate_tokens(line) for line in lines)
+    chunk_tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+    return {"lines": len(lines), "chunks": len(chunks),
+            "reduction": round(1 - len(chunks) / len(lines), 3) if lines else 0.0,
+            "line_tokens": line_tokens, "chunk_tokens": chunk_tokens,
+            "avg_chunk_tokens": round(chunk_tokens / len(chunks), 1) if chunks else 0.0}
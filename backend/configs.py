@@ -29,6 +29,7 @@ class MachineData(BaseModel):
 class ChatMessage(BaseModel):
     message: str
     context: Optional[Dict] = None
+    session_id: Optional[str] = None  # ส่งค่าที่ได้จาก response ก่อนหน้าเพื่อคุยต่อในบริบทเดิม
 
 class ROIRequest(BaseModel):
     current_health_percentage: float
@@ -0,0 +1,97 @@
+"""
+In-process BM25 retriever over the manual chunks (no network call)
+
+Thai is written without spaces between words, so Thai runs are indexed as overlapping character
+bigrams (no dictionary / word segmenter needed; "แบริ่ง" matches inside "การหล่อลื่นแบริ่ง").
+Latin text is split into lower-cased words, and camel-case sensor names are split too, so
+"TempOilGear" also matches "Oil Gear".
+
+An index is built once per distinct chunk list and cached (get_index).
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+_THAI_RUN = re.compile(r"[\u0e00-\u0e7f]+")
+_LATIN_WORD = re.compile(r"[A-Za-z]+|\d+(?:[.,]\d+)*")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Latin words (lower-cased, camel case split) + Thai character bigrams"""
+    tokens = []
+    for word in _LATIN_WORD.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = _CAMEL.findall(word) if word.isalpha() else []
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    for run in _THAI_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts
+
+    Args:
+        texts: the chunks; results refer to them by index
+        k1: term frequency saturation
+        b: document length normalization
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.texts = list(texts)
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_len = []
+        for doc_id, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            self.doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc_id, tf))
+        n = len(self.texts)
+        self.avg_len = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def scores(self, query: str) -> Tuple[Dict[int, float], float]:
+        """({doc index: score} for docs matching any query term, best doc's share of query terms)"""
+        terms = Counter(tokenize(query))
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+        for term, qtf in terms.items():
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / self.avg_len)
+                scores[doc_id] += qtf * idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[doc_id] += qtf
+        if not scores:
+            return {}, 0.0
+        best = max(scores, key=scores.get)
+        return dict(scores), matched[best] / sum(terms.values())
+
+    def search(self, query: str, top_k: int = 4) -> List[Dict]:
+        """Best top_k chunks: {"text", "similarity" (BM25 score), "index", "coverage"}"""
+        scores, coverage = self.scores(query)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [{"text": self.texts[i], "similarity": score, "index": i, "coverage": coverage}
+                for i, score in ranked]
+
+
+@lru_cache(maxsize=8)
+def _cached_index(texts: Tuple[str, ...]) -> BM25Index:
+    return BM25Index(list(texts))
+
+
+def get_index(texts: List[str]) -> BM25Index:
+    """BM25 index for this chunk list, built on first use and cached"""
+    return _cached_index(tuple(texts))
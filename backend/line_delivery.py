@@ -0,0 +1,214 @@
+"""
+LINE delivery engine
+
+- Multicast: one call per 500 recipients instead of one push per user
+- Pooled keep-alive HTTP session shared by all sends, per-user pushes fanned out on a thread pool
+- Client-side rate limiting (token bucket) + retry on 429/5xx honouring Retry-After (capped),
+  with X-Line-Retry-Key so a retried request is never delivered twice. Callers that retry a whole
+  delivery themselves (AlertWorker) pass a retry_key_seed: every batch then gets the same key on
+  each delivery attempt, and LINE answers 409 for batches that already went through
+- Per-batch results (recipients, status, attempts, latency)
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from observability import span
+
+MULTICAST_MAX_RECIPIENTS = 500
+
+
+class RateLimiter:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class BatchResult:
+    endpoint: str
+    recipients: int
+    ok: bool
+    status: Optional[int]
+    attempts: int
+    latency_ms: float
+    error: Optional[str] = None
+
+
+@dataclass
+class DeliveryReport:
+    requested: int
+    sent: int = 0
+    failed: int = 0
+    batches: List[BatchResult] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {"requested": self.requested, "sent": self.sent, "failed": self.failed,
+                "round_trips": len(self.batches), "batches": [asdict(b) for b in self.batches]}
+
+
+class LINEDelivery:
+    """
+    Args:
+        channel_access_token: defaults to LINE_CHANNEL_ACCESS_TOKEN
+        batch_size: recipients per multicast call (LINE max 500)
+        max_workers: concurrent HTTP calls (pool size)
+        rate_per_sec: client-side cap on API calls per second
+        max_retries: retries for 429 / 5xx / connection errors
+        max_retry_after: cap in seconds on the wait asked for by a Retry-After header
+        timeout: per-request timeout in seconds
+    """
+
+    def __init__(self, channel_access_token: Optional[str] = None, batch_size: int = MULTICAST_MAX_RECIPIENTS,
+                 max_workers: int = 8, rate_per_sec: float = 100.0, max_retries: int = 3, max_retry_after: float = 30.0,
+                 timeout: float = 10.0):
+        self.channel_access_token = channel_access_token or os.getenv('LINE_CHANNEL_ACCESS_TOKEN', '')
+        self.line_api_url = 'https://api.line.me/v2/bot/message'
+        self.batch_size = min(batch_size, MULTICAST_MAX_RECIPIENTS)
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate_per_sec)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="line-delivery")
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+
+    def is_configured(self) -> bool:
+        return bool(self.channel_access_token)
+
+    def _post(self, endpoint: str, payload: Dict, recipients: int, use_retry_key: bool = True,
+              retry_key: Optional[str] = None) -> BatchResult:
+        """POST with rate limiting and retries; the same retry key (given, else a new one) is sent on every attempt"""
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.channel_access_token}'
+        }
+        if use_retry_key:
+            headers['X-Line-Retry-Key'] = retry_key or str(uuid.uuid4())
+        start = time.perf_counter()
+        status, error = None, None
+        for attempt in range(1, self.max_retries + 2):
+            self.limiter.acquire()
+            retry_after = 2 ** (attempt - 1) * 0.5
+            try:
+                response = self.session.post(f'{self.line_api_url}/{endpoint}', headers=headers, json=payload,
+                                             timeout=self.timeout)
+                status = response.status_code
+                # 409 = this retry key was already accepted, i.e. an earlier attempt got through
+                if status in (200, 409):
+                    return BatchResult(endpoint, recipients, True, status, attempt, (time.perf_counter() - start) * 1000)
+                error = response.text[:200]
+                if status != 429 and status < 500:
+                    break
+                try:
+                    retry_after = float(response.headers.get('Retry-After', retry_after))
+                except ValueError:
+                    pass
+                retry_after = min(max(retry_after, 0.0), self.max_retry_after)
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt <= self.max_retries:
+                time.sleep(retry_after)
+        print(f"❌ LINE {endpoint} failed for {recipients} recipients: {status} - {error}")
+        return BatchResult(endpoint, recipients, False, status, attempt, (time.perf_counter() - start) * 1000, error)
+
+    def push(self, user_id: str, messages: List[Dict], retry_key: Optional[str] = None) -> BatchResult:
+        return self._post('push', {'to': user_id, 'messages': messages}, 1, retry_key=retry_key)
+
+    def reply(self, reply_token: str, messages: List[Dict]) -> BatchResult:
+        """Reply API (no retry key support; a reply token can only be used once anyway)"""
+        return self._post('reply', {'replyToken': reply_token, 'messages': messages}, 1, use_retry_key=False)
+
+    def multicast(self, user_ids: List[str], messages: List[Dict], retry_key: Optional[str] = None) -> BatchResult:
+        return self._post('multicast', {'to': user_ids, 'messages': messages}, len(user_ids), retry_key=retry_key)
+
+    @staticmethod
+    def batch_retry_key(seed: Optional[str], endpoint: str, user_ids: List[str]) -> Optional[str]:
+        """Retry key (a UUID, as LINE requires) that is the same for the same seed and batch, None without a seed"""
+        if seed is None:
+            return None
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{seed}|{endpoint}|{','.join(user_ids)}"))
+
+    def deliver(self, user_ids: List[str], messages: List[Dict], use_multicast: bool = True,
+                retry_key_seed: Optional[str] = None) -> DeliveryReport:
+        """
+        Send the same messages to many users
+
+        Args:
+            user_ids: LINE user IDs (duplicates removed, order kept)
+            messages: LINE message objects
+            use_multicast: batch recipients into multicast calls; False = concurrent per-user pushes
+            retry_key_seed: stable id of this delivery (e.g. the alert event) when the caller may
+                call deliver again for it; each batch's retry key is derived from it
+
+        Returns:
+            DeliveryReport with per-batch results
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        report = DeliveryReport(requested=len(user_ids))
+        if not user_ids:
+            return report
+        if not self.is_configured():
+            print("⚠️ LINE Bot not configured. Set LINE_CHANNEL_ACCESS_TOKEN in .env")
+            report.failed = len(user_ids)
+            return report
+
+        with span("line_push", users=len(user_ids)):
+            if use_multicast and len(user_ids) > 1:
+                batches = [user_ids[i:i + self.batch_size] for i in range(0, len(user_ids), self.batch_size)]
+                futures = [self.executor.submit(self.multicast, batch, messages,
+                                                self.batch_retry_key(retry_key_seed, 'multicast', batch))
+                           for batch in batches]
+            else:
+                futures = [self.executor.submit(self.push, uid, messages,
+                                                self.batch_retry_key(retry_key_seed, 'push', [uid]))
+                           for uid in user_ids]
+            report.batches = [f.result() for f in futures]
+
+        report.sent = sum(b.recipients for b in report.batches if b.ok)
+        report.failed = report.requested - report.sent
+        print(f"📤 LINE delivery: {report.sent}/{report.requested} users in {len(report.batches)} calls")
+        return report
+
+
+# Singleton
+_line_delivery = None
+
+
+def get_line_delivery() -> LINEDelivery:
+    """Get LINE delivery engine singleton"""
+    global _line_delivery
+    if _line_delivery is None:
+        _line_delivery = LINEDelivery(
+            batch_size=int(os.getenv('LINE_MULTICAST_BATCH', str(MULTICAST_MAX_RECIPIENTS))),
+            max_workers=int(os.getenv('LINE_DELIVERY_WORKERS', '8')),
+            rate_per_sec=float(os.getenv('LINE_RATE_PER_SEC', '100')),
+            max_retry_after=float(os.getenv('LINE_MAX_RETRY_AFTER_S', '30'))
+        )
+    return _line_delivery
@@ -0,0 +1,173 @@
+"""
+Persistent storage for LINE users and their alert setting
+
+LineStore is the repository interface used by the API; SQLiteLineStore (default) keeps
+the data in a WAL-mode SQLite file so it survives restarts and is shared by every uvicorn
+worker process. MemoryLineStore keeps the same interface in process memory (tests, benchmarks).
+
+Set LINE_STORE=memory to use the in-memory store, LINE_STORE_PATH to move the database file.
+"""
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List
+
+
+class LineStore(ABC):
+    """Repository interface: LINE users and their alert setting"""
+
+    @abstractmethod
+    def add_user(self, user_id: str, alerts_enabled: bool = True) -> bool:
+        """Register a user; returns True if the user is new"""
+
+    @abstractmethod
+    def remove_user(self, user_id: str) -> bool:
+        """Forget a user (unfollowed / blocked the bot); returns True if the user existed"""
+
+    @abstractmethod
+    def set_alerts_enabled(self, user_id: str, enabled: bool) -> None:
+        ...
+
+    @abstractmethod
+    def alerts_enabled(self, user_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def list_users(self) -> List[Dict]:
+        """[{"user_id", "alerts_enabled"}] in registration order"""
+
+    @abstractmethod
+    def count_users(self) -> int:
+        ...
+
+    @abstractmethod
+    def alert_recipients(self) -> List[str]:
+        """User IDs with alerts enabled"""
+
+
+class MemoryLineStore(LineStore):
+    """Process-local store (dict keyed by user ID, O(1) lookups)"""
+
+    def __init__(self):
+        self._users: Dict[str, bool] = {}  # insertion-ordered: user_id -> alerts_enabled
+        self._lock = threading.Lock()
+
+    def add_user(self, user_id: str, alerts_enabled: bool = True) -> bool:
+        with self._lock:
+            if user_id in self._users:
+                return False
+            self._users[user_id] = alerts_enabled
+            return True
+
+    def remove_user(self, user_id: str) -> bool:
+        with self._lock:
+            return self._users.pop(user_id, None) is not None
+
+    def set_alerts_enabled(self, user_id: str, enabled: bool) -> None:
+        with self._lock:
+            self._users[user_id] = enabled
+
+    def alerts_enabled(self, user_id: str) -> bool:
+        return self._users.get(user_id, True)
+
+    def list_users(self) -> List[Dict]:
+        return [{"user_id": uid, "alerts_enabled": enabled} for uid, enabled in list(self._users.items())]
+
+    def count_users(self) -> int:
+        return len(self._users)
+
+    def alert_recipients(self) -> List[str]:
+        return [uid for uid, enabled in list(self._users.items()) if enabled]
+
+
+
+class SQLiteLineStore(LineStore):
+    """
+    SQLite store in WAL mode: readers never block the writer, several processes can share the file
+
+    One connection per thread (sqlite3 connections are not shared across threads).
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS line_users (
+        user_id        TEXT PRIMARY KEY,
+        alerts_enabled INTEGER NOT NULL DEFAULT 1,
+        created_at     TEXT NOT NULL,
+        updated_at     TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_line_users_alerts ON line_users(alerts_enabled) WHERE alerts_enabled = 1;
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit mode: every statement is its own short transaction
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().isoformat(timespec="seconds")
+
+    def add_user(self, user_id: str, alerts_enabled: bool = True) -> bool:
+        now = self._now()
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO line_users (user_id, alerts_enabled, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (user_id, int(alerts_enabled), now, now))
+        return cur.rowcount == 1
+
+    def remove_user(self, user_id: str) -> bool:
+        return self._conn().execute("DELETE FROM line_users WHERE user_id = ?", (user_id,)).rowcount == 1
+
+    def set_alerts_enabled(self, user_id: str, enabled: bool) -> None:
+        now = self._now()
+        self._conn().execute(
+            "INSERT INTO line_users (user_id, alerts_enabled, created_at, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET alerts_enabled = excluded.alerts_enabled, updated_at = excluded.updated_at",
+            (user_id, int(enabled), now, now))
+
+    def alerts_enabled(self, user_id: str) -> bool:
+        row = self._conn().execute("SELECT alerts_enabled FROM line_users WHERE user_id = ?", (user_id,)).fetchone()
+        return bool(row[0]) if row else True
+
+    def list_users(self) -> List[Dict]:
+        rows = self._conn().execute("SELECT user_id, alerts_enabled FROM line_users ORDER BY created_at, rowid")
+        return [{"user_id": uid, "alerts_enabled": bool(enabled)} for uid, enabled in rows]
+
+    def count_users(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM line_users").fetchone()[0]
+
+    def alert_recipients(self) -> List[str]:
+        rows = self._conn().execute("SELECT user_id FROM line_users WHERE alerts_enabled = 1 ORDER BY created_at, rowid")
+        return [uid for (uid,) in rows]
+
+
+# Singleton
+_line_store = None
+
+
+def get_line_store() -> LineStore:
+    """Get LINE store singleton (SQLite unless LINE_STORE=memory)"""
+    global _line_store
+    if _line_store is None:
+        if os.getenv("LINE_STORE", "sqlite").lower() == "memory":
+            _line_store = MemoryLineStore()
+        else:
+            default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "line_store.db")
+            _line_store = SQLiteLineStore(os.getenv("LINE_STORE_PATH", default_path))
+    return _line_store
@@ -0,0 +1,168 @@
+"""
+LINE webhook pipeline
+
+POST /api/line/webhook only verifies the signature, queues the events and answers 200, so
+LINE never waits on our outbound calls. Events are handled by background asyncio workers:
+
+- Events are sharded by user ID: one user's messages are handled in order, different users
+  concurrently
+- Redelivered events (same webhookEventId) are skipped
+- Replies go through the reply API with the event's reply token; when there is no token,
+  it has expired or the reply fails, the messages are pushed instead
+"""
+import asyncio
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from observability import span
+
+
+@dataclass
+class WebhookJob:
+    event: Dict
+    received_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def user_id(self) -> str:
+        return self.event.get("source", {}).get("userId", "")
+
+    @property
+    def event_id(self) -> Optional[str]:
+        return self.event.get("webhookEventId")
+
+
+class WebhookProcessor:
+    """
+    Args:
+        handle_fn: event dict -> LINE messages to answer with, or None (blocking, runs in a thread)
+        reply_fn: (reply_token, messages) -> True if the reply was accepted (blocking)
+        push_fn: (user_id, messages) -> True if the push was accepted (blocking)
+        workers: number of shards / concurrent users being handled
+        queue_size: max pending events per shard before submit() rejects
+        reply_token_ttl: seconds a reply token is trusted (LINE tokens expire after about a minute)
+        seen_size: recent webhookEventIds remembered to skip redeliveries
+    """
+
+    def __init__(self, handle_fn: Callable[[Dict], Optional[List[Dict]]],
+                 reply_fn: Callable[[str, List[Dict]], bool], push_fn: Callable[[str, List[Dict]], bool],
+                 workers: int = 8, queue_size: int = 1000, reply_token_ttl: float = 50.0, seen_size: int = 10000):
+        self.handle_fn = handle_fn
+        self.reply_fn = reply_fn
+        self.push_fn = push_fn
+        self.workers = workers
+        self.queue_size = queue_size
+        self.reply_token_ttl = reply_token_ttl
+        self.seen_size = seen_size
+
+        self.queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.counters = {"received": 0, "queued": 0, "redelivered": 0, "rejected": 0, "handled": 0,
+                         "replied": 0, "pushed": 0, "reply_failed": 0, "failed": 0}
+
+    # =========================
+    # Producer side (webhook request, non-blocking)
+    # =========================
+    def _shard(self, user_id: str) -> asyncio.Queue:
+        return self.queues[zlib.crc32(user_id.encode("utf-8")) % len(self.queues)]
+
+    def submit(self, events: List[Dict]) -> Dict[str, int]:
+        """
+        Queue webhook events without waiting
+
+        Returns:
+            {"queued", "redelivered", "rejected"} counts; rejected events are not marked as seen,
+            so a redelivery of the same request queues them again
+        """
+        result = {"queued": 0, "redelivered": 0, "rejected": 0}
+        for event in events:
+            self.counters["received"] += 1
+            job = WebhookJob(event)
+            if job.event_id and job.event_id in self._seen:
+                result["redelivered"] += 1
+                continue
+            if not self.queues:
+                result["rejected"] += 1
+                continue
+            try:
+                self._shard(job.user_id).put_nowait(job)
+            except asyncio.QueueFull:
+                result["rejected"] += 1
+                continue
+            if job.event_id:
+                self._seen[job.event_id] = None
+                if len(self._seen) > self.seen_size:
+                    self._seen.popitem(last=False)
+            result["queued"] += 1
+        for key in ("queued", "redelivered", "rejected"):
+            self.counters[key] += result[key]
+        if result["rejected"]:
+            print(f"⚠️ LINE webhook: {result['rejected']} events rejected "
+                  f"({'queue full' if self.queues else 'processor not running'})")
+        return result
+
+    # =========================
+    # Consumer side
+    # =========================
+    async def _process(self, job: WebhookJob):
+        with span("line_webhook_event", type=job.event.get("type", "")):
+            messages = await asyncio.to_thread(self.handle_fn, job.event)
+        self.counters["handled"] += 1
+        if not messages:
+            return
+
+        reply_token = job.event.get("replyToken")
+        if reply_token and time.monotonic() - job.received_at < self.reply_token_ttl:
+            if await asyncio.to_thread(self.reply_fn, reply_token, messages):
+                self.counters["replied"] += 1
+                return
+            self.counters["reply_failed"] += 1
+        if job.user_id and await asyncio.to_thread(self.push_fn, job.user_id, messages):
+            self.counters["pushed"] += 1
+        else:
+            self.counters["failed"] += 1
+            print(f"❌ Could not answer LINE event for {job.user_id or 'unknown user'}")
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                self.counters["failed"] += 1
+                print(f"⚠️ LINE webhook event error: {str(e)}")
+            finally:
+                queue.task_done()
+
+    def start(self):
+        """Create the shard queues and worker tasks on the running event loop"""
+        if self._tasks:
+            return
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run(q)) for q in self.queues]
+        print(f"✓ LINE webhook processor started ({self.workers} workers)")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Finish queued events (up to drain_timeout seconds), then cancel the workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ LINE webhook processor stopped with {self.queue_depth()} events still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.queues = []
+
+    def queue_depth(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    def stats(self) -> Dict:
+        return {"running": bool(self._tasks), "workers": self.workers, "queue_depth": self.queue_depth(),
+                "queue_size": self.queue_size, **self.counters}
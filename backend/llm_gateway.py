@@ -0,0 +1,198 @@
+"""
+Single-flight gateway in front of the Bedrock runtime client
+
+Identical calls that are in flight at the same time (same operation, same canonical request)
+share one upstream call: the first caller (leader) makes it, later callers wait on the leader's
+future and get their own copy of the result.
+
+- Keyed on a sha256 of the canonical request (sorted keys; an invoke_model JSON body is parsed
+  first, so key order in the body does not matter) plus the caller's priority class: the shared
+  call waits for one scheduler ticket, so an alert call never waits behind a batch call's ticket
+- Errors propagate to every waiter of that call; nothing is cached - the key is released before
+  the result is published, so the next call after completion goes upstream again
+- A waiter that gives up (timeout, or its request is cancelled while it waits in a thread) does
+  not affect the leader or the other waiters; the leader's call always runs to completion
+- Drop-in for the boto3 client: converse() / invoke_model() have the same signature and result
+  shape (invoke_model returns a fresh readable body per caller); other attributes pass through
+"""
+import copy
+import hashlib
+import io
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from bedrock_client import get_bedrock_runtime, DEFAULT_REGION
+from llm_resilience import ResilientClient, resilience_settings
+from llm_scheduler import LLMScheduler, current_priority, scheduler_settings
+from observability import Counter, register
+
+SINGLEFLIGHT_CALLS = register(Counter(
+    "llm_singleflight_calls_total", "Bedrock calls through the gateway (role = leader / coalesced)",
+    ("operation", "role")))
+SINGLEFLIGHT_ERRORS = register(Counter(
+    "llm_singleflight_errors_total", "Failed upstream Bedrock calls (each counted once, however many waiters)",
+    ("operation",)))
+
+
+def request_key(operation: str, request: Dict) -> str:
+    """Canonical hash of one request"""
+    canonical = dict(request)
+    body = canonical.get("body")
+    if isinstance(body, (str, bytes)):
+        try:
+            canonical["body"] = json.loads(body)
+        except ValueError:
+            canonical["body"] = body.decode("utf-8", "replace") if isinstance(body, bytes) else body
+    payload = json.dumps({"operation": operation, "request": canonical}, sort_keys=True,
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """In-flight futures by key (thread-safe)"""
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None):
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: request key
+            fn: the upstream call
+            timeout: max seconds a waiter waits for the leader (None = until done)
+
+        Returns:
+            (result, shared): shared is True when the result came from another caller's call
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if leader:
+            self._lead(key, future, fn)
+        return future.result(timeout=timeout), not leader
+
+    def _lead(self, key: str, future: Future, fn: Callable[[], Any]):
+        try:
+            result = fn()
+        except BaseException as e:
+            self._release(key)
+            future.set_exception(e)
+        else:
+            self._release(key)
+            future.set_result(result)
+
+    def _release(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+
+class LLMGateway:
+    """
+    Coalescing wrapper around a bedrock-runtime client
+
+    Args:
+        client: boto3 bedrock-runtime client (or a stand-in with the same methods)
+        wait_timeout: max seconds a coalesced caller waits for the shared call
+    """
+
+    def __init__(self, client, wait_timeout: Optional[float] = None):
+        self.client = client
+        self.wait_timeout = wait_timeout
+        self.flight = SingleFlight()
+        self.counters = {"leader": 0, "coalesced": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Everything not coalesced goes straight to the client
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def _count(self, operation: str, role: str):
+        SINGLEFLIGHT_CALLS.inc(operation=operation, role=role)
+        with self._lock:
+            self.counters[role] += 1
+
+    def _call(self, operation: str, request: Dict, fn: Callable[[], Any]):
+        led = []
+
+        def upstream():
+            led.append(True)
+            try:
+                return fn()
+            except Exception:
+                SINGLEFLIGHT_ERRORS.inc(operation=operation)
+                with self._lock:
+                    self.counters["errors"] += 1
+                raise
+
+        try:
+            key = f"{current_priority()}:{request_key(operation, request)}"
+            result, _ = self.flight.do(key, upstream, self.wait_timeout)
+        finally:
+            # Counted whether the shared call succeeded or not
+            self._count(operation, "leader" if led else "coalesced")
+        return result
+
+    def converse(self, **request) -> Dict:
+        result = self._call("converse", request, lambda: self.client.converse(**request))
+        # Callers append the returned message to their own conversations
+        return copy.deepcopy(result)
+
+    def invoke_model(self, **request) -> Dict:
+        def upstream():
+            response = self.client.invoke_model(**request)
+            # The streaming body can be read once: keep the bytes, hand each caller its own stream
+            return {**response, "body": response["body"].read()}
+
+        result = self._call("invoke_model", request, upstream)
+        return {**result, "body": io.BytesIO(result["body"])}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+        return {**counters, "in_flight": self.flight.in_flight()}
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_llm_gateway(region_name: str = DEFAULT_REGION) -> LLMGateway:
+    """
+    Get the gateway singleton for a region
+
+    gateway (coalescing) -> LLMScheduler (priority / rate limits) -> ResilientClient (deadlines /
+    hedging / breakers) -> shared bedrock-runtime client
+    """
+    gateway = _gateways.get(region_name)
+    if gateway is None:
+        with _gateways_lock:
+            gateway = _gateways.get(region_name)
+            if gateway is None:
+                resilient = ResilientClient(get_bedrock_runtime(region_name), **resilience_settings())
+                gateway = LLMGateway(LLMScheduler(resilient, **scheduler_settings()))
+                _gateways[region_name] = gateway
+    return gateway
+
+
+def replace_upstream(client):
+    """Swap the bedrock-runtime client at the bottom of every gateway's layers (benchmarks)"""
+    for gateway in _gateways.values():
+        layer = gateway
+        while isinstance(layer.client, (LLMScheduler, ResilientClient)):
+            layer = layer.client
+        layer.client = client
@@ -0,0 +1,299 @@
+"""
+Deadlines, hedged requests and circuit breaking for Bedrock calls
+
+Sits between the single-flight gateway and the boto3 client (gateway -> resilience -> client):
+
+- Deadline: every call returns within deadline_s; a call still running upstream is abandoned
+  (it finishes in the background, bounded by the client's read timeout)
+- Hedging: when the first attempt has not answered after the model's recent p95 latency, a second
+  attempt is sent (to the secondary model when one is configured, else the same model); the
+  first successful answer wins. A first attempt that fails fast is retried once the same way -
+  except for throttling, which another request would only make worse
+- Circuit breaker per model: after failure_threshold consecutive failed calls the model is not
+  called for reset_timeout_s; then one probe call decides between closing and re-opening
+
+Callers get LLMUnavailable (circuit open / deadline exceeded / all attempts failed) and degrade:
+see AdviceCache and the rule-based fallbacks in main.py.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from observability import Counter, register, logger
+
+LLM_HEDGES = register(Counter(
+    "llm_hedged_requests_total", "Hedge attempts sent and which attempt answered", ("model", "outcome")))
+LLM_UNAVAILABLE = register(Counter(
+    "llm_unavailable_total", "Bedrock calls given up (reason = circuit_open / deadline / throttled / error)", ("model", "reason")))
+LLM_CIRCUIT_TRANSITIONS = register(Counter(
+    "llm_circuit_transitions_total", "Circuit breaker state changes", ("model", "state")))
+
+THROTTLING_CODES = ("ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException")
+
+
+class LLMUnavailable(Exception):
+    """Bedrock did not answer in time or the model is considered down"""
+
+    def __init__(self, model_id: str, reason: str, detail: str = ""):
+        super().__init__(f"{model_id}: {reason}" + (f" ({detail})" if detail else ""))
+        self.model_id = model_id
+        self.reason = reason
+
+
+def is_throttling(error: BaseException) -> bool:
+    """botocore ClientError with a throttling code (or an exception class of that name)"""
+    response = getattr(error, "response", None)
+    code = response.get("Error", {}).get("Code", "") if isinstance(response, dict) else ""
+    return code in THROTTLING_CODES or type(error).__name__ in THROTTLING_CODES
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures
+    open -> half_open after reset_timeout_s (one probe call allowed)
+    half_open -> closed on success / open on failure
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_s: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            LLM_CIRCUIT_TRANSITIONS.inc(model=self.name, state=state)
+            logger.info("llm_circuit", extra={"fields": {"model": self.name, "state": state}})
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and self.clock() - self.opened_at >= self.reset_timeout_s:
+                self._set_state("half_open")
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+                return True
+            return self.state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self._set_state("open")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class LatencyTracker:
+    """Recent successful call latencies of one model (seconds)"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """None until min_samples calls were seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientClient:
+    """
+    bedrock-runtime client with deadlines, hedging and per-model circuit breakers
+
+    Args:
+        client: boto3 bedrock-runtime client (or a stand-in with the same methods)
+        deadline_s: max seconds per converse / invoke_model call, hedge included
+        hedge_percentile: hedge after this percentile of the model's recent latency
+        hedge_min_s: never hedge earlier than this (also the delay before latency history exists)
+        secondary_models: {primary modelId: modelId to send the hedge to} (converse only)
+        failure_threshold / reset_timeout_s: circuit breaker settings
+        max_workers: max upstream calls in flight (abandoned attempts count until they finish)
+    """
+
+    def __init__(self, client, deadline_s: float = 20.0, hedge_percentile: float = 0.95,
+                 hedge_min_s: float = 2.0, secondary_models: Optional[Dict[str, str]] = None,
+                 failure_threshold: int = 5, reset_timeout_s: float = 30.0, max_workers: int = 32):
+        self.client = client
+        self.deadline_s = deadline_s
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_s = hedge_min_s
+        self.secondary_models = secondary_models or {}
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock")
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def breaker(self, model_id: str) -> CircuitBreaker:
+        with self._lock:
+            if model_id not in self._breakers:
+                self._breakers[model_id] = CircuitBreaker(model_id, self.failure_threshold, self.reset_timeout_s)
+                self._latency[model_id] = LatencyTracker()
+            return self._breakers[model_id]
+
+    def hedge_delay(self, model_id: str) -> float:
+        p = self._latency[model_id].percentile(self.hedge_percentile)
+        return max(self.hedge_min_s, p or 0.0)
+
+    def converse(self, **request) -> Dict:
+        model_id = request["modelId"]
+        return self._call(model_id, lambda model: self.client.converse(**{**request, "modelId": model}),
+                          self.secondary_models.get(model_id, model_id))
+
+    def invoke_model(self, **request) -> Dict:
+        model_id = request["modelId"]
+
+        def call(model):
+            response = self.client.invoke_model(**request)
+            # Read inside the attempt: a stalled body read is part of the call's latency
+            return {**response, "body": _Body(response["body"].read())}
+
+        # Embeddings of another model live in another vector space: hedge to the same model only
+        return self._call(model_id, call, model_id)
+
+    def _call(self, model_id: str, call: Callable[[str], Any], hedge_model: str):
+        breaker = self.breaker(model_id)
+        if not breaker.allow():
+            LLM_UNAVAILABLE.inc(model=model_id, reason="circuit_open")
+            raise LLMUnavailable(model_id, "circuit_open")
+
+        deadline = time.monotonic() + self.deadline_s
+        context = contextvars.copy_context()
+
+        def attempt(model: str):
+            t0 = time.monotonic()
+            result = context.copy().run(call, model)
+            return result, time.monotonic() - t0
+
+        attempts = {self._pool.submit(attempt, model_id): "primary"}
+        hedge_at = time.monotonic() + self.hedge_delay(model_id)
+        last_error = None
+        while attempts:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            hedged = len(attempts) > 1 or last_error is not None
+            timeout = deadline - now if hedged else max(0.0, min(hedge_at, deadline) - now)
+            done, _ = wait(list(attempts), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                role = attempts.pop(future)
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if role == "hedge":
+                    LLM_HEDGES.inc(model=model_id, outcome="hedge_won")
+                else:
+                    self._latency[model_id].add(seconds)
+                breaker.record_success()
+                return result
+            # Hedge once: primary slower than the hedge delay, or failed fast (not throttled)
+            if not hedged and time.monotonic() < deadline:
+                if last_error is not None and is_throttling(last_error):
+                    break
+                if last_error is not None or time.monotonic() >= hedge_at:
+                    LLM_HEDGES.inc(model=model_id, outcome="sent")
+                    attempts[self._pool.submit(attempt, hedge_model)] = "hedge"
+
+        breaker.record_failure()
+        if attempts:
+            LLM_UNAVAILABLE.inc(model=model_id, reason="deadline")
+            raise LLMUnavailable(model_id, "deadline", f"{self.deadline_s:g}s")
+        reason = "throttled" if is_throttling(last_error) else "error"
+        LLM_UNAVAILABLE.inc(model=model_id, reason=reason)
+        raise LLMUnavailable(model_id, reason, str(last_error)) from last_error
+
+    def stats(self) -> Dict:
+        with self._lock:
+            models = list(self._breakers)
+        return {model: {**self._breakers[model].stats(),
+                        "hedge_delay_ms": round(self.hedge_delay(model) * 1000)} for model in models}
+
+
+class _Body:
+    """Already-read response body: read() returns the bytes (the gateway reads each body once)"""
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
+
+
+class AdviceCache:
+    """Last good LLM answer per key (LRU), served while Bedrock is unavailable"""
+
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key: str, advice: str):
+        with self._lock:
+            self._entries[key] = advice
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            advice = self._entries.get(key)
+            if advice is not None:
+                self._entries.move_to_end(key)
+            return advice
+
+
+def parse_model_map(value: str) -> Dict[str, str]:
+    """"primary=secondary,primary2=secondary2" -> dict"""
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {primary.strip(): secondary.strip() for primary, secondary in pairs}
+
+
+def resilience_settings() -> Dict:
+    """ResilientClient settings from the environment"""
+    return {
+        "deadline_s": float(os.getenv("LLM_DEADLINE_S", "20")),
+        "hedge_percentile": float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+        "hedge_min_s": float(os.getenv("LLM_HEDGE_MIN_S", "2")),
+        "secondary_models": parse_model_map(os.getenv("LLM_SECONDARY_MODELS", "")),
+        "failure_threshold": int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        "reset_timeout_s": float(os.getenv("LLM_BREAKER_RESET_S", "30")),
+    }
@@ -0,0 +1,295 @@
+"""
+Priority-aware admission for Bedrock calls, paced by per-model token buckets
+
+Every upstream call (after single-flight coalescing) waits here for its turn:
+
+- Priority classes: alert (safety alerts) > interactive (API / chat) > batch (PDF ingestion).
+  The class comes from the calling context: `with llm_priority("batch"): ...`; default interactive
+- Per-model token buckets for requests/min and tokens/min (estimated input + maxTokens), so calls
+  are paced below the Bedrock quota instead of being throttled and retried
+- Lower classes leave headroom: they may not take a bucket below its reserve fraction, and batch
+  may hold at most batch_max_concurrent of the max_concurrent slots - bulk work cannot starve alerts
+- Bounded queue with admission control: when it is full a new call displaces the lowest-priority
+  waiting call if it outranks it, otherwise it is rejected at once; a call that waits longer than
+  its class's max wait is rejected too (LLMRejected, a kind of LLMUnavailable)
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from llm_resilience import LLMUnavailable
+from observability import Counter, Histogram, register
+from tokens import estimate_tokens, messages_tokens
+
+PRIORITIES = {"alert": 0, "interactive": 1, "batch": 2}
+DEFAULT_MAX_WAIT_S = {"alert": 60.0, "interactive": 15.0, "batch": 600.0}
+DEFAULT_RESERVE = {"alert": 0.0, "interactive": 0.1, "batch": 0.3}
+DEFAULT_MAX_TOKENS = 512  # converse output budget when inferenceConfig.maxTokens is not set
+
+LLM_SCHEDULED = register(Counter(
+    "llm_scheduler_requests_total", "Bedrock calls by priority and admission outcome", ("priority", "outcome")))
+LLM_QUEUE_WAIT = register(Histogram(
+    "llm_scheduler_wait_seconds", "Time waiting for a slot / bucket before the Bedrock call", ("priority",)))
+
+_priority = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+@contextlib.contextmanager
+def llm_priority(name: str):
+    """Run the Bedrock calls made inside the block with this priority class"""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    """Priority class of the calling context"""
+    return _priority.get()
+
+
+def with_llm_priority(name: str, fn: Callable) -> Callable:
+    """fn with every Bedrock call it makes in priority class name"""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+
+    def wrapper(*args, **kwargs):
+        with llm_priority(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class LLMRejected(LLMUnavailable):
+    """Not admitted: queue full / displaced by a higher priority call / waited too long"""
+
+
+class TokenBucket:
+    """capacity tokens, refilled continuously at rate tokens per second"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.level = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until amount can be taken leaving reserve (fraction of capacity); 0 = now"""
+        self._refill()
+        target = min(self.capacity, min(amount, self.capacity) + reserve * self.capacity)
+        needed = target - self.level
+        return max(0.0, needed / self.rate) if self.rate > 0 else (0.0 if needed <= 0 else float("inf"))
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+@dataclass
+class ModelLimits:
+    requests_per_min: float
+    tokens_per_min: float
+
+
+@dataclass(order=True)
+class _Ticket:
+    rank: int
+    seq: int
+    priority: str = field(compare=False)
+    model_id: str = field(compare=False)
+    cost: float = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    state: str = field(default="waiting", compare=False)  # waiting / granted / rejected
+
+
+class LLMScheduler:
+    """
+    Bedrock client wrapper: converse() / invoke_model() are admitted by priority before the call
+
+    Args:
+        client: the next layer (ResilientClient or a bedrock-runtime client)
+        limits: {modelId: ModelLimits}; models not listed get default_limits
+        default_limits: limits for other models
+        max_concurrent: upstream calls in flight at once
+        batch_max_concurrent: of those, at most this many batch calls
+        max_queue: calls waiting for admission
+        max_wait_s / reserve: per priority class, see module docstring
+    """
+
+    def __init__(self, client, limits: Optional[Dict[str, ModelLimits]] = None,
+                 default_limits: ModelLimits = ModelLimits(100, 200000), max_concurrent: int = 16,
+                 batch_max_concurrent: int = 4, max_queue: int = 200,
+                 max_wait_s: Optional[Dict[str, float]] = None, reserve: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        self.limits = limits or {}
+        self.default_limits = default_limits
+        self.max_concurrent = max_concurrent
+        self.batch_max_concurrent = batch_max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_s = {**DEFAULT_MAX_WAIT_S, **(max_wait_s or {})}
+        self.reserve = {**DEFAULT_RESERVE, **(reserve or {})}
+        self.clock = clock
+        self._buckets: Dict[str, tuple] = {}
+        self._waiting = []  # heap of _Ticket: priority rank, then arrival
+        self._running = {name: 0 for name in PRIORITIES}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.counters = {"admitted": 0, "rejected_queue_full": 0, "displaced": 0, "rejected_wait": 0}
+
+    def __getattr__(self, name):
+        if name == "client":
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    # ---- Bedrock client interface ----
+    def converse(self, **request) -> Dict:
+        max_tokens = request.get("inferenceConfig", {}).get("maxTokens", DEFAULT_MAX_TOKENS)
+        system = sum(estimate_tokens(block.get("text", "")) for block in request.get("system", []))
+        cost = messages_tokens(request.get("messages", [])) + system + max_tokens
+        return self.run(request["modelId"], cost, lambda: self.client.converse(**request))
+
+    def invoke_model(self, **request) -> Dict:
+        body = request.get("body", "")
+        try:
+            cost = estimate_tokens(json.loads(body).get("inputText", ""))
+        except (ValueError, AttributeError):
+            cost = estimate_tokens(body if isinstance(body, str) else "")
+        return self.run(request["modelId"], cost, lambda: self.client.invoke_model(**request))
+
+    # ---- Scheduling ----
+    def _model_buckets(self, model_id: str):
+        if model_id not in self._buckets:
+            limits = self.limits.get(model_id, self.default_limits)
+            self._buckets[model_id] = (TokenBucket(limits.requests_per_min / 60, limits.requests_per_min, self.clock),
+                                       TokenBucket(limits.tokens_per_min / 60, limits.tokens_per_min, self.clock))
+        return self._buckets[model_id]
+
+    def _blocked_for(self, ticket: _Ticket) -> Optional[float]:
+        """None when ticket may start now, else seconds worth waiting before checking again"""
+        # Strict priority per model: an earlier / higher-priority waiter for the same model goes first
+        if any(t.model_id == ticket.model_id and t < ticket for t in self._waiting):
+            return 1.0
+        if sum(self._running.values()) >= self.max_concurrent:
+            return 1.0
+        if ticket.priority == "batch" and self._running["batch"] >= self.batch_max_concurrent:
+            return 1.0
+        requests, tokens = self._model_buckets(ticket.model_id)
+        reserve = self.reserve[ticket.priority]
+        wait = max(requests.wait_time(1, reserve), tokens.wait_time(ticket.cost, reserve))
+        return wait or None
+
+    def _enqueue(self, ticket: _Ticket):
+        if len(self._waiting) >= self.max_queue:
+            worst = max(self._waiting)
+            if ticket < worst and worst.rank > ticket.rank:
+                # Displace the lowest-priority waiter (it is rejected, the new call takes its place)
+                self._waiting.remove(worst)
+                heapq.heapify(self._waiting)
+                worst.state = "rejected"
+                self._cond.notify_all()
+                self.counters["displaced"] += 1
+                LLM_SCHEDULED.inc(priority=worst.priority, outcome="displaced")
+            else:
+                self.counters["rejected_queue_full"] += 1
+                LLM_SCHEDULED.inc(priority=ticket.priority, outcome="queue_full")
+                raise LLMRejected(ticket.model_id, "queue_full", f"{len(self._waiting)} waiting")
+        heapq.heappush(self._waiting, ticket)
+
+    def _admit(self, model_id: str, cost: float, priority: str) -> _Ticket:
+        now = self.clock()
+        ticket = _Ticket(PRIORITIES[priority], next(self._seq), priority, model_id, cost, now)
+        deadline = now + self.max_wait_s[priority]
+        with self._cond:
+            self._enqueue(ticket)
+            while True:
+                if ticket.state == "rejected":
+                    self._cond.notify_all()
+                    raise LLMRejected(model_id, "displaced", f"queue full, {priority} call displaced")
+                wait = self._blocked_for(ticket)
+                if wait is None:
+                    break
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self.counters["rejected_wait"] += 1
+                    LLM_SCHEDULED.inc(priority=priority, outcome="wait_timeout")
+                    self._cond.notify_all()
+                    raise LLMRejected(model_id, "wait_timeout", f"{priority} waited {self.max_wait_s[priority]:g}s")
+                self._cond.wait(timeout=min(wait, remaining))
+
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            requests, tokens = self._model_buckets(model_id)
+            requests.take(1)
+            tokens.take(cost)
+            self._running[priority] += 1
+            ticket.state = "granted"
+            self.counters["admitted"] += 1
+            # The next waiter for another model may be startable too
+            self._cond.notify_all()
+        LLM_SCHEDULED.inc(priority=priority, outcome="admitted")
+        LLM_QUEUE_WAIT.observe(self.clock() - now, priority=priority)
+        return ticket
+
+    def _release(self, ticket: _Ticket):
+        with self._cond:
+            self._running[ticket.priority] -= 1
+            self._cond.notify_all()
+
+    def run(self, model_id: str, cost: float, fn: Callable[[], Any], priority: Optional[str] = None):
+        """Call fn once admitted (blocking); raises LLMRejected when not admitted"""
+        ticket = self._admit(model_id, cost, priority or current_priority())
+        try:
+            return fn()
+        finally:
+            self._release(ticket)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            waiting = {name: sum(1 for t in self._waiting if t.priority == name) for name in PRIORITIES}
+            buckets = {model: {"requests_available": round(requests.level, 1),
+                               "tokens_available": round(tokens.level)}
+                       for model, (requests, tokens) in self._buckets.items()}
+            return {"waiting": waiting, "running": dict(self._running), "max_queue": self.max_queue,
+                    "max_concurrent": self.max_concurrent, **self.counters, "buckets": buckets}
+
+
+def parse_limits(value: str) -> Dict[str, ModelLimits]:
+    """"model=rpm:tpm,model2=rpm:tpm" -> {model: ModelLimits}"""
+    limits = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        model_id, _, rates = item.strip().partition("=")
+        rpm, _, tpm = rates.partition(":")
+        limits[model_id] = ModelLimits(float(rpm), float(tpm))
+    return limits
+
+
+def scheduler_settings() -> Dict:
+    """LLMScheduler settings from the environment"""
+    return {
+        "limits": parse_limits(os.getenv("LLM_RATE_LIMITS", "")),
+        "default_limits": ModelLimits(float(os.getenv("LLM_DEFAULT_RPM", "100")),
+                                      float(os.getenv("LLM_DEFAULT_TPM", "200000"))),
+        "max_concurrent": int(os.getenv("LLM_MAX_CONCURRENT", "16")),
+        "batch_max_concurrent": int(os.getenv("LLM_BATCH_MAX_CONCURRENT", "4")),
+        "max_queue": int(os.getenv("LLM_QUEUE_SIZE", "200")),
+    }
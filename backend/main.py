@@ -1,11 +1,11 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import hashlib
 import hmac
 import base64
-import boto3
 import json
 import os
 import pandas as pd
@@ -14,12 +14,27 @@ from datetime import datetime
 from io import StringIO
 from dotenv import load_dotenv
 from configs import SensorReadings, MachineData, ChatMessage
-from retrivals import load_embeddings_from_file, search_query_in_embeddings
+from retrivals import search_manual
+from MaintenanceManuleTool import load_manual
 from BreakdownMaintenanceAdviceTool import BreakdownMaintenanceAdviceTool
-from Orchestrator import Orchestrator
+from BreakdownPredictionTool import BreakdownPredictionTool
+from Orchestrator import get_orchestrator
+from llm_gateway import get_llm_gateway
+from llm_resilience import LLMUnavailable, AdviceCache
+from llm_scheduler import with_llm_priority
+from chat_sessions import ChatSessionStore
+from tokens import messages_tokens
+from prompt_builder import build_repair_prompt, build_sensor_advice_prompt, build_prediction_prompt, record_usage
 import uploads
 from ml_predictor import get_predictor
+from ml_explainer import get_explainer
 from line_bot import get_line_notifier
+from line_delivery import get_line_delivery
+from line_store import get_line_store
+from line_webhook import WebhookProcessor
+from observability import span, install as install_observability
+from alert_worker import AlertWorker, AlertEvent, alert_hash
+from alert_dedupe import AlertDeduper
 
 # Load environment variables
 
@@ -37,15 +52,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# AWS Bedrock client
-bedrock_runtime = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2'
-)
+# Request IDs, stage timings, JSON logs and GET /metrics
+install_observability(app)
+
+# AWS Bedrock client (shared connection pool, identical in-flight calls coalesced)
+bedrock_runtime = get_llm_gateway('us-west-2')
 
 # Sensor threshold analysis
 maintenance_tool = BreakdownMaintenanceAdviceTool()
 
+# Last good LLM advice per alert set, served while Bedrock is unavailable (circuit open / deadline)
+advice_cache = AdviceCache(max_entries=int(os.getenv("ADVICE_CACHE_SIZE", "500")))
+
 # In-memory data storage (replace with database in production)
 uploaded_data_store = {
     "dataframe": None,
@@ -53,12 +71,15 @@ uploaded_data_store = {
     "metadata": {}
 }
 
-# LINE Bot users storage (replace with database in production)
-line_users_store = {
-    "users": [],  # List of LINE user IDs
-    "alert_settings": {},  # User-specific alert settings
-    "sent_alerts": {}  # Track sent alerts: {machine_id: {timestamp: alert_hash}}
-}
+# Orchestrator chat sessions: LRU-bounded, history kept to a token budget per session
+chat_sessions = ChatSessionStore(
+    max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "1000")),
+    ttl_s=float(os.getenv("CHAT_SESSION_TTL_MIN", "60")) * 60,
+    history_token_budget=int(os.getenv("CHAT_HISTORY_TOKENS", "2000"))
+)
+
+# LINE Bot users, alert settings and last alert sent per machine (SQLite, shared by all workers)
+line_store = get_line_store()
 
 def clean_sensor_data(df: pd.DataFrame) -> pd.DataFrame:
     """Clean and organize sensor data"""
@@ -98,6 +119,26 @@ def convert_sensor_names_to_tool_format(sensor_dict: dict) -> dict:
     }
     return {mapping.get(k, k): v for k, v in sensor_dict.items()}
 
+def advice_cache_key(kind: str, alert_codes: Dict[str, str], machine_type: str = "") -> str:
+    return f"{kind}:{machine_type}:" + alert_hash([f"{k}:{v}" for k, v in alert_codes.items()])
+
+def degraded_advice(cache_key: str, sensor_dict: dict) -> Tuple[str, str]:
+    """
+    คำแนะนำเมื่อ Bedrock ไม่พร้อมใช้งาน: คำแนะนำล่าสุดของปัญหาเดียวกันจาก cache
+    หรือผลวิเคราะห์ตามกฎของ BreakdownPredictionTool
+
+    Returns:
+        (advice, source) โดย source เป็น "cache" หรือ "rules"
+    """
+    cached = advice_cache.get(cache_key)
+    if cached is not None:
+        return cached, "cache"
+    readings = {name: value for name, value in sensor_dict.items() if value is not None}
+    rules = BreakdownPredictionTool.analyze_sensors(convert_sensor_names_to_tool_format(readings))
+    lines = [f"ระบบ AI ไม่พร้อมใช้งานชั่วคราว ผลวิเคราะห์ตามเกณฑ์ (ความเสี่ยง{rules['risk_level']}): {rules['prediction']}"]
+    lines += [f"- {factor}" for factor in rules["risk_factors"]]
+    return "\n".join(lines), "rules"
+
 # API Endpoints
 @app.get("/")
 def read_root():
@@ -222,6 +263,107 @@ async def get_machines():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def generate_alert_advice(event: AlertEvent) -> str:
+    """คำแนะนำการซ่อมจากคู่มือ (RAG + Qwen) สำหรับ alert ที่ตรวจพบ"""
+    repair_advice = "กรุณาตรวจสอบเครื่องจักร"
+    try:
+        # คู่มือแบ่งเป็น chunk ตามหัวข้อ/ความยาว พร้อม embeddings (โหลดครั้งเดียวแล้ว cache)
+        with span("embedding_load"):
+            embeddings, texts = load_manual()
+
+        query_text = "ปัญหาที่พบ: " + ", ".join(event.alerts)
+
+        # ค้นหาข้อความที่เกี่ยวข้องในคู่มือ (BM25 / embeddings ตาม RETRIEVAL_MODE)
+        results = search_manual(query_text, embeddings, texts)
+
+        prompt = build_repair_prompt(query_text, results)
+
+        # ส่งคำขอไปยังโมเดล qwen.qwen3-32b-v1:0 ผ่าน API
+        with span("llm_call", model="qwen.qwen3-32b-v1:0"):
+            response_body = bedrock_runtime.converse(
+                modelId="qwen.qwen3-32b-v1:0",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [{"text": prompt.text}]
+                    }
+                ],
+                inferenceConfig={
+                    "maxTokens": 1024
+                }
+            )
+        record_usage(prompt, response_body, model="qwen.qwen3-32b-v1:0")
+        repair_advice = response_body['output']['message']['content'][0]['text']
+        advice_cache.put(f"alert:{event.alert_hash}", repair_advice)
+    except LLMUnavailable as e:
+        print(f"⚠️ Bedrock unavailable, fallback advice: {str(e)}")
+        repair_advice, _ = degraded_advice(f"alert:{event.alert_hash}", event.sensor_readings)
+    except Exception as e:
+        print(f"⚠️ RAG failed: {str(e)}")
+    return repair_advice
+
+
+def deliver_alert(event: AlertEvent, repair_advice: str) -> int:
+    """ส่ง alert ไปยังผู้ใช้ LINE ที่เปิดรับแจ้งเตือน (raise เมื่อส่งไม่สำเร็จเลย เพื่อให้ worker retry)"""
+    line_notifier = get_line_notifier()
+    messages = line_notifier.create_flex_alert_message(
+        machine_id=event.machine_id,
+        alerts=event.alerts,
+        risk_score=event.risk_score,
+        risk_level=event.risk_level,
+        sensor_readings=event.sensor_readings,
+        repair_advice=repair_advice
+    )
+
+    recipients = line_store.alert_recipients()
+    # Same retry key per batch on every worker retry: batches LINE already accepted are not sent again
+    report = get_line_delivery().deliver(recipients, messages, retry_key_seed=event.delivery_id)
+    if recipients and report.sent == 0:
+        raise RuntimeError(f"LINE delivery failed for all {len(recipients)} users")
+    return report.sent
+
+
+# Alert suppression: per-machine cooldown, escalation on severity increase
+alert_deduper = AlertDeduper(
+    cooldown_s=float(os.getenv("ALERT_COOLDOWN_MIN", "30")) * 60,
+    ttl_s=float(os.getenv("ALERT_STATE_TTL_HOURS", "24")) * 3600
+)
+
+# Background alert pipeline (advice -> LINE fan-out), bounded queue
+alert_worker = AlertWorker(
+    # Safety alerts go ahead of interactive and batch Bedrock calls
+    advice_fn=with_llm_priority("alert", generate_alert_advice),
+    deliver_fn=deliver_alert,
+    on_failure=lambda event: alert_deduper.forget(event.machine_id),
+    queue_size=int(os.getenv("ALERT_QUEUE_SIZE", "100")),
+    workers=int(os.getenv("ALERT_WORKERS", "4")),
+    max_retries=int(os.getenv("ALERT_MAX_RETRIES", "3"))
+)
+
+
+@app.on_event("startup")
+async def start_alert_worker():
+    alert_worker.start()
+
+
+@app.on_event("shutdown")
+async def stop_alert_worker():
+    await alert_worker.stop()
+
+
+@app.get("/api/alerts/queue")
+async def get_alert_queue_stats():
+    """สถานะคิวแจ้งเตือน (queue depth, delivered, retried, rejected), การกรองแจ้งเตือนซ้ำ และการรวมคำขอ Bedrock ที่ซ้ำกัน"""
+    return {**alert_worker.stats(), "dedupe": alert_deduper.stats(), "llm_gateway": bedrock_runtime.stats()}
+
+
+@app.get("/api/llm/status")
+async def get_llm_status():
+    """สถานะการเรียก Bedrock: การรวมคำขอที่ซ้ำกัน, คิวตามลำดับความสำคัญ และ circuit breaker / hedge delay ของแต่ละโมเดล"""
+    scheduler = bedrock_runtime.client
+    return {"gateway": bedrock_runtime.stats(), "scheduler": scheduler.stats(), "models": scheduler.client.stats()}
+
+
 @app.get("/api/machine-data/{machine_id}")
 async def get_machine_data(machine_id: str, limit: int = 100):
     """ดึงข้อมูลล่าสุดของเครื่องจักร"""
@@ -256,100 +398,33 @@ async def get_machine_data(machine_id: str, limit: int = 100):
         # Analyze current status
         analysis = maintenance_tool.analyze_sensors(sensor_data)
 
-        # Auto-send LINE alert if there are warnings (ONCE per problem)
-        if analysis['alerts']:
-            # Calculate risk score
-            risk_score = len(analysis['alerts']) * 15
-            risk_level = "ต่ำ" if risk_score < 30 else "ปานกลาง" if risk_score < 60 else "สูง"
-
-            # Create unique alert hash from alerts
-            alert_hash = hashlib.md5(
-                "|".join(sorted(analysis['alerts'])).encode('utf-8')
-            ).hexdigest()
-
-            # Check if we already sent this exact alert
-            last_sent = line_users_store["sent_alerts"].get(machine_id, {})
-            if last_sent.get("alert_hash") == alert_hash:
-                print(f"⏭️  Skip duplicate alert for {machine_id} (already sent)")
-            else:
-                # Send LINE alert with repair instructions
-                try:
-                    line_notifier = get_line_notifier()
-                    if line_notifier.is_configured() and line_users_store["users"]:
-                        # Get detailed repair manual from RAG
-                        repair_advice = "กรุณาตรวจสอบเครื่องจักร"
-                        try:
-                            backend_dir = os.path.dirname(os.path.abspath(__file__))
-                            embeddings_file_path = os.path.join(backend_dir, "embeddings.json")
-                            manuls_file_path = os.path.join(backend_dir, "manuls.txt")
-
-                            embeddings = load_embeddings_from_file(embeddings_file_path)
-
-                            with open(manuls_file_path, "r", encoding="utf-8") as file:
-                                text_fitz = file.read()  # อ่านเนื้อหาทั้งหมดในไฟล์
-
-                            # แบ่งข้อความตามบรรทัด
-                            texts_strip = text_fitz.split("\n")  # หรือแบ่งตามพารากราฟได้
-
-                            # กรองข้อความว่างออก
-                            texts = [text for text in texts_strip if text.strip()]
-
-                            # ตรวจสอบว่ามีการรับ query_text จาก request หรือไม่
-                            query_text = "ปัญหาที่พบ: " + ", ".join(analysis['alerts'])
-
-                            # ค้นหาคำถามใน embeddings
-                            results = search_query_in_embeddings(query_text, embeddings, texts)
-
-                            prompt = f"""คุณเป็นผู้เชี่ยวชาญด้านการซ่อมบำรุงเครื่องจักรโรงงานน้ำตาล โดยเฉพาะระบบ Feed Mill
-
-คำถาม: {query_text}
-โดยใช้เนื้อหาจาก: {results}
-
-กรุณาตอบคำถามเกี่ยวกับการซ่อมบำรุงอย่างละเอียด รวมถึง:
-ขั้นตอนการซ่อม
-อุปกรณ์ที่ต้องใช้
-ข้อควรระวัง
-เวลาที่ใช้โดยประมาณ"""
-
-                            # ส่งคำขอไปยังโมเดล qwen.qwen3-32b-v1:0 ผ่าน API
-                            response_body = bedrock_runtime.converse(
-                                modelId="qwen.qwen3-32b-v1:0",
-                                messages=[
-                                    {
-                                        "role": "user",
-                                        "content": [{"text": prompt}]
-                                    }
-                                ],
-                                inferenceConfig={
-                                    "maxTokens": 1024
-                                }
-                            )
-                            repair_advice = response_body['output']['message']['content'][0]['text']
-                        except Exception as e:
-                            print(f"⚠️ RAG failed: {str(e)}")
-
-                        messages = line_notifier.create_flex_alert_message(
-                            machine_id=machine_id,
-                            alerts=analysis['alerts'],
-                            risk_score=risk_score,
-                            risk_level=risk_level,
-                            sensor_readings=sensor_data,
-                            repair_advice=repair_advice
-                        )
-
-                        # Send to all users with alerts enabled
-                        for user_id in line_users_store["users"]:
-                            if line_users_store["alert_settings"].get(user_id, True):
-                                line_notifier.send_push_message(user_id, messages)
-                                print(f"📤 Auto-alert sent to LINE user: {user_id} for {machine_id}")
-
-                        # Mark as sent
-                        line_users_store["sent_alerts"][machine_id] = {
-                            "alert_hash": alert_hash,
-                            "timestamp": latest['Timestamp'].isoformat()
-                        }
-                except Exception as e:
-                    print(f"⚠️ Failed to send auto LINE alert: {str(e)}")
+        # Queue a LINE alert for new / escalated problems (dedupe on sensor + severity band, with cooldown);
+        # advice generation and delivery happen in the background alert worker
+        alert_status = None
+        line_notifier = get_line_notifier()
+        if line_notifier.is_configured() and await asyncio.to_thread(line_store.count_users):
+            decision = alert_deduper.evaluate(machine_id, analysis['alert_codes'])
+            alert_status = decision.reason
+            if decision.send:
+                # Calculate risk score
+                risk_score = len(analysis['alerts']) * 15
+                risk_level = "ต่ำ" if risk_score < 30 else "ปานกลาง" if risk_score < 60 else "สูง"
+
+                queued = alert_worker.enqueue(AlertEvent(
+                    machine_id=machine_id,
+                    alerts=analysis['alerts'],
+                    sensor_readings=sensor_data,
+                    risk_score=risk_score,
+                    risk_level=risk_level,
+                    timestamp=latest['Timestamp'].isoformat(),
+                    alert_hash=alert_hash([f"{k}:{v}" for k, v in analysis['alert_codes'].items()])
+                ))
+                if queued != "queued":
+                    # Not going out: let the next reading try again
+                    alert_deduper.forget(machine_id)
+                    alert_status = queued
+            elif decision.reason == "suppressed":
+                print(f"⏭️  Skip duplicate alert for {machine_id} (same severity, within cooldown)")
 
         return {
             "machine_id": machine_id,
@@ -357,13 +432,58 @@ async def get_machine_data(machine_id: str, limit: int = 100):
             "sensor_readings": sensor_data,
             "alerts": analysis['alerts'],
             "status_summary": analysis['status_summary'],
-            "historical_count": len(machine_df)
+            "historical_count": len(machine_df),
+            "alert_status": alert_status
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def generate_sensor_advice(machine_type: str, sensor_dict: Dict, alerts: List[str],
+                           alert_codes: Dict[str, str]) -> Tuple[str, str]:
+    """คำแนะนำการซ่อมจากคู่มือ (RAG + Qwen) สำหรับ sensor ที่ผิดปกติ: (advice, source)"""
+    cache_key = advice_cache_key("sensor", alert_codes, machine_type)
+    try:
+        # คู่มือแบ่งเป็น chunk ตามหัวข้อ/ความยาว พร้อม embeddings (โหลดครั้งเดียวแล้ว cache)
+        with span("embedding_load"):
+            embeddings, texts = load_manual()
+
+        # ตรวจสอบว่ามีการรับ query_text จาก request หรือไม่
+        query_text = f"ปัญหาเครื่องจักร {machine_type}: " + ", ".join(alerts)
+
+        # ค้นหาข้อความที่เกี่ยวข้องในคู่มือ (BM25 / embeddings ตาม RETRIEVAL_MODE)
+        results = search_manual(query_text, embeddings, texts)
+
+        prompt = build_sensor_advice_prompt(query_text, results, sensor_dict, alerts)
+
+        # ส่งคำขอไปยังโมเดล qwen.qwen3-32b-v1:0 ผ่าน API
+        with span("llm_call", model="qwen.qwen3-32b-v1:0"):
+            response_body = bedrock_runtime.converse(
+                modelId="qwen.qwen3-32b-v1:0",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [{"text": prompt.text}]
+                    }
+                ],
+                inferenceConfig={
+                    "maxTokens": 1024
+                }
+            )
+        record_usage(prompt, response_body, model="qwen.qwen3-32b-v1:0")
+        maintenance_advice = response_body['output']['message']['content'][0]['text']
+        advice_cache.put(cache_key, maintenance_advice)
+        return maintenance_advice, "llm"
+
+    except LLMUnavailable as e:
+        print(f"⚠️ Bedrock unavailable, fallback advice: {str(e)}")
+        return degraded_advice(cache_key, sensor_dict)
+    except Exception as e:
+        print(f"⚠️ RAG lookup failed: {str(e)}")
+        return f"เกิดข้อผิดพลาดในการค้นหาคู่มือ: {str(e)}", "error"
+
+
 @app.post("/api/analyze-sensors")
 async def analyze_sensors(data: MachineData):
     """วิเคราะห์ข้อมูล sensor และให้คำแนะนำ"""
@@ -373,78 +493,14 @@ async def analyze_sensors(data: MachineData):
         sensor_dict_for_tool = convert_sensor_names_to_tool_format(sensor_dict)
         analysis = maintenance_tool.analyze_sensors(sensor_dict_for_tool)
 
-        # Generate maintenance advice using AWS Bedrock with RAG
+        # Generate maintenance advice using AWS Bedrock with RAG (blocking calls run in a worker thread)
         if analysis['alerts']:
-            try:
-                # Get the backend directory path
-                backend_dir = os.path.dirname(os.path.abspath(__file__))
-                embeddings_file_path = os.path.join(backend_dir, "embeddings.json")
-                manuls_file_path = os.path.join(backend_dir, "manuls.txt")
-
-                embeddings = load_embeddings_from_file(embeddings_file_path)
-
-                with open(manuls_file_path, "r", encoding="utf-8") as file:
-                    text_fitz = file.read()  # อ่านเนื้อหาทั้งหมดในไฟล์
-
-                # แบ่งข้อความตามบรรทัด
-                texts_strip = text_fitz.split("\n")  # หรือแบ่งตามพารากราฟได้
-
-                # กรองข้อความว่างออก
-                texts = [text for text in texts_strip if text.strip()]
-
-                # ตรวจสอบว่ามีการรับ query_text จาก request หรือไม่
-                query_text = f"ปัญหาเครื่องจักร {data.machine_type}: " + ", ".join(analysis['alerts'])
-
-                # ค้นหาคำถามใน embeddings
-                results = search_query_in_embeddings(query_text, embeddings, texts)
-
-                prompt = f"""คุณเป็นผู้เชี่ยวชาญด้านการซ่อมบำรุงเครื่องจักรโรงงานน้ำตาล โดยเฉพาะระบบ Feed Mill
-
-คำถาม: {query_text}
-โดยใช้เนื้อหาจาก: {results}
-
-ข้อมูล Sensor:
-{json.dumps(sensor_dict, indent=2, ensure_ascii=False)}
-
-ปัญหาที่พบ:
-{chr(10).join(analysis['alerts'])}
-
-ข้อมูลเปรียบเทียบค่าปกติของแต่ละ sensor:
-- ค่าปกติของ PowerMotor อยู่ในช่วง 290-315 kW
-- ค่าปกติของ CurrentMotor อยู่ในช่วง 280–320 Amp
-- ค่าปกติของ TempBrassBearingDE อยู่ในช่วง < 75°C
-- ค่าปกติของ SpeedMotor อยู่ในช่วง 1480–1495 rpm
-- ค่าปกติของ TempOilGear อยู่ในช่วง < 65°C
-- ค่าปกติของ TempBearingMotorNDE อยู่ในช่วง < 85°C
-- ค่าปกติของ TempWindingMotorPhase_U/V/W อยู่ในช่วง < 105°C
-
-กรุณาตอบคำถามเกี่ยวกับการซ่อมบำรุงอย่างละเอียด รวมถึง:
-ขั้นตอนการซ่อม
-อุปกรณ์ที่ต้องใช้
-ข้อควรระวัง
-เวลาที่ใช้โดยประมาณ"""
-
-                # ส่งคำขอไปยังโมเดล qwen.qwen3-32b-v1:0 ผ่าน API
-                response_body = bedrock_runtime.converse(
-                    modelId="qwen.qwen3-32b-v1:0",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [{"text": prompt}]
-                        }
-                    ],
-                    inferenceConfig={
-                        "maxTokens": 1024
-                    }
-                )
-                maintenance_advice = response_body['output']['message']['content'][0]['text']
-
-            except Exception as e:
-                print(f"⚠️ RAG lookup failed: {str(e)}")
-                maintenance_advice = f"เกิดข้อผิดพลาดในการค้นหาคู่มือ: {str(e)}"
+            maintenance_advice, advice_source = await asyncio.to_thread(
+                generate_sensor_advice, data.machine_type, sensor_dict, analysis['alerts'], analysis['alert_codes'])
 
         else:
             maintenance_advice = "เครื่องจักรทำงานปกติ ไม่พบความผิดปกติ"
+            advice_source = "rules"
 
         return {
             "timestamp": data.timestamp,
@@ -452,11 +508,32 @@ async def analyze_sensors(data: MachineData):
             "sensor_readings": sensor_dict,
             "alerts": analysis['alerts'],
             "status_summary": analysis['status_summary'],
-            "recommended_action": maintenance_advice
+            "recommended_action": maintenance_advice,
+            "advice_source": advice_source
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def generate_breakdown_prediction(prompt) -> str:
+    """คำทำนายความเสี่ยงจาก Qwen (blocking)"""
+    with span("llm_call", model="qwen.qwen3-32b-v1:0"):
+        response = bedrock_runtime.converse(
+            modelId="qwen.qwen3-32b-v1:0",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [{"text": prompt.text}]
+                }
+            ],
+            inferenceConfig={
+                "maxTokens": 1024
+            }
+        )
+    record_usage(prompt, response, model="qwen.qwen3-32b-v1:0")
+    prediction = response['output']['message']['content'][0]['text']
+    return prediction
+
+
 @app.post("/api/predict-breakdown")
 async def predict_breakdown(data: MachineData):
     """ทำนายความเสี่ยงของการพังของเครื่องจักร"""
@@ -470,23 +547,7 @@ async def predict_breakdown(data: MachineData):
         risk_score = len(analysis['alerts']) * 10
         risk_level = "ต่ำ" if risk_score < 30 else "ปานกลาง" if risk_score < 60 else "สูง"
 
-        prompt = f"""ทำนายความเสี่ยงของการเสียหายของเครื่องจักร {data.machine_type}:
-
-ข้อมูล Sensor:
-{json.dumps(sensor_dict, indent=2, ensure_ascii=False)}
-
-ปัญหาที่พบ:
-{chr(10).join(analysis['alerts']) if analysis['alerts'] else 'ไม่พบปัญหา'}
-
-คะแนนความเสี่ยง: {risk_score}/100
-ระดับความเสี่ยง: {risk_level}
-
-รหัสเครื่องจักรนี้คือ ABB M3BP355SMB4
-
-โดยให้คำทำนายเกี่ยวกับ:
-1. โอกาสที่เครื่องจักรจะเสียหาย
-2. อายุการใช้งานโดยประมาณที่เหลืออยู่
-3. ส่วนประกอบที่มีความเสี่ยงสูงสุด"""
+        prompt = build_prediction_prompt(data.machine_type, sensor_dict, analysis['alerts'], risk_score, risk_level)
         
         
         # response = bedrock_runtime.invoke_model(
@@ -506,33 +567,32 @@ async def predict_breakdown(data: MachineData):
         # response_body = json.loads(response['body'].read())
         # prediction = response_body['content'][0]['text']
         # ส่งคำขอไปยังโมเดล qwen.qwen3-32b-v1:0 ผ่าน API
-        response = bedrock_runtime.converse(
-            modelId="qwen.qwen3-32b-v1:0",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [{"text": prompt}]
-                }
-            ],
-            inferenceConfig={
-                "maxTokens": 1024
-            }
-        )
-        prediction = response['output']['message']['content'][0]['text']
+        cache_key = advice_cache_key("prediction", analysis['alert_codes'], data.machine_type)
+        try:
+            prediction = await asyncio.to_thread(generate_breakdown_prediction, prompt)
+            advice_cache.put(cache_key, prediction)
+            prediction_source = "llm"
+        except LLMUnavailable as e:
+            print(f"⚠️ Bedrock unavailable, fallback prediction: {str(e)}")
+            prediction, prediction_source = degraded_advice(cache_key, sensor_dict)
 
         return {
             "machine_type": data.machine_type,
             "risk_score": risk_score,
             "risk_level": risk_level,
             "prediction": prediction,
+            "prediction_source": prediction_source,
             "alerts": analysis['alerts']
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/predict-ml-breakdown")
-async def predict_ml_breakdown(data: MachineData):
-    """ทำนายความเสี่ยงด้วย ML Model (pm_model_fullpipeline.py)"""
+async def predict_ml_breakdown(data: MachineData, explain: bool = False, top_k: int = 5):
+    """ทำนายความเสี่ยงด้วย ML Model (pm_model_fullpipeline.py)
+
+    explain=true แนบ SHAP contributions ของ sensor ที่มีผลต่อความเสี่ยงมากที่สุด top_k ตัว
+    """
     try:
         sensor_dict = data.sensor_readings.model_dump()
 
@@ -540,12 +600,23 @@ async def predict_ml_breakdown(data: MachineData):
         predictor = get_predictor()
 
         # Make prediction
-        ml_result = predictor.predict_single(sensor_dict)
+        with span("ml_inference"):
+            ml_result = predictor.predict_single(sensor_dict)
 
         # Add metadata
         ml_result["machine_type"] = data.machine_type
         ml_result["timestamp"] = data.timestamp
 
+        # Per-prediction explanation
+        if explain:
+            # คำอธิบายเป็นข้อมูลเสริม: ถ้า explain ล้มเหลวยังคืนผลทำนายได้
+            try:
+                with span("ml_explanation"):
+                    ml_result["explanation"] = get_explainer().explain(sensor_dict, top_k=top_k)
+            except Exception as e:
+                print(f"⚠️ ML explanation failed: {str(e)}")
+                ml_result["explanation"] = {"available": False, "reason": f"Explanation failed: {str(e)}"}
+
         return ml_result
 
     except Exception as e:
@@ -554,64 +625,52 @@ async def predict_ml_breakdown(data: MachineData):
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/repair-manual")
-async def get_repair_manual(request: ChatMessage):
-
-    """ค้นหาคู่มือการซ่อม (ใช้ AI ตอบคำถาม)"""
-    try:
-        # Get the backend directory path
-        backend_dir = os.path.dirname(os.path.abspath(__file__))
-        embeddings_file_path = os.path.join(backend_dir, "embeddings.json")
-        manuls_file_path = os.path.join(backend_dir, "manuls.txt")
-
-        embeddings = load_embeddings_from_file(embeddings_file_path)
-
-        with open(manuls_file_path, "r", encoding="utf-8") as file:
-            text_fitz = file.read()  # อ่านเนื้อหาทั้งหมดในไฟล์
-
-        # แบ่งข้อความตามบรรทัด
-        texts_strip = text_fitz.split("\n")  # หรือแบ่งตามพารากราฟได้
-
-        # กรองข้อความว่างออก
-        texts = [text for text in texts_strip if text.strip()]
-
-        # ตรวจสอบว่ามีการรับ query_text จาก request หรือไม่
-        query_text = request.message  # สมมติว่า message จาก request คือคำถามที่ต้องการค้นหา
-
-        # ค้นหาคำถามใน embeddings
-        results = search_query_in_embeddings(query_text, embeddings, texts)
+def answer_repair_question(question: str) -> str:
+    """ตอบคำถามการซ่อมจากคู่มือ (RAG + Qwen, blocking)"""
+    # คู่มือแบ่งเป็น chunk ตามหัวข้อ/ความยาว พร้อม embeddings (โหลดครั้งเดียวแล้ว cache)
+    with span("embedding_load"):
+        embeddings, texts = load_manual()
 
-        prompt = f"""คุณเป็นผู้เชี่ยวชาญด้านการซ่อมบำรุงเครื่องจักรโรงงานน้ำตาล โดยเฉพาะระบบ Feed Mill
+    query_text = question
 
-คำถาม: {query_text}
-โดยใช้เนื้อหาจาก: {results}
+    # ค้นหาข้อความที่เกี่ยวข้องในคู่มือ (BM25 / embeddings ตาม RETRIEVAL_MODE)
+    results = search_manual(query_text, embeddings, texts)
 
-กรุณาตอบคำถามเกี่ยวกับการซ่อมบำรุงอย่างละเอียด รวมถึง:
-ขั้นตอนการซ่อม
-อุปกรณ์ที่ต้องใช้
-ข้อควรระวัง
-เวลาที่ใช้โดยประมาณ"""
+    prompt = build_repair_prompt(query_text, results)
 
-        # ส่งคำขอไปยังโมเดล qwen.qwen3-32b-v1:0 ผ่าน API
+    # ส่งคำขอไปยังโมเดล qwen.qwen3-32b-v1:0 ผ่าน API
+    with span("llm_call", model="qwen.qwen3-32b-v1:0"):
         response_body = bedrock_runtime.converse(
             modelId="qwen.qwen3-32b-v1:0",
             messages=[
                 {
                     "role": "user",
-                    "content": [{"text": prompt}]
+                    "content": [{"text": prompt.text}]
                 }
             ],
             inferenceConfig={
                 "maxTokens": 1024
             }
         )
-        manual_content = response_body['output']['message']['content'][0]['text']
+    record_usage(prompt, response_body, model="qwen.qwen3-32b-v1:0")
+    manual_content = response_body['output']['message']['content'][0]['text']
+    return manual_content
+
+
+@app.post("/api/repair-manual")
+async def get_repair_manual(request: ChatMessage):
+
+    """ค้นหาคู่มือการซ่อม (ใช้ AI ตอบคำถาม)"""
+    try:
+        manual_content = await asyncio.to_thread(answer_repair_question, request.message)
 
         return {
             "question": request.message,
             "answer": manual_content
         }
 
+    except LLMUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"ระบบ AI ไม่พร้อมใช้งานชั่วคราว ({str(e)})")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -622,8 +681,9 @@ async def chat_agent(request: ChatMessage):
         print(f"Received chat request: {request.message}")
         # Determine which function to use based on message
         messager = request.message
-        Host_Agent = Orchestrator(messager)
-        agent_response=Host_Agent.run(messager) 
+        Host_Agent = get_orchestrator()
+        # Model / tool loop is blocking (boto3), keep it off the event loop
+        agent_response = await asyncio.to_thread(Host_Agent.run, messager)
 
         return {
             "message": request.message,
@@ -641,17 +701,27 @@ async def orchestrator_chat(request: ChatMessage):
     try:
         print(f"Received orchestrator chat request: {request.message}")
 
-        # สร้าง Orchestrator instance และส่ง user input เข้าไป
-        orchestrator = Orchestrator()
+        # Orchestrator ใช้ร่วมกันทุก request; บริบทของบทสนทนาเก็บแยกตาม session
+        orchestrator = get_orchestrator()
+        session = chat_sessions.get_or_create(request.session_id)
+
+        def run_turn():
+            # หนึ่ง session ตอบทีละคำถาม เพื่อให้ลำดับบทสนทนาถูกต้อง
+            with session.lock:
+                history = session.context_messages()
+                result = orchestrator.run_with_trace(request.message, history=history)
+                chat_sessions.record_turn(session, request.message, result.text)
+                return result, history
 
-        # เรียกใช้ run() โดยส่ง user_input เข้าไป (ใช้ _get_user_input ภายใน)
-        response_text = orchestrator.run(user_input=request.message)
+        # เรียกใช้ run_with_trace() โดยส่ง user_input เข้าไป (tools ในรอบเดียวกันทำงานพร้อมกัน)
+        result, history = await asyncio.to_thread(run_turn)
 
         return {
             "message": request.message,
-            "response": response_text,
-            "tools_used": [],  # Orchestrator จะจัดการ tools ภายใน
-            "stop_reason": "completed"
+            "response": result.text,
+            "session_id": session.session_id,
+            "history_tokens": messages_tokens(history),
+            **result.to_dict()
         }
 
     except Exception as e:
@@ -660,6 +730,17 @@ async def orchestrator_chat(request: ChatMessage):
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/api/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    """ลบบริบทของบทสนทนา (เริ่มคุยใหม่)"""
+    return {"deleted": chat_sessions.delete(session_id)}
+
+
+@app.get("/api/chat/sessions")
+async def get_chat_session_stats():
+    """จำนวน session และการสรุปบทสนทนาเพื่อคุมขนาด prompt"""
+    return chat_sessions.stats()
+
 # ===== Embeddings Management Endpoints =====
 
 class RenameRequest(BaseModel):
@@ -774,64 +855,51 @@ def verify_line_signature(body: bytes, signature: str) -> bool:
     return hmac.compare_digest(signature, computed_signature)
 
 
-@app.post("/api/line/webhook")
-async def line_webhook(request: Request, x_line_signature: str = Header(None)):
-    """LINE Bot Webhook endpoint"""
-    try:
-        body = await request.body()
-        print(f"📥 Received webhook request")
-        print(f"   Body length: {len(body)}")
-        print(f"   Signature: {x_line_signature}")
-
-        # Verify signature (disabled for testing)
-        # if not verify_line_signature(body, x_line_signature or ""):
-        #     raise HTTPException(status_code=400, detail="Invalid signature")
+def handle_line_event(event: Dict) -> Optional[List[Dict]]:
+    """
+    Handle one LINE webhook event (runs in the background webhook workers)
+
+    Returns:
+        LINE messages to answer the user with, or None
+    """
+    if event.get('type') == 'follow':
+        # User added bot as friend
+        user_id = event['source']['userId']
+        if line_store.add_user(user_id, alerts_enabled=True):
+            print(f"✅ New LINE friend: {user_id}")
+        return None
+
+    if event.get('type') == 'unfollow':
+        # User blocked / removed the bot: no more alerts (LINE would reject the pushes anyway)
+        if line_store.remove_user(event['source']['userId']):
+            print(f"👋 LINE user left: {event['source']['userId']}")
+        return None
+
+    if event.get('type') != 'message' or event['message'].get('type') != 'text':
+        return None
+
+    # Handle text message
+    user_id = event['source']['userId']
+    message_text = event['message']['text'].lower()
+
+    # Add user to storage if not exists
+    if line_store.add_user(user_id):
+        print(f"✅ New LINE user registered: {user_id}")
+
+    if 'สถานะ' in message_text or 'status' in message_text:
+        # Send current machine status
+        if uploaded_data_store["dataframe"] is not None:
+            machines = uploaded_data_store["machines"]
+            reply = f"📊 สถานะเครื่องจักร\n\n"
+            reply += f"จำนวนเครื่อง: {len(machines)} เครื่อง\n"
+            reply += f"รายการ: {', '.join(machines[:5])}"
+            if len(machines) > 5:
+                reply += f" และอื่นๆ อีก {len(machines) - 5} เครื่อง"
+        else:
+            reply = "⚠️ ยังไม่มีข้อมูลเครื่องจักร"
 
-        # Parse JSON
-        try:
-            events_data = json.loads(body.decode('utf-8'))
-            print(f"   Parsed JSON: {events_data}")
-        except json.JSONDecodeError as je:
-            print(f"⚠️ JSON decode error: {str(je)}")
-            # Return OK for verification requests that might not have valid JSON
-            return {"status": "ok"}
-
-        # Handle events
-        events_list = events_data.get('events', [])
-        print(f"   Events count: {len(events_list)}")
-
-        for event in events_list:
-            print(f"   Event type: {event.get('type')}")
-
-            if event['type'] == 'message' and event['message']['type'] == 'text':
-                # Handle text message
-                user_id = event['source']['userId']
-                message_text = event['message']['text'].lower()
-
-                # Add user to storage if not exists
-                if user_id not in line_users_store["users"]:
-                    line_users_store["users"].append(user_id)
-                    print(f"✅ New LINE user registered: {user_id}")
-
-                # Reply based on message
-                line_notifier = get_line_notifier()
-
-                if 'สถานะ' in message_text or 'status' in message_text:
-                    # Send current machine status
-                    if uploaded_data_store["dataframe"] is not None:
-                        machines = uploaded_data_store["machines"]
-                        reply = f"📊 สถานะเครื่องจักร\n\n"
-                        reply += f"จำนวนเครื่อง: {len(machines)} เครื่อง\n"
-                        reply += f"รายการ: {', '.join(machines[:5])}"
-                        if len(machines) > 5:
-                            reply += f" และอื่นๆ อีก {len(machines) - 5} เครื่อง"
-                    else:
-                        reply = "⚠️ ยังไม่มีข้อมูลเครื่องจักร"
-
-                    line_notifier.send_push_message(user_id, [{"type": "text", "text": reply}])
-
-                elif 'ช่วยเหลือ' in message_text or 'help' in message_text:
-                    help_text = """🤖 คำสั่งที่ใช้ได้:
+    elif 'ช่วยเหลือ' in message_text or 'help' in message_text:
+        reply = """🤖 คำสั่งที่ใช้ได้:
 
 1️⃣ 'สถานะ' - ดูสถานะเครื่องจักร
 2️⃣ 'แจ้งเตือน เปิด' - เปิดการแจ้งเตือน
@@ -840,48 +908,88 @@ async def line_webhook(request: Request, x_line_signature: str = Header(None)):
 
 ระบบจะแจ้งเตือนอัตโนมัติเมื่อเครื่องจักรมีความเสี่ยง"""
 
-                    line_notifier.send_push_message(user_id, [{"type": "text", "text": help_text}])
-
-                elif 'แจ้งเตือน' in message_text:
-                    if 'เปิด' in message_text:
-                        line_users_store["alert_settings"][user_id] = True
-                        reply = "✅ เปิดการแจ้งเตือนแล้ว คุณจะได้รับแจ้งเตือนเมื่อเครื่องจักรมีความเสี่ยง"
-                    elif 'ปิด' in message_text:
-                        line_users_store["alert_settings"][user_id] = False
-                        reply = "❌ ปิดการแจ้งเตือนแล้ว"
-                    else:
-                        status = "เปิด ✅" if line_users_store["alert_settings"].get(user_id, True) else "ปิด ❌"
-                        reply = f"สถานะการแจ้งเตือน: {status}"
-
-                    line_notifier.send_push_message(user_id, [{"type": "text", "text": reply}])
+    elif 'แจ้งเตือน' in message_text:
+        if 'เปิด' in message_text:
+            line_store.set_alerts_enabled(user_id, True)
+            reply = "✅ เปิดการแจ้งเตือนแล้ว คุณจะได้รับแจ้งเตือนเมื่อเครื่องจักรมีความเสี่ยง"
+        elif 'ปิด' in message_text:
+            line_store.set_alerts_enabled(user_id, False)
+            reply = "❌ ปิดการแจ้งเตือนแล้ว"
+        else:
+            status = "เปิด ✅" if line_store.alerts_enabled(user_id) else "ปิด ❌"
+            reply = f"สถานะการแจ้งเตือน: {status}"
 
-                else:
-                    # Default welcome message
-                    welcome_text = """สวัสดีครับ! 👋
+    else:
+        # Default welcome message
+        reply = """สวัสดีครับ! 👋
 
 ผมเป็นบอทแจ้งเตือนสถานะเครื่องจักร Zero Breakdown
 
 พิมพ์ 'ช่วยเหลือ' เพื่อดูคำสั่งทั้งหมด"""
 
-                    line_notifier.send_push_message(user_id, [{"type": "text", "text": welcome_text}])
+    return [{"type": "text", "text": reply}]
+
+
+def reply_line_message(reply_token: str, messages: List[Dict]) -> bool:
+    delivery = get_line_delivery()
+    return delivery.is_configured() and delivery.reply(reply_token, messages).ok
+
+
+def push_line_message(user_id: str, messages: List[Dict]) -> bool:
+    delivery = get_line_delivery()
+    return delivery.is_configured() and delivery.push(user_id, messages).ok
+
+
+# Background webhook workers: per-user ordering, reply API first, push as fallback
+webhook_processor = WebhookProcessor(
+    handle_fn=handle_line_event,
+    reply_fn=reply_line_message,
+    push_fn=push_line_message,
+    workers=int(os.getenv("LINE_WEBHOOK_WORKERS", "8")),
+    queue_size=int(os.getenv("LINE_WEBHOOK_QUEUE_SIZE", "1000"))
+)
+
+# Signature check can be switched off for local testing only (LINE_WEBHOOK_VERIFY=false)
+LINE_WEBHOOK_VERIFY = os.getenv("LINE_WEBHOOK_VERIFY", "true").lower() != "false"
+
+
+@app.on_event("startup")
+async def start_webhook_processor():
+    webhook_processor.start()
+
+
+@app.on_event("shutdown")
+async def stop_webhook_processor():
+    await webhook_processor.stop()
+
+
+@app.post("/api/line/webhook")
+async def line_webhook(request: Request, x_line_signature: str = Header(None)):
+    """LINE Bot Webhook endpoint: verify the signature, queue the events and answer immediately"""
+    body = await request.body()
 
-            elif event['type'] == 'follow':
-                # User added bot as friend
-                user_id = event['source']['userId']
-                if user_id not in line_users_store["users"]:
-                    line_users_store["users"].append(user_id)
-                    line_users_store["alert_settings"][user_id] = True
-                    print(f"✅ New LINE friend: {user_id}")
+    if LINE_WEBHOOK_VERIFY and not verify_line_signature(body, x_line_signature or ""):
+        print("⚠️ LINE webhook with invalid signature rejected")
+        raise HTTPException(status_code=400, detail="Invalid signature")
 
-        print("✅ Webhook processed successfully")
+    try:
+        events_data = json.loads(body.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as je:
+        print(f"⚠️ JSON decode error: {str(je)}")
+        # Return OK for verification requests that might not have valid JSON
         return {"status": "ok"}
 
-    except Exception as e:
-        import traceback
-        print(f"❌ Error in LINE webhook: {str(e)}")
-        print(traceback.format_exc())
-        # Return 200 OK even on error to prevent LINE from retrying
-        return {"status": "error", "message": str(e)}
+    result = webhook_processor.submit(events_data.get('events', []))
+    if result["rejected"]:
+        # Non-2xx makes LINE redeliver; events already queued are skipped as redeliveries
+        raise HTTPException(status_code=503, detail="Webhook queue full")
+    return {"status": "ok", **result}
+
+
+@app.get("/api/line/webhook/stats")
+async def get_line_webhook_stats():
+    """สถานะคิว webhook (queue depth, replied, pushed, redelivered)"""
+    return webhook_processor.stats()
 
 
 @app.post("/api/line/send-alert")
@@ -902,23 +1010,22 @@ async def send_line_alert(machine_id: str, alerts: List[str], risk_score: int =
             risk_level=risk_level
         )
 
-        sent_count = 0
-
         if user_id:
             # Send to specific user
-            if line_notifier.send_push_message(user_id, messages):
-                sent_count = 1
+            recipients = [user_id]
         else:
-            # Send to all users with alerts enabled
-            for uid in line_users_store["users"]:
-                if line_users_store["alert_settings"].get(uid, True):
-                    if line_notifier.send_push_message(uid, messages):
-                        sent_count += 1
+            # Send to all users with alerts enabled (multicast, 500 users per call)
+            recipients = await asyncio.to_thread(line_store.alert_recipients)
+
+        # Blocking HTTP calls, keep them off the event loop
+        report = await asyncio.to_thread(get_line_delivery().deliver, recipients, messages)
+        sent_count = report.sent
 
         return {
             "success": True,
             "sent_to": sent_count,
-            "message": f"ส่งแจ้งเตือนไปยัง {sent_count} ผู้ใช้"
+            "message": f"ส่งแจ้งเตือนไปยัง {sent_count} ผู้ใช้",
+            "delivery": report.to_dict()
         }
 
     except Exception as e:
@@ -932,15 +1039,10 @@ async def send_line_alert(machine_id: str, alerts: List[str], risk_score: int =
 async def get_line_users():
     """ดึงรายชื่อผู้ใช้ LINE Bot"""
     try:
-        users_with_settings = []
-        for user_id in line_users_store["users"]:
-            users_with_settings.append({
-                "user_id": user_id,
-                "alerts_enabled": line_users_store["alert_settings"].get(user_id, True)
-            })
+        users_with_settings = await asyncio.to_thread(line_store.list_users)
 
         return {
-            "total_users": len(line_users_store["users"]),
+            "total_users": len(users_with_settings),
             "users": users_with_settings
         }
     except Exception as e:
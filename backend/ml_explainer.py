@@ -0,0 +1,120 @@
+"""
+Per-prediction explanations for MLPredictor
+TreeSHAP contributions of each sensor feature, computed on the base model already loaded by the predictor
+"""
+import time
+import numpy as np
+from ml_predictor import get_predictor
+
+try:
+    import xgboost as xgb
+except ImportError:
+    xgb = None
+try:
+    import shap
+except ImportError:
+    shap = None
+
+LATENCY_BUDGET_MS = 50
+
+
+class MLExplainer:
+    def __init__(self, predictor=None, model_type=None):
+        """
+        Args:
+            predictor: MLPredictor whose cached models are explained (default: the singleton)
+            model_type: 'xgb' / 'lgb' / 'rf' (default: first one loaded, in that order)
+        """
+        self.predictor = predictor or get_predictor()
+        self.model_type, self.model, self.scaler = self._pick_model(model_type)
+        self._explainer = None
+
+        # Native TreeSHAP (xgboost/lightgbm) needs no explainer object; shap's is built once and reused
+        if self.model is not None and not self._has_native_contribs():
+            if shap is None:
+                print(f"⚠ Explainer disabled: shap not installed for {self.model_type}")
+                self.model = None
+            else:
+                self._explainer = shap.TreeExplainer(self.model)
+        if self.model is not None:
+            print(f"✓ Explainer ready ({self.model_type})")
+
+    def _pick_model(self, model_type):
+        models = getattr(self.predictor, 'models', {})
+        for name in ([model_type] if model_type else ['xgb', 'lgb', 'rf']):
+            if name in models:
+                return name, models[name], models.get(f'{name}_scaler')
+        return None, None, None
+
+    def _has_native_contribs(self):
+        return (xgb is not None and hasattr(self.model, 'get_booster')) or hasattr(self.model, 'booster_')
+
+    def _contributions(self, X):
+        """TreeSHAP values for the positive class (log-odds) -> (contribs [n, features], base_value)"""
+        if xgb is not None and hasattr(self.model, 'get_booster'):
+            booster = self.model.get_booster()
+            out = booster.predict(xgb.DMatrix(X, feature_names=booster.feature_names), pred_contribs=True)
+            return out[:, :-1], float(out[0, -1])
+        if hasattr(self.model, 'booster_'):
+            out = self.model.booster_.predict(X, pred_contrib=True)
+            return out[:, :-1], float(out[0, -1])
+        values = self._explainer.shap_values(X, check_additivity=False)
+        base = np.ravel(self._explainer.expected_value)
+        if isinstance(values, list):
+            values = values[1]
+        elif np.ndim(values) == 3:
+            values = values[:, :, 1]
+        return values, float(base[-1])
+
+    def explain(self, sensor_data, top_k=5):
+        """
+        Top-k feature contributions for one sensor reading
+
+        Args:
+            sensor_data: same dict passed to MLPredictor.predict_single
+            top_k: number of features to return, ordered by |contribution|
+
+        Returns:
+            dict with top_features, base_value, latency_ms and within_budget
+        """
+        if self.model is None:
+            return {"available": False, "reason": "No explainable ML model loaded"}
+
+        start = time.perf_counter()
+        df = self.predictor.prepare_features(sensor_data)
+        X = df.values.astype(np.float32)
+        X_in = self.scaler.transform(X).astype(np.float32) if self.scaler is not None else X
+
+        contribs, base_value = self._contributions(X_in)
+        row = contribs[0]
+        order = np.argsort(-np.abs(row))[:top_k]
+        top_features = [{
+            "feature": str(df.columns[i]),
+            "value": float(X[0, i]),
+            "contribution": float(row[i]),
+            "direction": "เพิ่มความเสี่ยง" if row[i] > 0 else "ลดความเสี่ยง"
+        } for i in order]
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        if latency_ms > LATENCY_BUDGET_MS:
+            print(f"⚠ Explanation took {latency_ms:.1f} ms (budget {LATENCY_BUDGET_MS} ms)")
+
+        return {
+            "available": True,
+            "model": self.model_type,
+            "base_value": base_value,
+            "top_features": top_features,
+            "latency_ms": round(latency_ms, 2),
+            "within_budget": latency_ms <= LATENCY_BUDGET_MS
+        }
+
+
+# Singleton
+_explainer = None
+
+def get_explainer():
+    """Get ML explainer singleton (shares the predictor's cached models)"""
+    global _explainer
+    if _explainer is None:
+        _explainer = MLExplainer()
+    return _explainer
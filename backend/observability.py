@@ -0,0 +1,247 @@
+"""
+Request tracing, Prometheus metrics and structured JSON logs
+
+- span("retrieval") times a hot-path stage, records it on the current request and in a histogram
+- RequestContextMiddleware assigns a request ID (X-Request-ID in/out), times the request,
+  returns the stage timings as a Server-Timing header and writes one JSON access log line
+- /metrics renders all histograms/counters in the Prometheus text format (no extra dependency)
+"""
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+def get_request_id() -> Optional[str]:
+    """Request ID of the request being handled (None outside a request)"""
+    return _request_id.get()
+
+
+# =========================
+# Metrics
+# =========================
+def _labels_text(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{k}="{str(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += c
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                    lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY: Dict[str, object] = {}
+
+
+def register(metric):
+    REGISTRY[metric.name] = metric
+    return metric
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY.values() for line in metric.render()) + "\n"
+
+
+REQUEST_DURATION = register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")))
+REQUESTS_TOTAL = register(Counter(
+    "http_requests_total", "HTTP requests", ("method", "route", "status")))
+SPAN_DURATION = register(Histogram(
+    "stage_duration_seconds", "Hot-path stage latency (embedding load, retrieval, LLM, ML, LINE push)",
+    ("stage", "outcome")))
+
+
+# =========================
+# Spans
+# =========================
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a hot-path stage
+
+    Args:
+        name: stage name, e.g. "embedding_load", "query_embedding", "similarity_search",
+              "llm_call", "ml_inference", "line_push"
+        attrs: extra fields for the debug log line (model id, user count, ...)
+    """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        SPAN_DURATION.observe(elapsed, stage=name, outcome=outcome)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+        logger.debug("span", extra={"fields": {"span": name, "duration_ms": round(elapsed * 1000, 2),
+                                              "outcome": outcome, **attrs}})
+
+
+# =========================
+# Logging
+# =========================
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the current request ID"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None) or _request_id.get(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+logger = logging.getLogger("zero_breakdown")
+
+
+def setup_logging(level: int = logging.INFO) -> logging.Logger:
+    """JSON logs on stdout for the app logger (idempotent)"""
+    if not any(isinstance(h.formatter, JsonFormatter) for h in logger.handlers):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+# =========================
+# Middleware
+# =========================
+class RequestContextMiddleware:
+    """Pure ASGI middleware: request ID, latency histogram, Server-Timing header, JSON access log"""
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(self.header)
+        # Accept a caller's ID (proxy / frontend) only if it is header-safe
+        request_id = "".join(c for c in incoming.decode("latin-1")[:128] if c.isalnum() or c in "-_.:") if incoming else ""
+        request_id = request_id or uuid.uuid4().hex
+        spans: List[Tuple[str, float]] = []
+        id_token, spans_token = _request_id.set(request_id), _request_spans.set(spans)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((self.header, request_id.encode("latin-1")))
+                if spans:
+                    timing = ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in spans)
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            # Route template keeps label cardinality bounded (/api/machine-data/{machine_id})
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_DURATION.observe(elapsed, method=scope["method"], route=route_path, status=status["code"])
+            REQUESTS_TOTAL.inc(method=scope["method"], route=route_path, status=status["code"])
+            if route_path != "/metrics":
+                stage_ms: Dict[str, float] = {}
+                for name, t in spans:
+                    stage_ms[name] = round(stage_ms.get(name, 0.0) + t * 1000, 2)
+                logger.info("request", extra={"fields": {
+                    "method": scope["method"], "path": scope["path"], "route": route_path, "status": status["code"],
+                    "duration_ms": round(elapsed * 1000, 2), "stages_ms": stage_ms}})
+            _request_id.reset(id_token)
+            _request_spans.reset(spans_token)
+
+
+def install(app) -> None:
+    """Add the middleware, JSON logging and GET /metrics to a FastAPI app"""
+    from fastapi.responses import PlainTextResponse
+
+    setup_logging()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,203 @@
+"""
+Prompt assembly for the RAG / advice prompts
+
+- Retrieved manual snippets are rendered as numbered plain lines (no dict / np.float64 reprs),
+  de-duplicated, best first, and cut to a token budget (PROMPT_CONTEXT_TOKENS)
+- Sensor readings are one compact line; normal ranges are listed only for the sensors in alarm
+- Templates are compiled once at import; every rendered prompt carries its estimated input tokens,
+  and record_usage() logs estimated vs Bedrock-reported tokens per call
+"""
+import os
+import re
+import string
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from observability import Counter, register, logger
+from tokens import estimate_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKENS", "600"))
+
+LLM_PROMPT_CALLS = register(Counter(
+    "llm_prompt_calls_total", "LLM calls by prompt template", ("prompt",)))
+LLM_TOKENS = register(Counter(
+    "llm_tokens_total", "LLM tokens by prompt template (input_estimated / input / output)", ("prompt", "kind")))
+
+# Normal operating ranges shown to the model (frontend sensor names)
+NORMAL_RANGES = {
+    "PowerMotor": "290-315 kW",
+    "CurrentMotor": "280–320 Amp",
+    "TempBrassBearingDE": "< 75°C",
+    "SpeedMotor": "1480–1495 rpm",
+    "TempOilGear": "< 65°C",
+    "TempBearingMotorNDE": "< 85°C",
+    "TempWindingMotorPhase_U": "< 105°C",
+    "TempWindingMotorPhase_V": "< 105°C",
+    "TempWindingMotorPhase_W": "< 105°C",
+}
+
+REPAIR_QUESTIONS = """กรุณาตอบคำถามเกี่ยวกับการซ่อมบำรุงอย่างละเอียด รวมถึง:
+ขั้นตอนการซ่อม
+อุปกรณ์ที่ต้องใช้
+ข้อควรระวัง
+เวลาที่ใช้โดยประมาณ"""
+
+
+@dataclass
+class RenderedPrompt:
+    name: str
+    text: str
+    input_tokens: int
+    context_tokens: int = 0
+    snippets_used: int = 0
+    snippets_dropped: int = 0
+
+
+class PromptTemplate:
+    """string.Template compiled once; $fields are filled at render time"""
+
+    def __init__(self, name: str, template: str):
+        self.name = name
+        self.template = string.Template(template)
+
+    def render(self, **fields) -> RenderedPrompt:
+        text = self.template.substitute(**fields)
+        return RenderedPrompt(self.name, text, estimate_tokens(text))
+
+
+REPAIR_ADVICE = PromptTemplate("repair_advice", """คุณเป็นผู้เชี่ยวชาญด้านการซ่อมบำรุงเครื่องจักรโรงงานน้ำตาล โดยเฉพาะระบบ Feed Mill
+
+คำถาม: $question
+เนื้อหาจากคู่มือ:
+$context
+
+$instructions""")
+
+SENSOR_ADVICE = PromptTemplate("sensor_advice", """คุณเป็นผู้เชี่ยวชาญด้านการซ่อมบำรุงเครื่องจักรโรงงานน้ำตาล โดยเฉพาะระบบ Feed Mill
+
+คำถาม: $question
+เนื้อหาจากคู่มือ:
+$context
+
+ข้อมูล Sensor: $sensors
+
+ปัญหาที่พบ:
+$alerts
+
+ค่าปกติของ sensor ที่ผิดปกติ:
+$ranges
+
+$instructions""")
+
+BREAKDOWN_PREDICTION = PromptTemplate("breakdown_prediction", """ทำนายความเสี่ยงของการเสียหายของเครื่องจักร $machine:
+
+ข้อมูล Sensor: $sensors
+
+ปัญหาที่พบ:
+$alerts
+
+คะแนนความเสี่ยง: $risk_score/100
+ระดับความเสี่ยง: $risk_level
+
+รหัสเครื่องจักรนี้คือ ABB M3BP355SMB4
+
+โดยให้คำทำนายเกี่ยวกับ:
+1. โอกาสที่เครื่องจักรจะเสียหาย
+2. อายุการใช้งานโดยประมาณที่เหลืออยู่
+3. ส่วนประกอบที่มีความเสี่ยงสูงสุด""")
+
+
+# =========================
+# Context rendering
+# =========================
+def select_snippets(results: List[Dict], token_budget: Optional[int] = None) -> List[Dict]:
+    """
+    Retrieval results, best first, without duplicates, within token_budget
+
+    A snippet is a duplicate when its normalized text equals or is contained in one already kept.
+    The best snippet is always kept (clipped to the budget if it alone is too long).
+    """
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    ranked = sorted(results, key=lambda r: float(r.get("similarity", r.get("score", 0.0))), reverse=True)
+    kept, kept_norm, used = [], [], 0
+    for result in ranked:
+        text = " ".join(str(result.get("text", "")).split())
+        norm = text.casefold()
+        if not norm or any(norm in k for k in kept_norm):
+            continue
+        cost = estimate_tokens(text) + 2  # "[n] " prefix + newline
+        if used + cost > budget:
+            if kept:
+                continue
+            text = text[:max(1, len(text) * budget // cost)]
+            cost = budget
+        kept.append({**result, "text": text})
+        kept_norm.append(norm)
+        used += cost
+    return kept
+
+
+def render_context(results: List[Dict], token_budget: Optional[int] = None):
+    """(numbered snippet lines, snippets used, snippets dropped)"""
+    kept = select_snippets(results, token_budget)
+    lines = "\n".join(f"[{i}] {r['text']}" for i, r in enumerate(kept, 1)) or "(ไม่พบเนื้อหาที่เกี่ยวข้องในคู่มือ)"
+    return lines, len(kept), len(results) - len(kept)
+
+
+def compact_sensors(sensor_dict: Dict) -> str:
+    """One line: name=value, missing readings skipped, floats without trailing zeros"""
+    return ", ".join(f"{name}={value:g}" if isinstance(value, (int, float)) else f"{name}={value}"
+                     for name, value in sensor_dict.items() if value is not None)
+
+
+def alerting_ranges(alerts: List[str]) -> str:
+    """Normal ranges of the sensors mentioned in the alerts (all of them when none match)"""
+    names = [name for name in NORMAL_RANGES if any(re.search(rf"\b{name}\b", a) for a in alerts)]
+    return "\n".join(f"- {name}: {NORMAL_RANGES[name]}" for name in (names or NORMAL_RANGES))
+
+
+# =========================
+# Builders
+# =========================
+def _with_context(template: PromptTemplate, results: List[Dict], token_budget: Optional[int], **fields):
+    context, used, dropped = render_context(results, token_budget)
+    prompt = template.render(context=context, **fields)
+    prompt.context_tokens = estimate_tokens(context)
+    prompt.snippets_used, prompt.snippets_dropped = used, dropped
+    return prompt
+
+
+def build_repair_prompt(question: str, results: List[Dict], token_budget: Optional[int] = None,
+                        instructions: str = REPAIR_QUESTIONS) -> RenderedPrompt:
+    return _with_context(REPAIR_ADVICE, results, token_budget, question=question, instructions=instructions)
+
+
+def build_sensor_advice_prompt(question: str, results: List[Dict], sensor_dict: Dict, alerts: List[str],
+                               token_budget: Optional[int] = None) -> RenderedPrompt:
+    return _with_context(SENSOR_ADVICE, results, token_budget, question=question,
+                         sensors=compact_sensors(sensor_dict), alerts="\n".join(alerts),
+                         ranges=alerting_ranges(alerts), instructions=REPAIR_QUESTIONS)
+
+
+def build_prediction_prompt(machine: str, sensor_dict: Dict, alerts: List[str], risk_score: int,
+                            risk_level: str) -> RenderedPrompt:
+    return BREAKDOWN_PREDICTION.render(machine=machine, sensors=compact_sensors(sensor_dict),
+                                       alerts="\n".join(alerts) if alerts else "ไม่พบปัญหา",
+                                       risk_score=risk_score, risk_level=risk_level)
+
+
+def record_usage(prompt: RenderedPrompt, response: Optional[Dict] = None, model: str = "") -> Dict:
+    """Count estimated and Bedrock-reported tokens for one call; returns the usage fields"""
+    usage = (response or {}).get("usage", {})
+    fields = {"prompt": prompt.name, "model": model, "input_tokens_estimated": prompt.input_tokens,
+              "context_tokens": prompt.context_tokens, "snippets_used": prompt.snippets_used,
+              "snippets_dropped": prompt.snippets_dropped, "input_tokens": usage.get("inputTokens"),
+              "output_tokens": usage.get("outputTokens")}
+    LLM_PROMPT_CALLS.inc(prompt=prompt.name)
+    LLM_TOKENS.inc(prompt.input_tokens, prompt=prompt.name, kind="input_estimated")
+    if usage.get("inputTokens") is not None:
+        LLM_TOKENS.inc(usage["inputTokens"], prompt=prompt.name, kind="input")
+    if usage.get("outputTokens") is not None:
+        LLM_TOKENS.inc(usage["outputTokens"], prompt=prompt.name, kind="output")
+    logger.info("llm_usage", extra={"fields": fields})
+    return fields
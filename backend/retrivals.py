@@ -1,21 +1,23 @@
 import json
 import numpy as np
 import fitz  # PyMuPDF
-import boto3
+from llm_gateway import get_llm_gateway
 import json
 import os
 from dotenv import load_dotenv
 from sklearn.metrics.pairwise import cosine_similarity
+from observability import span
+from lexical_retriever import get_index
 
 load_dotenv()
 
-# สร้าง client สำหรับ AWS Bedrock
-bedrock = boto3.client(
-    "bedrock-runtime",
-    region_name="us-west-2",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-)
+# vector / lexical / hybrid / auto (ดู search_manual)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "auto")
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))  # น้ำหนักของ vector score ในโหมด hybrid
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.8"))
+
+# สร้าง client สำหรับ AWS Bedrock (ใช้ client ร่วมกันทั้งระบบ)
+bedrock = get_llm_gateway("us-west-2")
 
 # ฟังก์ชันสำหรับการโหลด embeddings จากไฟล์
 def load_embeddings_from_file(file_path):
@@ -24,35 +26,88 @@ def load_embeddings_from_file(file_path):
     return embeddings
 
 def generate_query_embedding(query_text):
-    response = bedrock.invoke_model(
-        modelId="amazon.titan-embed-text-v2:0",
-        body=json.dumps({"inputText": query_text})
-    )
+    with span("query_embedding", model="amazon.titan-embed-text-v2:0"):
+        response = bedrock.invoke_model(
+            modelId="amazon.titan-embed-text-v2:0",
+            body=json.dumps({"inputText": query_text})
+        )
     response_body = json.loads(response["body"].read())
     return response_body["embedding"]
 
-# ฟังก์ชันสำหรับการค้นหาคำถามใน embeddings
-def search_query_in_embeddings(query_text, embeddings, texts):
+def vector_similarities(query_text, embeddings, texts):
+    """cosine similarity ของ query กับทุกข้อความ (เรียก Titan 1 ครั้ง)"""
     # สร้าง embedding สำหรับคำถาม
     query_embedding = generate_query_embedding(query_text)
 
-    # คำนวณ cosine similarity ระหว่าง query embedding กับ embeddings ที่โหลดจากไฟล์
-    similarities = cosine_similarity([query_embedding], embeddings)
+    # ใช้เฉพาะ embeddings ที่มีข้อความคู่กัน (ไฟล์ embeddings กับไฟล์ข้อความอาจมีจำนวนไม่เท่ากัน)
+    embeddings = embeddings[:len(texts)]
+
+    with span("similarity_search", candidates=len(embeddings)):
+        # คำนวณ cosine similarity ระหว่าง query embedding กับ embeddings ที่โหลดจากไฟล์
+        return cosine_similarity([query_embedding], embeddings)[0]
+
 
-    # คำนวณผลลัพธ์ที่ใกล้เคียงที่สุด
-    top_k = 4  # จำนวนผลลัพธ์ที่ต้องการ
-    top_k_indices = similarities[0].argsort()[-top_k:][::-1]  # ดัชนีของผลลัพธ์ที่ใกล้เคียงที่สุด
+# ฟังก์ชันสำหรับการค้นหาคำถามใน embeddings
+def search_query_in_embeddings(query_text, embeddings, texts, top_k=4):
+    similarities = vector_similarities(query_text, embeddings, texts)
+
+    # คำนวณผลลัพธ์ที่ใกล้เคียงที่สุด (top_k = จำนวนผลลัพธ์ที่ต้องการ)
+    top_k_indices = similarities.argsort()[-top_k:][::-1]  # ดัชนีของผลลัพธ์ที่ใกล้เคียงที่สุด
 
     results = []
     for idx in top_k_indices:
         results.append({
             "text": texts[idx],  # ข้อความที่ตรงกับ embedding
-            "similarity": similarities[0][idx]  # ความคล้ายคลึง
+            "similarity": similarities[idx],  # ความคล้ายคลึง
+            "index": int(idx)  # ตำแหน่งของข้อความในเอกสาร
         })
 
     return results
 
 
+def _min_max(scores):
+    scores = np.asarray(scores, dtype=float)
+    spread = scores.max() - scores.min() if len(scores) else 0.0
+    return (scores - scores.min()) / spread if spread > 0 else np.zeros_like(scores)
+
+
+def search_manual(query_text, embeddings, texts, top_k=4, mode=None):
+    """
+    ค้นหาข้อความในคู่มือตาม RETRIEVAL_MODE
+
+    - vector: Titan embedding + cosine similarity (เดิม)
+    - lexical: BM25 ในเครื่อง ไม่เรียก network
+    - hybrid: รวมคะแนน BM25 และ vector (normalize แล้วถ่วงน้ำหนักด้วย HYBRID_ALPHA)
+    - auto: ใช้ BM25 อย่างเดียวเมื่อผลลัพธ์ที่ดีที่สุดครอบคลุมคำค้นอย่างน้อย LEXICAL_MIN_COVERAGE
+      (คำค้นแบบ keyword เช่น "แบริ่ง", "Oil Gear") ไม่เช่นนั้นใช้ hybrid
+
+    Returns:
+        list: [{"text", "similarity", "index", "retriever"}] เรียงจากคะแนนมากไปน้อย
+            similarity: vector = cosine, lexical = BM25 หารด้วยคะแนนของผลแรก (0-1],
+            hybrid = คะแนนรวมที่ normalize แล้ว (0-1)
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode == "vector":
+        return [{**r, "retriever": "vector"} for r in search_query_in_embeddings(query_text, embeddings, texts, top_k)]
+
+    with span("lexical_search", candidates=len(texts)):
+        index = get_index(texts)
+        lexical, coverage = index.scores(query_text)
+
+    if mode == "lexical" or (mode == "auto" and lexical and coverage >= LEXICAL_MIN_COVERAGE):
+        ranked = sorted(lexical.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        # BM25 ไม่มีขอบเขตบน: หารด้วยคะแนนสูงสุดให้อยู่ในช่วง 0-1 เหมือนโหมดอื่น
+        best = ranked[0][1] if ranked else 1.0
+        return [{"text": texts[i], "similarity": score / best, "index": i, "retriever": "lexical"} for i, score in ranked]
+
+    vector = vector_similarities(query_text, embeddings, texts)
+    bm25 = np.array([lexical.get(i, 0.0) for i in range(len(vector))])
+    fused = HYBRID_ALPHA * _min_max(vector) + (1 - HYBRID_ALPHA) * _min_max(bm25)
+    top_k_indices = fused.argsort()[-top_k:][::-1]
+    return [{"text": texts[i], "similarity": float(fused[i]), "index": int(i), "retriever": "hybrid"}
+            for i in top_k_indices]
+
+
 # # โหลด embeddings จากไฟล์
 # embeddings_file_path = "/opt/dlami/nvme/workspace/embeddings.json"
 # embeddings = load_embeddings_from_file(embeddings_file_path)
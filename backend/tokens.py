@@ -0,0 +1,45 @@
+"""
+Local token estimates (no network call, no tokenizer download)
+
+Bedrock only reports token usage after a call; budgets have to be enforced before it.
+Estimates are deliberately on the high side: Thai script costs far more tokens per
+character than English, so the two are counted separately.
+"""
+import json
+import math
+from typing import Dict, List
+
+CHARS_PER_TOKEN_LATIN = 4.0   # English / digits / punctuation
+CHARS_PER_TOKEN_OTHER = 1.5   # Thai and other non-Latin scripts
+MESSAGE_OVERHEAD = 4          # role / block framing per message
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimated model tokens for a piece of text"""
+    if not text:
+        return 0
+    latin = sum(1 for c in text if ord(c) < 0x250)
+    other = len(text) - latin
+    return math.ceil(latin / CHARS_PER_TOKEN_LATIN + other / CHARS_PER_TOKEN_OTHER)
+
+
+def content_tokens(block: Dict) -> int:
+    """Tokens of one converse content block (text, toolUse, toolResult, json)"""
+    if "text" in block:
+        return estimate_tokens(block["text"])
+    if "toolUse" in block:
+        return estimate_tokens(block["toolUse"].get("name", "")) + estimate_tokens(
+            json.dumps(block["toolUse"].get("input", {}), ensure_ascii=False))
+    if "toolResult" in block:
+        return sum(content_tokens(c) for c in block["toolResult"].get("content", []))
+    if "json" in block:
+        return estimate_tokens(json.dumps(block["json"], ensure_ascii=False, default=str))
+    return 0
+
+
+def message_tokens(message: Dict) -> int:
+    return MESSAGE_OVERHEAD + sum(content_tokens(block) for block in message.get("content", []))
+
+
+def messages_tokens(messages: List[Dict]) -> int:
+    return sum(message_tokens(m) for m in messages)
@@ -2,7 +2,9 @@ import json
 import numpy as np
 import fitz  # PyMuPDF
 import json
-import boto3
+from llm_gateway import get_llm_gateway
+from llm_scheduler import llm_priority
+from chunker import CHUNK_MAX_TOKENS, CHUNK_MIN_TOKENS, CHUNK_OVERLAP_TOKENS, chunk_pages, chunk_stats, clean_lines
 import os
 from datetime import datetime
 from pathlib import Path
@@ -13,38 +15,35 @@ load_dotenv()
 
 # AWS Bedrock setup
 AWS_REGION = os.getenv("AWS_DEFAULT_REGION", "us-west-2")
-bedrock = boto3.client(
-    "bedrock-runtime",
-    region_name=AWS_REGION,
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-)
+bedrock = get_llm_gateway(AWS_REGION)
 
 # Directory to store embeddings - AWS Cloud Path
 EMBEDDINGS_DIR = "/opt/dlami/nvme/embeddings"
 os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
 
 # ฟังก์ชันสำหรับการ extract file เป็น text
+def extract_pages_fitz(pdf_path):
+    """Extract the text of each PDF page using PyMuPDF"""
+    doc = fitz.open(pdf_path)
+    return [doc.load_page(page_num).get_text() for page_num in range(len(doc))]
+
+
 def extract_text_fitz(pdf_path):
     """Extract text from PDF using PyMuPDF"""
-    doc = fitz.open(pdf_path)
-    full_text = ""
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        full_text += page.get_text()
-    return full_text
+    return "".join(extract_pages_fitz(pdf_path))
 
 
 def generate_embeddings(texts):
-    """Generate embeddings using AWS Bedrock Titan"""
+    """Generate embeddings using AWS Bedrock Titan (batch priority: paced, never ahead of alerts / interactive calls)"""
     embeddings = []
-    for text in texts:
-        response = bedrock.invoke_model(
-            modelId="amazon.titan-embed-text-v2:0",
-            body=json.dumps({"inputText": text})
-        )
-        response_body = json.loads(response["body"].read())
-        embeddings.append(response_body["embedding"])
+    with llm_priority("batch"):
+        for text in texts:
+            response = bedrock.invoke_model(
+                modelId="amazon.titan-embed-text-v2:0",
+                body=json.dumps({"inputText": text})
+            )
+            response_body = json.loads(response["body"].read())
+            embeddings.append(response_body["embedding"])
     return embeddings
 
 
@@ -59,17 +58,15 @@ def save_embedding(pdf_path, custom_name=None):
     Returns:
         dict: Information about saved embedding file
     """
-    text_fitz = extract_text_fitz(pdf_path)
+    pages = extract_pages_fitz(pdf_path)
 
-    # ตรวจสอบว่า text_fitz ไม่ว่างและมีข้อความที่ต้องการ
-    if not text_fitz.strip():
+    # ตรวจสอบว่า PDF มีข้อความที่ต้องการ
+    if not "".join(pages).strip():
         raise ValueError("ไม่พบข้อความจากไฟล์ PDF")
 
-    # แบ่งข้อความเป็นบรรทัดหรือพารากราฟ
-    texts = text_fitz.split("\n")
-
-    # กรองข้อความว่างออก
-    texts = [text for text in texts if text.strip()]
+    # รวมบรรทัดเป็น chunk ตามหัวข้อ/ความยาว (ตัดเลขหน้าและหัว/ท้ายกระดาษที่ซ้ำทุกหน้าออก)
+    texts = chunk_pages(pages)
+    stats = chunk_stats([line for line in clean_lines(pages) if line], texts)
 
     # สร้าง embeddings จากข้อความที่ดึงมา
     embeddings = generate_embeddings(texts)
@@ -92,6 +89,9 @@ def save_embedding(pdf_path, custom_name=None):
             "created_at": datetime.now().isoformat(),
             "num_texts": len(texts),
             "num_embeddings": len(embeddings),
+            "num_lines": stats["lines"],
+            "chunking": {"max_tokens": CHUNK_MAX_TOKENS, "min_tokens": CHUNK_MIN_TOKENS,
+                         "overlap_tokens": CHUNK_OVERLAP_TOKENS, "reduction": stats["reduction"]},
             "custom_name": custom_name or pdf_name
         },
         "texts": texts,
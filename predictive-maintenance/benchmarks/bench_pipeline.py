@@ -0,0 +1,186 @@
+# =========================================
+# Training pipeline benchmark
+# - Synthetic data at configurable scales (benchmarks/synthetic_data.py)
+# - Every variant runs stage by stage in a fresh process (clean RSS), each stage under memory_stage
+#   * legacy scripts: v1 / v2 / v3 / opt (pm_model_fullpipeline*.py)
+#   * package configs: pkg-fast / pkg-exact / pkg-fft (predictive_maintenance)
+# - Report: bench_report.json (machine-readable, includes git commit) + bench_report.md,
+#   optionally with the change in total time vs. a baseline report from another commit
+# =========================================
+
+import os, sys, json, time, platform, argparse, logging, subprocess, traceback
+import multiprocessing as mp
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PM_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PM_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_data import generate_dataset
+
+logger = logging.getLogger()
+
+LEGACY_VARIANTS = {
+    'v1': 'pm_model_fullpipeline.py',
+    'v2': 'pm_model_fullpipeline2.py',
+    'v3': 'pm_model_fullpipeline3.py',
+    'opt': 'pm_model_fullpipeline(Opt).py',
+}
+PACKAGE_VARIANTS = {
+    'pkg-fast': {},
+    'pkg-exact': {'clustering': 'kmeans', 'float_dtype': 'float64'},
+    'pkg-fft': {'fft': True},
+}
+STAGES = ['load_data', 'hybrid_labeling', 'pivot_and_features', 'clustering', 'isolation_forest', 'stacked_ensemble']
+
+# =========================
+# 1) One variant (runs in a child process)
+# =========================
+def _stage_plan(variant):
+    """(module, {stage: kwargs}) for a variant; legacy scripts run with their own defaults."""
+    if variant in LEGACY_VARIANTS:
+        from pm_stage_cache import _load_pipeline
+        return _load_pipeline(os.path.join(PM_DIR, LEGACY_VARIANTS[variant])), {}
+    from predictive_maintenance import PipelineConfig, stages
+    cfg = PipelineConfig(**PACKAGE_VARIANTS[variant])
+    dtype = {'float_dtype': cfg.float_dtype}
+    return stages, {
+        'load_data': dtype,
+        'pivot_and_features': {'fft': cfg.fft, **dtype},
+        'clustering': {'method': cfg.clustering, 'batch_size': cfg.cluster_batch_size, **dtype},
+        'isolation_forest': dtype,
+        'stacked_ensemble': dtype,
+    }
+
+def bench_variant(variant, sensor_csv, breakdown_csv, skip_ensemble=False):
+    logging.basicConfig(level=logging.WARNING)
+    from pm_dtypes import memory_stage, MEMORY_REPORT
+    MEMORY_REPORT.clear()
+    result = {'variant': variant, 'stages': [], 'wide_rows': None, 'error': None}
+    try:
+        m, kw = _stage_plan(variant)
+        st = {}
+        def _features(df_feat):
+            return [c for c in df_feat.select_dtypes(include=[np.number]).columns
+                    if c not in ['FailureLabel','anomaly_flag','anomaly_score']]
+        steps = [
+            ('load_data', lambda: st.update(zip(('df','bd'), m.load_data(sensor_csv, breakdown_csv, **kw.get('load_data', {}))))),
+            ('hybrid_labeling', lambda: st.update(df=m.hybrid_labeling(st['df'], st['bd']))),
+            ('pivot_and_features', lambda: st.update(feat=m.pivot_and_features(st['df'], **kw.get('pivot_and_features', {})))),
+        ]
+        if hasattr(m, 'add_cluster_features'):
+            steps.append(('clustering', lambda: st.update(feat=m.add_cluster_features(st['feat'], **kw.get('clustering', {}))[0])))
+        steps.append(('isolation_forest', lambda: st.update(feat=m.anomaly_layer(st['feat'], **kw.get('isolation_forest', {}))[0])))
+        if not skip_ensemble:
+            steps.append(('stacked_ensemble', lambda: m.train_stacked_ensemble(st['feat'], _features(st['feat']),
+                                                                                **kw.get('stacked_ensemble', {}))))
+        for name, step in steps:
+            with memory_stage(name):
+                step()
+        result['wide_rows'] = len(st['feat'])
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc(limit=5)
+    result['stages'] = list(MEMORY_REPORT)
+    return result
+
+def run_isolated(variant, sensor_csv, breakdown_csv, skip_ensemble, timeout):
+    with mp.get_context('spawn').Pool(1) as pool:
+        job = pool.apply_async(bench_variant, (variant, sensor_csv, breakdown_csv, skip_ensemble))
+        try:
+            return job.get(timeout=timeout)
+        except mp.TimeoutError:
+            return {'variant': variant, 'stages': [], 'wide_rows': None, 'error': f"timeout after {timeout}s"}
+
+# =========================
+# 2) Report
+# =========================
+def environment():
+    versions = {}
+    for mod in ['numpy', 'pandas', 'sklearn', 'xgboost', 'lightgbm', 'pyarrow']:
+        try: versions[mod] = __import__(mod).__version__
+        except Exception: versions[mod] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PM_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'versions': versions}
+
+def summarize(result, rows):
+    stages = result['stages']
+    result['rows'] = rows
+    result['total_seconds'] = round(sum(s['seconds'] for s in stages), 3)
+    result['peak_rss_mb'] = max((s['peak_rss_mb'] for s in stages), default=None)
+    result['dominant_stage'] = max(stages, key=lambda s: s['seconds'])['stage'] if stages else None
+    return result
+
+def to_markdown(report, baseline=None):
+    base = {(r['variant'], r['rows']): r for r in (baseline or {}).get('results', [])}
+    meta = report['meta']
+    lines = [f"# Pipeline benchmark ({meta['commit'] or 'unknown commit'}, {meta['timestamp']})", "",
+             f"Python {meta['python']} on {meta['platform']}, {meta['cpu_count']} CPUs", ""]
+    if baseline:
+        lines += [f"Baseline: {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})", ""]
+    for rows in sorted({r['rows'] for r in report['results']}):
+        header = ['variant'] + STAGES + ['total (s)', 'peak RSS (MB)', 'dominant'] + (['vs baseline'] if baseline else [])
+        lines += [f"## {rows:,} long rows", "", '| ' + ' | '.join(header) + ' |', '|' + '---|'*len(header)]
+        for r in [r for r in report['results'] if r['rows'] == rows]:
+            if r['error']:
+                lines.append(f"| {r['variant']} | error: {r['error']} |"); continue
+            secs = {s['stage']: s['seconds'] for s in r['stages']}
+            cells = [r['variant']] + [f"{secs[s]:.2f}" if s in secs else '–' for s in STAGES] + \
+                    [f"{r['total_seconds']:.2f}", f"{r['peak_rss_mb']:.0f}", r['dominant_stage']]
+            if baseline:
+                # Compare only the stages both runs measured (e.g. one of them ran with --skip-ensemble)
+                b = {s['stage']: s['seconds'] for s in base.get((r['variant'], rows), {}).get('stages', [])}
+                shared = [s for s in secs if s in b]
+                now, before = sum(secs[s] for s in shared), sum(b[s] for s in shared)
+                cells.append(f"{(now/before-1)*100:+.1f}%" if before else 'n/a')
+            lines.append('| ' + ' | '.join(cells) + ' |')
+        lines.append('')
+    return '\n'.join(lines)
+
+# =========================
+# 3) CLI
+# =========================
+if __name__=="__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages across variants and data scales")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000], help="long-format sensor rows per scale")
+    parser.add_argument('--variants', nargs='+', default=['v3', 'opt', 'pkg-fast', 'pkg-exact'],
+                        choices=[*LEGACY_VARIANTS, *PACKAGE_VARIANTS])
+    parser.add_argument('--skip-ensemble', action='store_true', help="stop after IsolationForest (large scales)")
+    parser.add_argument('--data-dir', default="bench_data")
+    parser.add_argument('--out-dir', default="bench_results")
+    parser.add_argument('--baseline', default=None, help="bench_report.json from another commit to compare against")
+    parser.add_argument('--timeout', type=int, default=3600, help="seconds per variant run")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    report = {'meta': {**environment(), 'skip_ensemble': args.skip_ensemble, 'seed': args.seed}, 'results': []}
+    for rows in args.rows:
+        data_dir = os.path.join(args.data_dir, f"rows_{rows}_seed_{args.seed}")
+        sensor_csv, breakdown_csv = os.path.join(data_dir, 'feedmill_clean_long.csv'), os.path.join(data_dir, 'breakdown_log_detailed.csv')
+        if not (os.path.exists(sensor_csv) and os.path.exists(breakdown_csv)):
+            generate_dataset(data_dir, rows, seed=args.seed)
+        for variant in args.variants:
+            logger.info(f"[bench] {variant} @ {rows:,} rows")
+            result = summarize(run_isolated(variant, sensor_csv, breakdown_csv, args.skip_ensemble, args.timeout), rows)
+            if result['error']: logger.warning(f"[bench] {variant} @ {rows:,}: {result['error']}")
+            else: logger.info(f"[bench] {variant} @ {rows:,}: {result['total_seconds']}s, peak {result['peak_rss_mb']} MB, "
+                              f"dominant {result['dominant_stage']}")
+            report['results'].append(result)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+    with open(os.path.join(args.out_dir, 'bench_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=str)
+    markdown = to_markdown(report, baseline)
+    with open(os.path.join(args.out_dir, 'bench_report.md'), 'w', encoding='utf-8') as f:
+        f.write(markdown)
+    print(markdown)
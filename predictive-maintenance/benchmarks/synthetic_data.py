@@ -0,0 +1,154 @@
+# =========================================
+# Synthetic data generator for pipeline benchmarks
+# - Long-format sensor export (DateTime, SensorName, Value), time-ordered, written in blocks
+# - Breakdown log with the breakdown_log_detailed.csv columns
+# - Sensors drift during a precursor window before each breakdown and drop out during it,
+#   so labeling / features / models see realistic structure at any scale
+# =========================================
+
+import os, math, argparse, logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+
+# name: (baseline, noise as fraction of baseline, drift before failure as fraction of baseline)
+SENSOR_PROFILES = {
+    'PowerMotor':                        (300.0, 0.03,  0.15),
+    'CurrentMotor':                      (290.0, 0.03,  0.20),
+    'SpeedMotor':                        (1485.0, 0.005, -0.01),
+    'SpeedRoller':                       (5.0, 0.02,  -0.05),
+    'TempBrassBearingDE':                (65.0, 0.04,  0.30),
+    'Temperator Brass bearing NDE':      (63.0, 0.04,  0.25),
+    'Temperator Bearing Motor DE':       (62.0, 0.04,  0.20),
+    'Temperator Bearing Motor NDE':      (60.0, 0.04,  0.20),
+    'Temperator Oil Gear':               (58.0, 0.04,  0.25),
+    'Temperator Winding Motor Phase U':  (72.0, 0.04,  0.20),
+    'Temperator Winding Motor Phase V':  (71.0, 0.04,  0.20),
+    'Temperator Winding Motor Phase W':  (70.0, 0.04,  0.20),
+    'Vrms_Est_mm_s':                     (1.5, 0.10,  1.50),
+}
+
+CAUSES = {
+    'Mechanical': ('MILLING HOUSE - (A)', ["แก้ไข Chute ของลูกป้อน Mill No.1", "Bearing ลูกหีบร้อนผิดปกติ", "เปลี่ยน Coupling ชุดขับ Mill"]),
+    'Electrical': ('ELECTRICAL MANT - (A)', ["Invertor drive mill no.1 fault", "Motor winding over temperature", "Breaker trip ชุดขับ Mill"]),
+    'Process':    ('MILLING HOUSE - (A)', ["อ้อยม้วนอัดขอบ Chute", "ปรับตั้ง Setting ลูกหีบ"]),
+}
+
+# breakdown_log_detailed.csv sensor snapshot columns (in file order) -> sensor
+BREAKDOWN_SENSOR_COLS = {
+    'Current_Motor_Amp': 'CurrentMotor', 'Power_Motor_kW': 'PowerMotor',
+    'Speed_Motor_rpm': 'SpeedMotor', 'Speed_Roller_rpm': 'SpeedRoller',
+    'Temperator_Bearing_Motor_DE_C': 'Temperator Bearing Motor DE', 'Temperator_Bearing_Motor_NDE_C': 'Temperator Bearing Motor NDE',
+    'Temperator_Brass_bearing_DE_C': 'TempBrassBearingDE', 'Temperator_Brass_bearing_NDE_C': 'Temperator Brass bearing NDE',
+    'Temperator_Oil_Gear_C': 'Temperator Oil Gear',
+    'Temperator_Winding_Motor_Phase_U_C': 'Temperator Winding Motor Phase U',
+    'Temperator_Winding_Motor_Phase_V_C': 'Temperator Winding Motor Phase V',
+    'Temperator_Winding_Motor_Phase_W_C': 'Temperator Winding Motor Phase W',
+}
+
+# =========================
+# 1) Breakdown events
+# =========================
+def generate_events(start, end, n_events, machine='Feed Mill 1', seed=42):
+    """Breakdown log rows (breakdown_log_detailed.csv schema) spread uniformly over [start, end)."""
+    rng = np.random.default_rng(seed)
+    span = (pd.Timestamp(end) - pd.Timestamp(start)) / pd.Timedelta(minutes=1)
+    starts = pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.uniform(span*0.05, span*0.95, n_events)).astype(int), unit='m')
+    durations = rng.integers(10, 121, n_events)
+    categories = rng.choice(list(CAUSES), n_events, p=[0.5, 0.35, 0.15])
+
+    rows = []
+    for ts, dur, cat in zip(starts, durations, categories):
+        dept, texts = CAUSES[cat]
+        cause = texts[rng.integers(len(texts))]
+        end_ts = ts + pd.Timedelta(minutes=int(dur))
+        if end_ts.date() != ts.date():      # the log stores Date + HH:MM, keep each stop within one day
+            ts, end_ts = ts - pd.Timedelta(minutes=int(dur)+1), ts - pd.Timedelta(minutes=1)
+        row = {'Date': ts.strftime('%Y-%m-%d'), 'TimeStart': ts.strftime('%H:%M'), 'TimeEnd': end_ts.strftime('%H:%M'),
+               'Duration_min': float(dur), 'Dept': dept, 'Machine': machine,
+               'BreakdownID': f"BD_{ts.strftime('%Y%m%d_%H%M')}", 'CauseText': cause, 'CauseCategory': cat,
+               'DetailNote': f"หยุดหีบ เนื่องจาก {cause} รวมเวลา {int(dur)} นาที"}
+        for col, sensor in BREAKDOWN_SENSOR_COLS.items():
+            # Snapshot while stopped: motor power/current/speed near zero, temperatures cooling down
+            scale = rng.uniform(0.4, 0.9) if col.startswith('Temperator') else rng.uniform(0.0, 1e-4)
+            row[col] = float(SENSOR_PROFILES[sensor][0] * scale)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+# =========================
+# 2) Long sensor export
+# =========================
+def _event_windows(events):
+    start = pd.to_datetime(events['Date']+' '+events['TimeStart'])
+    return start.to_numpy(), (start + pd.to_timedelta(events['Duration_min'], unit='m')).to_numpy()
+
+def generate_sensor_long(path, n_rows, events, start='2024-12-01', freq='1min', sensors=None,
+                         precursor_hours=8, block_timestamps=100_000, seed=42):
+    """
+    Write ~n_rows long-format readings (n_rows / len(sensors) timestamps) to path, block by block.
+
+    Each sensor ramps linearly by its drift over precursor_hours before a breakdown and reads
+    near zero (motor) / cools down (temperatures) while the machine is stopped.
+    """
+    rng = np.random.default_rng(seed)
+    sensors = sensors or list(SENSOR_PROFILES)
+    n_ts = math.ceil(n_rows / len(sensors))
+    ev_start, ev_end = _event_windows(events)
+    precursor = np.timedelta64(int(precursor_hours*3600), 's')
+
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('DateTime,SensorName,Value\n')
+        for b0 in range(0, n_ts, block_timestamps):
+            ts = pd.date_range(pd.Timestamp(start) + b0*pd.Timedelta(freq), periods=min(block_timestamps, n_ts-b0),
+                               freq=freq).to_numpy()
+            # Next breakdown start/end for every timestamp -> drift ramp + stopped mask
+            nxt = np.searchsorted(ev_end, ts, side='left')
+            has_next = nxt < len(ev_start)
+            nxt_start = np.where(has_next, ev_start[np.minimum(nxt, len(ev_start)-1)], ts)
+            to_failure = (nxt_start - ts) / precursor
+            ramp = np.where(has_next & (to_failure < 1), 1 - np.clip(to_failure, 0, 1), 0.0)
+            stopped = has_next & (ts >= nxt_start)
+
+            values = np.empty((len(ts), len(sensors)), dtype='float64')
+            for j, s in enumerate(sensors):
+                base, noise, drift = SENSOR_PROFILES.get(s, (100.0, 0.05, 0.1))
+                v = base * (1 + drift*ramp) + rng.normal(0, base*noise, len(ts))
+                values[:, j] = np.where(stopped, base*(0.02 if 'Temp' not in s else 0.7), v)
+
+            block = pd.DataFrame({'DateTime': np.repeat(ts, len(sensors)),
+                                  'SensorName': np.tile(sensors, len(ts)),
+                                  'Value': values.ravel()})
+            block.to_csv(f, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+            written += len(block)
+    return written
+
+# =========================
+# 3) Dataset
+# =========================
+def generate_dataset(out_dir, n_rows, n_events=None, start='2024-12-01', freq='1min', machine='Feed Mill 1', seed=42):
+    """Write feedmill_clean_long.csv + breakdown_log_detailed.csv for ~n_rows long rows; returns both paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    n_ts = math.ceil(n_rows / len(SENSOR_PROFILES))
+    end = pd.Timestamp(start) + n_ts * pd.Timedelta(freq)
+    n_events = n_events or max(3, int((end - pd.Timestamp(start)) / pd.Timedelta(days=2)))
+    events = generate_events(start, end, n_events, machine=machine, seed=seed)
+
+    sensor_csv = os.path.join(out_dir, 'feedmill_clean_long.csv')
+    breakdown_csv = os.path.join(out_dir, 'breakdown_log_detailed.csv')
+    events.to_csv(breakdown_csv, index=False)
+    rows = generate_sensor_long(sensor_csv, n_rows, events, start=start, freq=freq, seed=seed)
+    logger.info(f"Synthetic dataset: {rows} sensor rows, {len(events)} breakdowns -> {out_dir}")
+    return sensor_csv, breakdown_csv
+
+if __name__=="__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Generate a synthetic sensor export + breakdown log")
+    parser.add_argument('--rows', type=int, default=100_000, help="long-format sensor rows")
+    parser.add_argument('--events', type=int, default=None, help="breakdowns (default: one per 2 days of data)")
+    parser.add_argument('--out-dir', default="bench_data")
+    parser.add_argument('--freq', default="1min")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate_dataset(args.out_dir, args.rows, args.events, freq=args.freq, seed=args.seed)
@@ -0,0 +1,91 @@
+# =========================================
+# Columnar alert builder
+# - Every threshold is evaluated as one boolean column (no df.apply(axis=1) / explode)
+# - Alert codes are derived with vectorised ops and emitted as a long-format table
+#   (one row per alert, ordered by source row then rule order like the old row-wise builder)
+# - Cluster tagging is opt-in
+# - alerts.json is written chunk by chunk instead of json.dump of one giant list
+# =========================================
+
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+
+DEFAULT_THRESHOLDS = {'PowerMotor':220,'CurrentMotor':50,'TempBrassBearingDE':80,'Vrms_Est_mm_s':4.5}
+ALERT_COLUMNS = ['DateTime','alerts','alert_code','anomaly_score','FailureLabel']
+
+# =========================
+# 1) Build
+# =========================
+def build_alerts(df_sensor, thresholds=None, include_cluster=False, anomaly_col='anomaly_flag', cluster_col='cluster'):
+    """
+    Evaluate alert rules column-wise and return a long-format alerts table.
+
+    Args:
+        df_sensor: wide feature frame (one row per timestamp)
+        thresholds: {sensor column: upper limit}; defaults to DEFAULT_THRESHOLDS
+        include_cluster: also emit a "Cluster <id>" row for every input row (old behaviour of the cluster pipelines)
+
+    Returns:
+        DataFrame with ALERT_COLUMNS (columns absent from df_sensor are skipped)
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    labels, codes = [], []          # one entry per distinct alert text / code
+    positions, rule_ids, label_ids = [], [], []
+
+    def _add(mask, label_idx):
+        idx = np.flatnonzero(mask)
+        positions.append(idx)
+        rule_ids.append(np.full(len(idx), len(rule_ids), dtype=np.int32))
+        label_ids.append(label_idx if np.ndim(label_idx) else np.full(len(idx), label_idx, dtype=np.int32))
+
+    for sensor, thresh in thresholds.items():
+        if sensor in df_sensor.columns:
+            labels.append(f"{sensor} exceeds {thresh}"); codes.append(f"{sensor.upper()}_HIGH")
+            _add(df_sensor[sensor].to_numpy() > thresh, len(labels)-1)
+
+    if anomaly_col in df_sensor.columns:
+        labels.append("IsolationForest anomaly detected"); codes.append("ANOMALY")
+        _add(df_sensor[anomaly_col].to_numpy() == 1, len(labels)-1)
+
+    if include_cluster and cluster_col in df_sensor.columns:
+        cluster_values, inverse = np.unique(df_sensor[cluster_col].to_numpy(), return_inverse=True)
+        offset = len(labels)
+        labels.extend(f"Cluster {c}" for c in cluster_values); codes.extend(f"CLUSTER_{c}" for c in cluster_values)
+        _add(np.ones(len(df_sensor), dtype=bool), (inverse + offset).astype(np.int32))
+
+    if not positions:
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+
+    pos, rule, label = np.concatenate(positions), np.concatenate(rule_ids), np.concatenate(label_ids)
+    order = np.lexsort((rule, pos))
+    pos, label = pos[order], label[order]
+
+    keep = [c for c in ['DateTime','anomaly_score','FailureLabel'] if c in df_sensor.columns]
+    alerts_df = df_sensor[keep].iloc[pos].reset_index(drop=True)
+    alerts_df['alerts'] = pd.Categorical.from_codes(label, categories=labels)
+    alerts_df['alert_code'] = pd.Categorical.from_codes(label, categories=codes)
+    return alerts_df[[c for c in ALERT_COLUMNS if c in alerts_df.columns]]
+
+# =========================
+# 2) Streaming JSON export
+# =========================
+def write_alerts_json(alerts_df, path, chunk_size=50000):
+    """Write alerts as a JSON array, serialising chunk_size rows at a time."""
+    n = len(alerts_df)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for start in range(0, n, chunk_size):
+            chunk = alerts_df.iloc[start:start+chunk_size].copy()
+            for c in chunk.columns:
+                if pd.api.types.is_datetime64_any_dtype(chunk[c]):
+                    # Same text as str(Timestamp) in the old json.dump(default=str), midnight included
+                    chunk[c] = chunk[c].dt.strftime('%Y-%m-%d %H:%M:%S')
+            lines = chunk.to_json(orient='records', lines=True, force_ascii=False).strip()
+            if start: f.write(',\n')
+            f.write(lines.replace('\n', ',\n'))
+        f.write('\n]\n')
+    logger.info(f"Alerts exported to {path} ({n} rows)")
+    return n
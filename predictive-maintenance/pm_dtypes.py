@@ -0,0 +1,124 @@
+# =========================================
+# Dtype policy + memory tracking for the training pipelines
+# - category dtype for repeated names (SensorName, machine_type)
+# - float32 for sensor values and engineered features
+# - smallest integer dtype for labels / flags / cluster ids
+# - peak RSS per pipeline stage (psutil if installed, /proc or getrusage otherwise)
+# =========================================
+
+import os, time, threading, logging
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try: import psutil
+except: psutil = None
+try: import resource
+except: resource = None
+
+logger = logging.getLogger()
+
+DTYPE_POLICY = {
+    'names': ['SensorName', 'machine_type'],
+    'name_dtype': 'category',
+    'values': ['Value'],
+    'float_dtype': 'float32',
+    'labels': ['FailureLabel', 'anomaly_flag', 'cluster'],
+}
+
+# =========================
+# 1) Long-format input
+# =========================
+def read_long_csv(path, policy=None, **kwargs):
+    """Read the long-format sensor CSV straight into the policy dtypes (no object/float64 intermediate)."""
+    policy = policy or DTYPE_POLICY
+    header = pd.read_csv(path, nrows=0).columns
+    dtype = {c: policy['name_dtype'] for c in policy['names'] if c in header}
+    dtype.update({c: policy['float_dtype'] for c in policy['values'] if c in header})
+    return pd.read_csv(path, dtype=dtype, **kwargs)
+
+def apply_long_policy(df, policy=None):
+    """Cast name columns to category and value columns to float32 in place (columns added after read_csv)."""
+    policy = policy or DTYPE_POLICY
+    for c in policy['names']:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype(policy['name_dtype'])
+    for c in policy['values']:
+        if c in df.columns and df[c].dtype != policy['float_dtype']:
+            df[c] = df[c].astype(policy['float_dtype'])
+    return df
+
+def downcast_labels(df, policy=None):
+    policy = policy or DTYPE_POLICY
+    for c in policy['labels']:
+        if c in df.columns and pd.api.types.is_integer_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], downcast='integer')
+    return df
+
+# =========================
+# 2) Wide feature frame
+# =========================
+def pivot_wide(df_sorted, policy=None, index='DateTime'):
+    """Long -> wide pivot on DateTime (or [machine, DateTime]) with float32 sensor columns and plain string column labels."""
+    policy = policy or DTYPE_POLICY
+    wide = df_sorted.pivot_table(index=index, columns='SensorName', values='Value',
+                                 aggfunc='mean', observed=True)
+    wide.columns = wide.columns.astype(str)
+    return wide.astype(policy['float_dtype']).reset_index()
+
+def to_float32(df, policy=None):
+    """Downcast every float64 column to float32 and integer label columns to the smallest int dtype."""
+    policy = policy or DTYPE_POLICY
+    float_cols = df.select_dtypes(include=['float64']).columns
+    if len(float_cols):
+        df[float_cols] = df[float_cols].astype(policy['float_dtype'])
+    return downcast_labels(df, policy)
+
+def feature_matrix(df, cols, policy=None):
+    """Model input matrix: NaN -> 0, contiguous float32."""
+    policy = policy or DTYPE_POLICY
+    return np.ascontiguousarray(df[cols].fillna(0).to_numpy(dtype=policy['float_dtype']))
+
+# =========================
+# 3) Memory tracking
+# =========================
+MEMORY_REPORT = []
+
+def current_rss_mb():
+    if psutil:
+        return psutil.Process(os.getpid()).memory_info().rss / 1024**2
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except Exception:
+        # ru_maxrss is KiB on Linux: only the process high-water mark, better than nothing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else 0.0
+
+@contextmanager
+def memory_stage(stage, interval=0.05):
+    """Log wall time, RSS delta and peak RSS sampled while the stage runs; append the result to MEMORY_REPORT."""
+    start_rss, start = current_rss_mb(), time.perf_counter()
+    peak = [start_rss]
+    done = threading.Event()
+
+    def _sample():
+        while not done.wait(interval):
+            peak[0] = max(peak[0], current_rss_mb())
+
+    sampler = threading.Thread(target=_sample, daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        done.set()
+        sampler.join()
+        end_rss = current_rss_mb()
+        row = {'stage': stage, 'seconds': round(time.perf_counter()-start, 3),
+               'rss_start_mb': round(start_rss, 1), 'rss_end_mb': round(end_rss, 1),
+               'peak_rss_mb': round(max(peak[0], end_rss), 1)}
+        MEMORY_REPORT.append(row)
+        logger.info(f"[mem] {stage}: {row['seconds']}s, peak RSS {row['peak_rss_mb']} MB "
+                    f"({row['rss_end_mb']-row['rss_start_mb']:+.1f} MB)")
+
+def memory_report_df():
+    return pd.DataFrame(MEMORY_REPORT)
@@ -0,0 +1,250 @@
+# =========================================
+# Incremental (warm-start) retraining for the stacked ensemble
+# - Continue boosting the saved XGBoost / LightGBM fold models on newly appended rows
+#   (xgb_model= / init_model=) instead of retraining every fold from scratch
+# - RandomForest, KMeans and IsolationForest are reused as-is
+# - Fold StandardScalers stay frozen (the existing trees' split thresholds are in their scale);
+#   only the LogisticRegression meta model is refit
+# - Every run is written as a new artifact version under <out_dir>/versions/vNNNN
+#   and published to <out_dir> so MLPredictor keeps loading the same file names
+# =========================================
+
+import os, json, glob, shutil, argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+import joblib
+
+from pm_model_fullpipeline3 import (load_data, hybrid_labeling, pivot_and_features, run_pipeline,
+                                    xgb, lgb, info, warn)
+
+VERSIONS_DIR = "versions"
+LATEST_FILE = "LATEST"
+MANIFEST_FILE = "manifest.json"
+EXCLUDED_COLS = ['FailureLabel','anomaly_flag','anomaly_score','stack_pred']
+
+# =========================
+# 1) Versioned artifacts
+# =========================
+def _versions_root(out_dir):
+    return os.path.join(out_dir, VERSIONS_DIR)
+
+def load_manifest(out_dir="artifacts"):
+    """Return the manifest of the latest artifact version, or None if nothing was registered yet."""
+    latest_path = os.path.join(_versions_root(out_dir), LATEST_FILE)
+    if not os.path.exists(latest_path):
+        return None
+    with open(latest_path, encoding='utf-8') as f:
+        version = f.read().strip()
+    with open(os.path.join(_versions_root(out_dir), version, MANIFEST_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+def _next_version(out_dir):
+    existing = [os.path.basename(p) for p in glob.glob(os.path.join(_versions_root(out_dir), 'v[0-9]*'))]
+    numbers = [int(v[1:]) for v in existing if v[1:].isdigit()]
+    return f"v{(max(numbers) + 1 if numbers else 1):04d}"
+
+def save_version(out_dir, artifacts, manifest, publish=True):
+    """Write models + manifest to a new version directory, point LATEST at it and optionally publish to out_dir."""
+    version = _next_version(out_dir)
+    version_dir = os.path.join(_versions_root(out_dir), version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    for model_type, lst in artifacts['models_fitted'].items():
+        for i, (m, s) in enumerate(lst):
+            joblib.dump(m, os.path.join(version_dir, f"{model_type}_fold{i}.pkl"))
+            if s: joblib.dump(s, os.path.join(version_dir, f"{model_type}_scaler_fold{i}.pkl"))
+    joblib.dump(artifacts['meta_clf'], os.path.join(version_dir, 'meta_model.pkl'))
+    if artifacts.get('km_model') is not None:
+        joblib.dump(artifacts['km_model'], os.path.join(version_dir, 'kmeans_model.pkl'))
+    if artifacts.get('iso_model') is not None:
+        joblib.dump(artifacts['iso_model'], os.path.join(version_dir, 'isolationforest_model.pkl'))
+
+    manifest = dict(manifest, version=version, created_at=datetime.now().isoformat())
+    with open(os.path.join(version_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    with open(os.path.join(_versions_root(out_dir), LATEST_FILE), 'w', encoding='utf-8') as f:
+        f.write(version)
+
+    if publish:
+        for path in glob.glob(os.path.join(version_dir, '*.pkl')):
+            shutil.copy2(path, os.path.join(out_dir, os.path.basename(path)))
+    info(f"Artifacts saved as version {version} ({version_dir})")
+    return manifest
+
+def load_artifacts(artifact_dir):
+    """Load fold models, scalers, meta model, KMeans and IsolationForest from an artifact directory."""
+    models_fitted = {'xgb':[], 'lgb':[], 'rf':[]}
+    for model_type in models_fitted:
+        i = 0
+        while os.path.exists(os.path.join(artifact_dir, f"{model_type}_fold{i}.pkl")):
+            scaler_path = os.path.join(artifact_dir, f"{model_type}_scaler_fold{i}.pkl")
+            models_fitted[model_type].append((
+                joblib.load(os.path.join(artifact_dir, f"{model_type}_fold{i}.pkl")),
+                joblib.load(scaler_path) if os.path.exists(scaler_path) else None))
+            i += 1
+    if not models_fitted['xgb']:
+        raise FileNotFoundError(f"No fold models found in {artifact_dir}")
+
+    def _optional(*names):
+        for name in names:
+            path = os.path.join(artifact_dir, name)
+            if os.path.exists(path): return joblib.load(path)
+        return None
+
+    return {'models_fitted': models_fitted,
+            'meta_clf': joblib.load(os.path.join(artifact_dir, 'meta_model.pkl')),
+            'km_model': _optional('kmeans_model.pkl'),
+            # pm_model_fullpipeline3 saves 'isolation_forest.pkl', (Opt) saves 'isolationforest_model.pkl'
+            'iso_model': _optional('isolationforest_model.pkl', 'isolation_forest.pkl')}
+
+def feature_columns(df_feat):
+    return [c for c in df_feat.select_dtypes(include=[np.number]).columns if c not in EXCLUDED_COLS]
+
+# =========================
+# 2) Full run + registration
+# =========================
+def full_retrain(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_log_detailed.csv", out_dir="artifacts"):
+    """Run the full pipeline once and register its artifacts as a base version for later incremental updates."""
+    df_feat, *_ = run_pipeline(sensor_csv, breakdown_csv, out_dir)
+    artifacts = load_artifacts(out_dir)
+    manifest = {'mode': 'full', 'parent': None,
+                'data_start': df_feat['DateTime'].min(), 'data_end': df_feat['DateTime'].max(),
+                'n_rows': len(df_feat), 'feature_cols': feature_columns(df_feat)}
+    return save_version(out_dir, artifacts, manifest, publish=False)
+
+# =========================
+# 3) Warm-start helpers
+# =========================
+def continue_boosting(model, X, y, n_rounds):
+    """Add n_rounds trees to an existing XGBoost/LightGBM classifier. Other models are returned unchanged."""
+    if xgb and isinstance(model, xgb.XGBClassifier):
+        new_model = xgb.XGBClassifier(**model.get_params())
+        new_model.set_params(n_estimators=n_rounds)
+        new_model.fit(X, y, xgb_model=model.get_booster())
+        return new_model
+    if lgb and isinstance(model, lgb.LGBMClassifier):
+        new_model = lgb.LGBMClassifier(**model.get_params())
+        new_model.set_params(n_estimators=n_rounds)
+        new_model.fit(X, y, init_model=model.booster_)
+        return new_model
+    return model
+
+def base_predictions(models_fitted, X):
+    """Average each base model type over its folds -> (n_rows, 3) matrix in xgb/lgb/rf order (meta-model input)."""
+    preds = np.zeros((len(X), 3))
+    for j, model_type in enumerate(['xgb','lgb','rf']):
+        fold_preds = [m.predict_proba(s.transform(X) if s else X)[:,1] for m, s in models_fitted[model_type]]
+        preds[:,j] = np.mean(fold_preds, axis=0)
+    return preds
+
+def _apply_unsupervised_layers(df_new, feature_cols, km_model, iso_model):
+    """Score new rows with the frozen KMeans / IsolationForest models, matching the full pipeline column order."""
+    if 'cluster' in feature_cols and km_model is not None:
+        km_cols = [c for c in feature_cols if c != 'cluster']
+        df_new['cluster'] = km_model.predict(df_new[km_cols].fillna(0).values)
+    if iso_model is not None:
+        X_iso = df_new[feature_cols].fillna(0).values
+        df_new['anomaly_flag'] = (iso_model.predict(X_iso)==-1).astype(int)
+        df_new['anomaly_score'] = -iso_model.decision_function(X_iso)
+    return df_new
+
+# =========================
+# 4) Incremental update
+# =========================
+def incremental_retrain(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_log_detailed.csv",
+                        out_dir="artifacts", since=None, n_boost_rounds=50, meta_holdout_frac=0.2,
+                        min_new_rows=100, publish=True):
+    """
+    Warm-start the stacked ensemble on rows appended after the latest version's data_end.
+
+    Args:
+        since: cut-off timestamp used when no version has been registered yet (plain run_pipeline artifacts)
+        n_boost_rounds: trees added to every XGBoost/LightGBM fold model
+        meta_holdout_frac: tail fraction of the new rows held out to refit the meta model
+        min_new_rows: skip the update when fewer new rows are available
+
+    Returns:
+        manifest of the new version, or None when the update was skipped
+    """
+    manifest = load_manifest(out_dir)
+    if manifest is None:
+        if since is None:
+            raise ValueError("No registered artifact version found; pass since= (end of the data the models were trained on)")
+        parent_dir, data_end, feature_cols = out_dir, pd.Timestamp(since), None
+    else:
+        parent_dir = os.path.join(_versions_root(out_dir), manifest['version'])
+        data_end, feature_cols = pd.Timestamp(manifest['data_end']), manifest['feature_cols']
+    artifacts = load_artifacts(parent_dir)
+
+    df, breakdown_df = load_data(sensor_csv, breakdown_csv)
+    df = hybrid_labeling(df, breakdown_df, label_window_hours=8)
+    df_feat = pivot_and_features(df, roll_windows=[3,5,10], compute_fft=False)
+    if artifacts['km_model'] is not None:
+        df_feat['cluster'] = 0  # placeholder so feature_columns() matches the full pipeline layout
+
+    if feature_cols is None:
+        feature_cols = feature_columns(df_feat)
+    missing = [c for c in feature_cols if c not in df_feat.columns]
+    if missing:
+        warn(f"{len(missing)} feature columns missing in new data, filled with 0: {missing[:5]}")
+        for c in missing: df_feat[c] = 0.0
+
+    df_new = df_feat[df_feat['DateTime'] > data_end].sort_values('DateTime').copy()
+    if len(df_new) < min_new_rows:
+        info(f"Only {len(df_new)} new rows after {data_end}, skipping incremental update")
+        return None
+    df_new = _apply_unsupervised_layers(df_new, feature_cols, artifacts['km_model'], artifacts['iso_model'])
+
+    # Time-ordered split: boost on the head, refit the meta model on the unseen tail
+    n_meta = max(int(len(df_new) * meta_holdout_frac), 1)
+    df_boost, df_meta = df_new.iloc[:-n_meta], df_new.iloc[-n_meta:]
+    X_boost, y_boost = df_boost[feature_cols].fillna(0), df_boost['FailureLabel'].astype(int)
+    X_meta, y_meta = df_meta[feature_cols].fillna(0), df_meta['FailureLabel'].astype(int)
+    info(f"Incremental update on {len(df_new)} new rows ({len(df_boost)} boost / {len(df_meta)} meta)")
+
+    models_fitted = {'xgb':[], 'lgb':[], 'rf':[]}
+    for model_type, lst in artifacts['models_fitted'].items():
+        for m, s in lst:
+            # The fold scaler is kept as fitted: the existing trees split on values in its scale, so
+            # re-estimating it would move every input relative to those thresholds (reused RF models
+            # included) and the added trees must see the same features as the ones they extend
+            if model_type == 'rf' or y_boost.nunique() < 2:
+                models_fitted[model_type].append((m, s))
+                continue
+            X_fit = s.transform(X_boost) if s else X_boost
+            models_fitted[model_type].append((continue_boosting(m, X_fit, y_boost, n_boost_rounds), s))
+
+    meta_clf = artifacts['meta_clf']
+    if y_meta.nunique() == 2:
+        meta_clf = LogisticRegression()
+        meta_clf.fit(base_predictions(models_fitted, X_meta), y_meta)
+    else:
+        warn("Meta holdout has a single class, keeping the previous meta model")
+
+    new_manifest = {'mode': 'incremental', 'parent': manifest['version'] if manifest else None,
+                    'data_start': df_new['DateTime'].min(), 'data_end': df_new['DateTime'].max(),
+                    'n_rows': len(df_new), 'n_boost_rounds': n_boost_rounds, 'feature_cols': feature_cols}
+    return save_version(out_dir,
+                        {'models_fitted': models_fitted, 'meta_clf': meta_clf,
+                         'km_model': artifacts['km_model'], 'iso_model': artifacts['iso_model']},
+                        new_manifest, publish=publish)
+
+# =========================
+# 5) CLI
+# =========================
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Full or incremental retraining of the stacked ensemble")
+    parser.add_argument('mode', choices=['full','update'])
+    parser.add_argument('--sensor-csv', default="feedmill_clean_long.csv")
+    parser.add_argument('--breakdown-csv', default="breakdown_log_detailed.csv")
+    parser.add_argument('--out-dir', default="artifacts")
+    parser.add_argument('--since', default=None, help="data cut-off of unversioned artifacts (update mode)")
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.mode == 'full':
+        full_retrain(args.sensor_csv, args.breakdown_csv, args.out_dir)
+    else:
+        incremental_retrain(args.sensor_csv, args.breakdown_csv, args.out_dir, since=args.since, n_boost_rounds=args.rounds)
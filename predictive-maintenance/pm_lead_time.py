@@ -0,0 +1,165 @@
+# =========================================
+# Lead-time analytics
+# - One lead time per failure event (breakdown log row), not per labelled row
+# - "Last alarm" comes from a forward-filled last-positive-timestamp array,
+#   "first alarm" from a binary search over alarm timestamps: O((n + events) log n)
+# - Distribution (p50/p90) overall, per machine and per CauseCategory
+# =========================================
+
+import json, argparse, logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+
+# =========================
+# 1) Failure events
+# =========================
+def failure_events(breakdown_df=None, df_feat=None, target_col='FailureLabel'):
+    """
+    Failure events from the breakdown log (DateTimeStart / machine_type / CauseCategory).
+    Falls back to rising edges of target_col in df_feat when no breakdown rows are available.
+    """
+    if breakdown_df is not None and len(breakdown_df) and 'DateTimeStart' in breakdown_df.columns:
+        bd = breakdown_df.dropna(subset=['DateTimeStart'])
+        return pd.DataFrame({
+            'event_id': bd['BreakdownID'] if 'BreakdownID' in bd.columns else np.arange(len(bd)).astype(str),
+            'event_start': bd['DateTimeStart'].values,
+            'machine': bd['machine_type'] if 'machine_type' in bd.columns else bd.get('Machine', 'Feed Mill 1'),
+            'cause': bd['CauseCategory'].fillna('Unknown') if 'CauseCategory' in bd.columns else 'Unknown',
+        }).sort_values('event_start').reset_index(drop=True)
+
+    if df_feat is None:
+        raise ValueError("Need either breakdown_df or df_feat to derive failure events")
+    df_sorted = df_feat.sort_values('DateTime')
+    label = df_sorted[target_col].to_numpy().astype(bool)
+    rising = label & ~np.concatenate([[False], label[:-1]])
+    starts = df_sorted['DateTime'].to_numpy()[rising]
+    return pd.DataFrame({'event_id': [f"label_run_{i}" for i in range(len(starts))],
+                         'event_start': starts, 'machine': 'Feed Mill 1', 'cause': 'Unknown'})
+
+# =========================
+# 2) Lead times
+# =========================
+def _lead_times_one_series(ts, alarm, event_starts, horizon):
+    """ts sorted datetime64 array, alarm bool array, event_starts datetime64 array -> (first_hrs, last_hrs)."""
+    first_hrs = np.full(len(event_starts), np.nan)
+    last_hrs = first_hrs.copy()
+    if not alarm.any():
+        return first_hrs, last_hrs
+
+    ts = ts.astype('datetime64[ns]')
+    event_starts = event_starts.astype('datetime64[ns]')
+    pos = np.arange(len(ts))
+
+    # Forward-filled index of the last alarm at or before each row (-1 = none yet)
+    last_idx = np.maximum.accumulate(np.where(alarm, pos, -1))
+    row = np.searchsorted(ts, event_starts, side='right') - 1
+    li = np.where(row >= 0, last_idx[np.clip(row, 0, None)], -1)
+
+    if horizon is None:
+        # Unbounded: first alarm of the alarm run that ends at the last alarm
+        rising = alarm & ~np.concatenate([[False], alarm[:-1]])
+        run_start_idx = np.maximum.accumulate(np.where(rising, pos, -1))
+        fi = np.where(li >= 0, run_start_idx[np.clip(li, 0, None)], -1)
+    else:
+        # First alarm inside [start - horizon, start]
+        alarm_pos = pos[alarm]
+        j = np.searchsorted(ts[alarm], event_starts - horizon, side='left')
+        fi = np.where(j < len(alarm_pos), alarm_pos[np.clip(j, 0, len(alarm_pos)-1)], -1)
+        fi = np.where((fi >= 0) & (fi <= row), fi, -1)
+        li = np.where(fi >= 0, li, -1)
+
+    hit = li >= 0
+    to_hours = lambda idx: (event_starts[hit] - ts[idx[hit]]) / np.timedelta64(1, 'h')
+    first_hrs[hit], last_hrs[hit] = to_hours(fi), to_hours(li)
+    return first_hrs, last_hrs
+
+def event_lead_times(df_feat, events, pred_col='stack_pred', threshold=0.5, horizon_hours=24, machine_col=None):
+    """
+    Lead time of every failure event relative to the positive predictions (pred_col > threshold).
+
+    Args:
+        horizon_hours: only alarms within this window before the event count as a detection
+                       (None = unbounded; "first" is then the start of the alarm run ending at the last alarm)
+        machine_col: column of df_feat identifying the machine; without it all events share one prediction series
+
+    Returns:
+        events with lead_hours_first / lead_hours_last (NaN when the event was not detected) and detected
+    """
+    horizon = None if horizon_hours is None else np.timedelta64(int(horizon_hours * 3600), 's')
+    events = events.copy()
+    events['lead_hours_first'] = np.nan
+    events['lead_hours_last'] = np.nan
+
+    groups = df_feat.groupby(machine_col, observed=True) if machine_col else [(None, df_feat)]
+    for machine, df_m in groups:
+        df_m = df_m.sort_values('DateTime')
+        mask = (events['machine'] == machine).to_numpy() if machine_col else np.ones(len(events), dtype=bool)
+        if not mask.any() or df_m.empty:
+            continue
+        first, last = _lead_times_one_series(df_m['DateTime'].to_numpy(), (df_m[pred_col] > threshold).to_numpy(),
+                                             events.loc[mask, 'event_start'].to_numpy(), horizon)
+        events.loc[mask, 'lead_hours_first'] = first
+        events.loc[mask, 'lead_hours_last'] = last
+
+    events['detected'] = events['lead_hours_last'].notna()
+    return events
+
+# =========================
+# 3) Report
+# =========================
+def _q(p):
+    return lambda s: s.quantile(p)
+
+LEAD_TIME_AGG = dict(events=('detected','size'), detected=('detected','sum'), detection_rate=('detected','mean'),
+                     p50_last_hrs=('lead_hours_last',_q(0.5)), p90_last_hrs=('lead_hours_last',_q(0.9)),
+                     p50_first_hrs=('lead_hours_first',_q(0.5)), p90_first_hrs=('lead_hours_first',_q(0.9)))
+
+def lead_time_summary(lead_df, by=None):
+    """Event count, detection rate and p50/p90 lead times, overall (dict) or per `by` group (DataFrame)."""
+    if by is None:
+        if lead_df.empty:
+            # No failure events: counts are 0, rates and lead times undefined
+            return {k: (0 if k in ('events', 'detected') else np.nan) for k in LEAD_TIME_AGG}
+        return lead_df.assign(_all='all').groupby('_all').agg(**LEAD_TIME_AGG).to_dict(orient='records')[0]
+    return lead_df.groupby(by).agg(**LEAD_TIME_AGG).reset_index()
+
+def lead_time_report(df_feat, breakdown_df=None, pred_col='stack_pred', threshold=0.5, horizon_hours=24, machine_col=None):
+    events = failure_events(breakdown_df, df_feat)
+    lead_df = event_lead_times(df_feat, events, pred_col, threshold, horizon_hours, machine_col)
+    report = {'overall': lead_time_summary(lead_df),
+              'by_machine': lead_time_summary(lead_df, 'machine'),
+              'by_cause': lead_time_summary(lead_df, 'cause'),
+              'events': lead_df}
+    o = report['overall']
+    logger.info(f"Lead time: {o['detected']}/{o['events']} events detected, "
+                f"p50 {o['p50_last_hrs']:.2f} h / p90 {o['p90_last_hrs']:.2f} h since last alarm")
+    return report
+
+def save_lead_time_report(report, path):
+    payload = {k: (v.to_dict(orient='records') if isinstance(v, pd.DataFrame) else v) for k, v in report.items()}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False, default=str)
+    logger.info(f"Lead-time report saved to {path}")
+
+# =========================
+# 4) CLI (from saved predictions)
+# =========================
+if __name__=="__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    from pm_model_fullpipeline3 import load_data
+
+    parser = argparse.ArgumentParser(description="Per-event lead-time report from stack_predictions.csv")
+    parser.add_argument('--predictions', default="artifacts/stack_predictions.csv")
+    parser.add_argument('--sensor-csv', default="feedmill_clean_long.csv")
+    parser.add_argument('--breakdown-csv', default="breakdown_log_detailed.csv")
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--horizon-hours', type=float, default=24)
+    parser.add_argument('--out', default="artifacts/lead_time_report.json")
+    args = parser.parse_args()
+
+    df_pred = pd.read_csv(args.predictions, parse_dates=['DateTime'])
+    _, breakdown_df = load_data(args.sensor_csv, args.breakdown_csv)
+    save_lead_time_report(lead_time_report(df_pred, breakdown_df, threshold=args.threshold,
+                                           horizon_hours=args.horizon_hours), args.out)
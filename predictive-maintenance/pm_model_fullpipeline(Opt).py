@@ -1,4 +1,6 @@
 # =========================================
+# NOTE: the configurable predictive_maintenance package (python -m predictive_maintenance) supersedes
+#       the four pm_model_fullpipeline* variants; this script is kept for existing artifacts/callers.
 # Production-ready Predictive Maintenance pipeline (Class III Sugarcane Mill) - Optimized Version
 # Supports >100k rows
 #Full Production-Ready Predictive Maintenance Pipeline แบบ Optimized สำหรับ >100k rows ให้ครบทุกประเด็นที่คุณต้องการ:
@@ -27,6 +29,12 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier, IsolationForest
 from sklearn.cluster import MiniBatchKMeans
 import joblib
+from pm_dtypes import (read_long_csv, apply_long_policy, pivot_wide, to_float32,
+                       feature_matrix, memory_stage, memory_report_df, MEMORY_REPORT)
+from pm_alerts import build_alerts, write_alerts_json
+from pm_lead_time import failure_events, event_lead_times, lead_time_report, save_lead_time_report
+from pm_shap import global_importance
+from pm_stage_cache import StageCache, run_stage
 
 # Optional ML
 try: import xgboost as xgb
@@ -52,9 +60,10 @@ def error(msg): logger.error(msg)
 # =========================
 def load_data(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_log_detailed.csv"):
     info("Loading sensor data...")
-    df = pd.read_csv(sensor_csv)
+    df = read_long_csv(sensor_csv)
     df['DateTime'] = pd.to_datetime(df['DateTime'], errors='coerce')
     df['machine_type'] = df.get('machine_type','Feed Mill 1')
+    apply_long_policy(df)
 
     info("Loading breakdown data...")
     breakdown_df = pd.read_csv(breakdown_csv)
@@ -79,7 +88,7 @@ def load_data(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_log
 def hybrid_labeling(df, breakdown_df, label_window_hours=8, thresholds=None):
     info("Applying hybrid labeling...")
     thresholds = thresholds or {'Winding':80, 'Oil Gear':70, 'Vrms':4.5}
-    df['FailureLabel'] = 0
+    df['FailureLabel'] = np.int8(0)
 
     # Breakdown log labeling
     for _, r in breakdown_df.dropna(subset=['DateTimeStart','DateTimeEnd']).iterrows():
@@ -109,12 +118,14 @@ def hybrid_labeling(df, breakdown_df, label_window_hours=8, thresholds=None):
 # =========================
 # 3) Pivot + Features (optimized)
 # =========================
-def pivot_and_features(df, roll_windows=[3,5,10], compute_fft=False, fft_window=32):
+def pivot_and_features(df, roll_windows=[3,5,10], compute_fft=False, fft_window=32, wide=None):
     info("Pivoting and computing features...")
-    df_sorted = df.sort_values('DateTime')
-    wide = df_sorted.pivot_table(index='DateTime', columns='SensorName', values='Value', aggfunc='mean').reset_index()
-    wide = wide.sort_values('DateTime').ffill().bfill()
-    wide = wide.merge(df[['DateTime','FailureLabel']].drop_duplicates(), on='DateTime', how='left')
+    # wide: optional pre-pivoted table (pm_pivot_chunked.read_wide) for exports too large to pivot in memory;
+    # with a FailureLabel column (pivot_long_csv_chunked(label_fn=...)) df is not needed
+    if wide is None: wide = pivot_wide(df.sort_values('DateTime'))
+    wide = wide.sort_values('DateTime').ffill()  # forward fill only: bfill leaks future readings backwards
+    if 'FailureLabel' not in wide.columns:
+        wide = wide.merge(df[['DateTime','FailureLabel']].drop_duplicates(), on='DateTime', how='left')
 
     numeric_cols = wide.select_dtypes(include=[np.number]).columns.tolist()
     if 'FailureLabel' in numeric_cols: numeric_cols.remove('FailureLabel')
@@ -139,7 +150,7 @@ def pivot_and_features(df, roll_windows=[3,5,10], compute_fft=False, fft_window=
             wide[f'{c}_fft_{fft_window}'] = fft_feat
 
     wide.columns = [str(c).strip().replace(' ','_').replace('/','_').replace('-','_') for c in wide.columns]
-    return wide
+    return to_float32(wide)
 
 # =========================
 # 4) Clustering Layer (MiniBatchKMeans)
@@ -147,7 +158,7 @@ def pivot_and_features(df, roll_windows=[3,5,10], compute_fft=False, fft_window=
 def add_cluster_features(df_feat, n_clusters=4):
     info("Adding clustering features...")
     numeric_cols = [c for c in df_feat.select_dtypes(include=[np.number]).columns if c not in ['FailureLabel','anomaly_flag','anomaly_score']]
-    X = df_feat[numeric_cols].fillna(0).values.astype('float32')
+    X = feature_matrix(df_feat, numeric_cols)
     km = MiniBatchKMeans(n_clusters=n_clusters, batch_size=10000, random_state=42)
     df_feat['cluster'] = km.fit_predict(X)
     return df_feat, km
@@ -158,7 +169,7 @@ def add_cluster_features(df_feat, n_clusters=4):
 def anomaly_layer(df_feat):
     info("Running IsolationForest...")
     numeric_cols = [c for c in df_feat.select_dtypes(include=[np.number]).columns if c not in ['FailureLabel']]
-    X = df_feat[numeric_cols].fillna(0).values.astype('float32')
+    X = feature_matrix(df_feat, numeric_cols)
     iso_model = IsolationForest(n_estimators=100, contamination=0.02, n_jobs=-1, random_state=42)
     df_feat['anomaly_flag'] = (iso_model.fit_predict(X)==-1).astype('int8')
     df_feat['anomaly_score'] = -iso_model.decision_function(X).astype('float32')
@@ -170,7 +181,7 @@ def anomaly_layer(df_feat):
 # =========================
 def train_stacked_ensemble(df_feat, feature_cols, target_col='FailureLabel', groups=None, n_splits=5):
     info("Training stacked ensemble...")
-    X = df_feat[feature_cols].fillna(0)
+    X = df_feat[feature_cols].fillna(0).astype('float32')
     y = df_feat[target_col].astype(int)
     groups = groups if groups is not None else np.arange(len(df_feat))
     oof_preds = np.zeros((len(X),3))
@@ -232,24 +243,11 @@ def train_stacked_ensemble(df_feat, feature_cols, target_col='FailureLabel', gro
 # =========================
 # 7) Alerts
 # =========================
-def generate_alerts_from_row(row, thresholds=None):
-    thresholds = thresholds or {'PowerMotor':220,'CurrentMotor':50,'TempBrassBearingDE':80,'Vrms_Est_mm_s':4.5}
-    alerts=[]
-    for sensor,thresh in thresholds.items():
-        if sensor in row and row[sensor]>thresh: alerts.append(f"{sensor} exceeds {thresh}")
-    if row.get('anomaly_flag',0)==1: alerts.append("IsolationForest anomaly detected")
-    if 'cluster' in row: alerts.append(f"Cluster {row['cluster']}")
-    return alerts
-
-def get_alerts(df_sensor, thresholds=None):
-    df_sensor['alerts'] = df_sensor.apply(lambda row: generate_alerts_from_row(row, thresholds), axis=1)
-    alerts_df = df_sensor.explode('alerts').dropna(subset=['alerts'])
-    return alerts_df[['DateTime','alerts','anomaly_score','FailureLabel']]
+def get_alerts(df_sensor, thresholds=None, include_cluster=False):
+    return build_alerts(df_sensor, thresholds, include_cluster=include_cluster)
 
 def alerts_to_json(alerts_df, path):
-    with open(path,'w',encoding='utf-8') as f:
-        json.dump(alerts_df.to_dict(orient='records'),f,indent=2,default=str)
-    info(f"Alerts exported to {path}")
+    write_alerts_json(alerts_df, path)
 
 # =========================
 # 8) Metrics & Lead Time
@@ -265,58 +263,69 @@ def compute_metrics(df_feat, pred_col='stack_pred', target_col='FailureLabel'):
     pr_auc = auc(recall, precision)
     return report, cm, roc, pr_auc
 
-def compute_lead_time(df_feat, pred_col='stack_pred', threshold=0.5):
-    df_feat = df_feat.sort_values('DateTime')
-    failures = df_feat[df_feat['FailureLabel']==1]
-    lead_times=[]
-    for idx,row in failures.iterrows():
-        early_pred = df_feat.loc[:idx][df_feat.loc[:idx][pred_col]>threshold]
-        if not early_pred.empty:
-            lt = (row['DateTime'] - early_pred['DateTime'].iloc[-1]).total_seconds()/3600
-            lead_times.append(lt)
-    return lead_times
+def compute_lead_time(df_feat, pred_col='stack_pred', threshold=0.5, breakdown_df=None, horizon_hours=None):
+    """Hours from the last preceding alarm to each failure event (detected events only)."""
+    events = failure_events(breakdown_df, df_feat)
+    lead_df = event_lead_times(df_feat, events, pred_col, threshold, horizon_hours)
+    return lead_df['lead_hours_last'].dropna().tolist()
 
 # =========================
 # 9) SHAP
 # =========================
-def compute_shap(df_feat, feature_cols, model=None, path=None):
-    if shap is None or model is None:
+def compute_shap(df_feat, feature_cols, model=None, scaler=None, path=None, sample_size=2000):
+    """Global SHAP importance on a stratified sample (see pm_shap); saves <path>.npy and the importance csv."""
+    if model is None:
         info("Skipping SHAP computation")
         return None
-    explainer = shap.TreeExplainer(model)
-    shap_values = explainer.shap_values(df_feat[feature_cols])
-    if path: np.save(path, shap_values)
-    return shap_values
+    importance, shap_values = global_importance(df_feat, feature_cols, model, scaler, sample_size=sample_size)
+    if importance is None:
+        info("Skipping SHAP computation")
+        return None
+    if path:
+        np.save(path, shap_values)
+        importance.to_csv(os.path.join(os.path.dirname(path), 'shap_importance.csv'), index=False)
+    return importance
 
 # =========================
 # 10) Full Pipeline Runner
 # =========================
-def run_pipeline(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_log_detailed.csv", out_dir="artifacts"):
+def run_pipeline(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_log_detailed.csv", out_dir="artifacts", cache_dir=None):
     os.makedirs(out_dir, exist_ok=True)
+    MEMORY_REPORT.clear()
+    cache = StageCache(cache_dir) if cache_dir else None
+    stage = cache.run if cache else run_stage
     
     # Load
-    df, breakdown_df = load_data(sensor_csv, breakdown_csv)
+    with memory_stage('load_data'):
+        df, breakdown_df = stage('load_data', load_data, sensor_csv, breakdown_csv)
     
     # Labeling
-    df = hybrid_labeling(df, breakdown_df, label_window_hours=8)
+    with memory_stage('hybrid_labeling'):
+        df = stage('hybrid_labeling', hybrid_labeling, df, breakdown_df, label_window_hours=8)
     
     # Feature Engineering
-    df_feat = pivot_and_features(df, roll_windows=[3,5,10], compute_fft=False)
+    with memory_stage('pivot_and_features'):
+        df_feat = stage('pivot_and_features', pivot_and_features, df, roll_windows=[3,5,10], compute_fft=False)
     
     # Clustering
-    df_feat, km_model = add_cluster_features(df_feat, n_clusters=4)
+    with memory_stage('kmeans'):
+        df_feat, km_model = stage('add_cluster_features', add_cluster_features, df_feat, n_clusters=4)
     
     # Anomaly
-    df_feat, iso_model = anomaly_layer(df_feat)
+    with memory_stage('isolation_forest'):
+        df_feat, iso_model = stage('anomaly_layer', anomaly_layer, df_feat)
     
     # Stacked Ensemble
     feature_cols = [c for c in df_feat.select_dtypes(include=[np.number]).columns if c not in ['FailureLabel','anomaly_flag','anomaly_score']]
-    stack_res = train_stacked_ensemble(df_feat, feature_cols)
+    with memory_stage('stacked_ensemble'):
+        stack_res = stage('train_stacked_ensemble', train_stacked_ensemble, df_feat, feature_cols)
     df_feat['stack_pred'] = stack_res['meta_clf'].predict_proba(stack_res['oof_preds'])[:,1]
     
     # Metrics
     report, cm, roc, pr_auc = compute_metrics(df_feat)
-    lead_times = compute_lead_time(df_feat)
+    lead_report = lead_time_report(df_feat, breakdown_df)
+    save_lead_time_report(lead_report, os.path.join(out_dir,'lead_time_report.json'))
+    lead_times = lead_report['events']['lead_hours_last'].dropna().tolist()
     info(f"\nClassification Report:\n{report}")
     info(f"Confusion Matrix:\n{cm}")
     info(f"ROC-AUC: {roc:.4f}, PR-AUC: {pr_auc:.4f}, Avg Lead Time (hrs): {np.mean(lead_times):.2f}")
@@ -326,7 +335,8 @@ def run_pipeline(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_
     alerts_to_json(alerts_df, os.path.join(out_dir,"alerts.json"))
     
     # SHAP
-    compute_shap(df_feat, feature_cols, stack_res['models_fitted']['xgb'][0][0] if xgb else None, path=os.path.join(out_dir,'shap_values.npy'))
+    xgb_model, xgb_scaler = stack_res['models_fitted']['xgb'][0]
+    compute_shap(df_feat, feature_cols, xgb_model, xgb_scaler, path=os.path.join(out_dir,'shap_values.npy'))
     
     # Save models
     for model_type,lst in stack_res['models_fitted'].items():
@@ -338,6 +348,16 @@ def run_pipeline(sensor_csv="feedmill_clean_long.csv", breakdown_csv="breakdown_
     joblib.dump(iso_model, os.path.join(out_dir,'isolationforest_model.pkl'))
 
     info("Pipeline completed successfully.")
+
+    # Memory per stage
+    mem_df = memory_report_df()
+    mem_df.to_csv(os.path.join(out_dir,'memory_report.csv'), index=False)
+    info(f"Peak RSS per stage:\n{mem_df.to_string(index=False)}")
+
+    # Stage cache hits/misses
+    if cache:
+        cache.report_df().to_csv(os.path.join(out_dir,'stage_cache_report.csv'), index=False)
+
     return df_feat, alerts_df, stack_res
 
 # =========================
@@ -0,0 +1,137 @@
+# =========================================
+# Out-of-core long -> wide pivot
+# - Reads the long historian export (DateTime, SensorName, Value[, machine]) in chunks
+# - Input must be time-ordered; rows of the last timestamp in a chunk are held back
+#   and pivoted with the next chunk so no timestamp is split across chunks
+# - Forward fill only, with the last known value per sensor (per machine) carried
+#   between chunks: no bfill, no look-ahead
+# - Optional label_fn labels each long chunk; the label is carried per timestamp (max over
+#   its rows) as a FailureLabel column, so training never needs the long frame in memory
+# - Each chunk is appended to a Parquet file as one row group (fixed schema)
+# =========================================
+
+import argparse, logging
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except: pa = pq = None
+
+from pm_dtypes import read_long_csv, pivot_wide, to_float32
+
+logger = logging.getLogger()
+
+# =========================
+# 1) Sensor list
+# =========================
+def scan_sensor_names(sensor_csv, chunksize=1_000_000):
+    """First pass over SensorName only, so every chunk is written with the same columns."""
+    names = set()
+    for chunk in pd.read_csv(sensor_csv, usecols=['SensorName'], dtype={'SensorName':'category'}, chunksize=chunksize):
+        names.update(chunk['SensorName'].cat.categories)
+    return sorted(map(str, names))
+
+# =========================
+# 2) Forward fill with carry-over
+# =========================
+def _ffill_with_state(wide, sensors, state, machine_col=None):
+    """Forward-fill sensors from the previous chunk's last known values; updates state in place."""
+    groups = wide.groupby(machine_col, sort=False, observed=True) if machine_col else [(None, wide)]
+    filled = []
+    for machine, block in groups:
+        values = block[sensors]
+        prev = state.get(machine)
+        if prev is not None:
+            values = pd.concat([prev.to_frame().T.astype(values.dtypes), values])
+        values = values.ffill().iloc[0 if prev is None else 1:]
+        block = block.copy()
+        block[sensors] = values.to_numpy()
+        state[machine] = values.iloc[-1]
+        filled.append(block)
+    return pd.concat(filled).sort_values(['DateTime'] + ([machine_col] if machine_col else []), kind='stable')
+
+# =========================
+# 3) Chunked pivot
+# =========================
+def pivot_long_csv_chunked(sensor_csv, out_path, sensors=None, chunksize=1_000_000, machine_col=None, label_fn=None):
+    """
+    Pivot a time-ordered long-format CSV to a wide Parquet file in bounded memory.
+
+    Args:
+        sensors: sensor columns of the output; scanned from the file (extra pass) when None
+        chunksize: long rows per read_csv chunk
+        machine_col: optional machine/mill column; the wide table is then keyed by (DateTime, machine)
+        label_fn: optional long chunk -> chunk with a 0/1 FailureLabel per row (row-wise: it sees one
+                  chunk at a time); adds an int8 FailureLabel column = max label of each wide row
+
+    Returns:
+        dict with rows, chunks, sensors and out_path
+    """
+    if pq is None:
+        raise ImportError("pyarrow is required for the chunked pivot (pip install pyarrow)")
+    sensors = list(sensors) if sensors is not None else scan_sensor_names(sensor_csv, chunksize)
+    keys = [machine_col, 'DateTime'] if machine_col else ['DateTime']
+
+    fields = [pa.field('DateTime', pa.timestamp('ns'))]
+    if machine_col: fields.append(pa.field(machine_col, pa.string()))
+    fields += [pa.field(s, pa.float32()) for s in sensors]
+    if label_fn: fields.append(pa.field('FailureLabel', pa.int8()))
+    schema = pa.schema(fields)
+
+    state, held, prev_max = {}, None, None
+    rows = chunks = 0
+
+    def _write(part):
+        nonlocal rows, chunks
+        wide = pivot_wide(part, index=keys).reindex(columns=keys + sensors)
+        if machine_col: wide[machine_col] = wide[machine_col].astype(str)
+        wide = _ffill_with_state(wide, sensors, state, machine_col)
+        if label_fn:
+            labels = label_fn(part).groupby(keys, observed=True)['FailureLabel'].max().rename('FailureLabel').reset_index()
+            if machine_col: labels[machine_col] = labels[machine_col].astype(str)
+            wide = wide.merge(labels, on=keys, how='left')
+            wide['FailureLabel'] = wide['FailureLabel'].fillna(0).astype('int8')
+        writer.write_table(pa.Table.from_pandas(to_float32(wide)[schema.names], schema=schema, preserve_index=False))
+        rows += len(wide); chunks += 1
+
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for chunk in read_long_csv(sensor_csv, chunksize=chunksize):
+            chunk['DateTime'] = pd.to_datetime(chunk['DateTime'], errors='coerce')
+            chunk = chunk.dropna(subset=['DateTime'])
+            if chunk.empty:
+                continue
+            if prev_max is not None and chunk['DateTime'].min() < prev_max:
+                raise ValueError(f"{sensor_csv} is not time-ordered: {chunk['DateTime'].min()} after {prev_max}")
+            if held is not None:
+                chunk = pd.concat([held, chunk], ignore_index=True)
+
+            # Hold back the last timestamp: its readings may continue in the next chunk
+            prev_max = chunk['DateTime'].max()
+            tail = (chunk['DateTime'] == prev_max).to_numpy()
+            held = chunk[tail]
+            if (~tail).any():
+                _write(chunk[~tail])
+        if held is not None and len(held):
+            _write(held)
+
+    logger.info(f"Chunked pivot: {rows} wide rows x {len(sensors)} sensors in {chunks} row groups -> {out_path}")
+    return {'rows': rows, 'chunks': chunks, 'sensors': sensors, 'out_path': out_path}
+
+def read_wide(path, columns=None, filters=None):
+    """Load (part of) the wide Parquet table, e.g. filters=[('DateTime','>=',pd.Timestamp('2024-01-01'))]."""
+    return to_float32(pd.read_parquet(path, columns=columns, filters=filters))
+
+# =========================
+# 4) CLI
+# =========================
+if __name__=="__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Chunked long -> wide pivot of a historian export to Parquet")
+    parser.add_argument('--sensor-csv', default="feedmill_clean_long.csv")
+    parser.add_argument('--out', default="feedmill_wide.parquet")
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    parser.add_argument('--machine-col', default=None)
+    parser.add_argument('--sensors', nargs='*', default=None, help="sensor columns (default: scan the file)")
+    args = parser.parse_args()
+    pivot_long_csv_chunked(args.sensor_csv, args.out, args.sensors, args.chunksize, args.machine_col)
@@ -0,0 +1,87 @@
+# =========================================
+# Sampled + parallel TreeSHAP
+# - Global importance from a stratified sample (every class kept) instead of the full df_feat
+# - Sample split into chunks explained in parallel with joblib
+# - Native TreeSHAP (xgboost pred_contribs / lightgbm pred_contrib) when available, shap otherwise
+# - Output: mean |SHAP| per feature (csv) + the sampled SHAP matrix (float32 npy)
+# =========================================
+
+import logging
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+try: import xgboost as xgb
+except: xgb=None
+try: import shap
+except: shap=None
+
+logger = logging.getLogger()
+
+# =========================
+# 1) Contributions
+# =========================
+def tree_contributions(model, X, explainer=None):
+    """
+    Per-row TreeSHAP contributions for a fitted tree model (log-odds space).
+
+    Returns:
+        (contribs [n_rows, n_features], base_value) or None when the model is not supported
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if xgb is not None and hasattr(model, 'get_booster'):
+        out = model.get_booster().predict(xgb.DMatrix(X), pred_contribs=True)
+        return out[:, :-1], float(out[0, -1]) if len(out) else 0.0
+    if hasattr(model, 'booster_'):
+        out = model.booster_.predict(X, pred_contrib=True)
+        return out[:, :-1], float(out[0, -1]) if len(out) else 0.0
+    if shap is None:
+        return None
+    explainer = explainer or shap.TreeExplainer(model)
+    values = explainer.shap_values(X, check_additivity=False)
+    base = explainer.expected_value
+    if isinstance(values, list):        # sklearn classifiers: one array per class
+        values, base = values[1], base[1]
+    elif np.ndim(values) == 3:
+        values, base = values[:, :, 1], np.ravel(base)[1]
+    return values, float(np.ravel(base)[0])
+
+# =========================
+# 2) Sampling
+# =========================
+def stratified_sample(df, label_col='FailureLabel', n=2000, random_state=42):
+    """Sample up to n rows keeping the class ratio, with at least min(class size, 50) rows per class."""
+    if len(df) <= n or label_col not in df.columns:
+        return df
+    parts = []
+    for _, g in df.groupby(label_col, observed=True):
+        k = min(len(g), max(int(round(n * len(g) / len(df))), 50))
+        parts.append(g.sample(k, random_state=random_state))
+    return pd.concat(parts).sort_index()
+
+# =========================
+# 3) Global importance
+# =========================
+def global_importance(df_feat, feature_cols, model, scaler=None, label_col='FailureLabel',
+                      sample_size=2000, chunk_size=256, n_jobs=-1, random_state=42):
+    """
+    Mean |SHAP| per feature on a stratified sample, explained in parallel chunks.
+
+    Returns:
+        (importance DataFrame sorted by mean_abs_shap, sampled SHAP matrix) or (None, None)
+    """
+    sample = stratified_sample(df_feat, label_col, sample_size, random_state)
+    X = sample[feature_cols].fillna(0).astype(np.float32)
+    X = np.asarray(scaler.transform(X) if scaler is not None else X, dtype=np.float32)
+
+    chunks = [X[i:i+chunk_size] for i in range(0, len(X), chunk_size)]
+    results = Parallel(n_jobs=n_jobs, prefer='threads')(delayed(tree_contributions)(model, c) for c in chunks)
+    if not results or any(r is None for r in results):
+        return None, None
+
+    values = np.vstack([r[0] for r in results]).astype(np.float32)
+    importance = pd.DataFrame({'feature': feature_cols, 'mean_abs_shap': np.abs(values).mean(axis=0)})
+    importance = importance.sort_values('mean_abs_shap', ascending=False).reset_index(drop=True)
+    logger.info(f"SHAP on {len(X)}/{len(df_feat)} sampled rows ({len(chunks)} chunks), "
+                f"top features: {', '.join(importance['feature'].head(5))}")
+    return importance, values
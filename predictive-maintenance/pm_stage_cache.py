@@ -0,0 +1,256 @@
+# =========================================
+# Stage-level artifact cache for run_pipeline
+# - Key = hash(stage name, stage code version, parameters, input fingerprints)
+#   * code version: source of the stage function + everything it reaches in the project
+#     (functions / classes, transitively) + the constants they read
+#   * input files are hashed by content, DataFrames with hash_pandas_object,
+#     outputs of an earlier cached stage reuse that stage's key (no re-hash)
+# - DataFrames are stored as Parquet (joblib without pyarrow), everything else with joblib
+# - Every lookup is recorded (hit/miss, seconds) for the CLI report
+# =========================================
+
+import os, sys, json, time, shutil, hashlib, inspect, argparse, logging, importlib.util
+import pandas as pd
+import joblib
+
+try: import pyarrow
+except: pyarrow = None
+
+logger = logging.getLogger()
+
+CACHE_VERSION = 1
+
+# =========================
+# 1) Fingerprints
+# =========================
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def data_hash(obj):
+    """Content hash of a stage input."""
+    if isinstance(obj, pd.DataFrame):
+        h = hashlib.sha256(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+        h.update(repr([(str(c), str(t)) for c, t in obj.dtypes.items()]).encode())
+        return h.hexdigest()
+    if isinstance(obj, str) and os.path.isfile(obj):
+        return file_hash(obj)
+    return joblib.hash(obj)
+
+def _is_project_code(obj):
+    """Defined in a source file of this repo (not the standard library / site-packages)."""
+    try: path = inspect.getsourcefile(obj)
+    except TypeError: return False
+    if not path: return False
+    path = os.path.abspath(path)
+    return 'site-packages' not in path and 'dist-packages' not in path and not path.startswith(os.path.abspath(os.path.dirname(os.__file__)))
+
+def _code_names(code):
+    """Global / attribute names used by a code object and the lambdas / nested functions inside it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+def _references(obj):
+    """Functions / classes obj depends on, plus a stable text for the plain-data globals it reads."""
+    if inspect.isclass(obj):
+        return [v for v in vars(obj).values() if inspect.isfunction(v) or isinstance(v, (staticmethod, classmethod))], []
+    if isinstance(obj, (staticmethod, classmethod)):
+        obj = obj.__func__
+    names = sorted(_code_names(obj.__code__))
+    modules = [obj.__globals__[n] for n in names if inspect.ismodule(obj.__globals__.get(n)) and _is_project_code(obj.__globals__[n])]
+    candidates = [(n, obj.__globals__[n]) for n in names if n in obj.__globals__]
+    candidates += [(f"{m.__name__}.{n}", getattr(m, n)) for m in modules for n in names if hasattr(m, n)]
+    candidates += [(f"<closure {i}>", c.cell_contents) for i, c in enumerate(obj.__closure__ or ())]
+    deps, data = [], []
+    for name, value in candidates:
+        if not inspect.ismodule(value):
+            _collect(name, value, deps, data)
+    return deps, data
+
+def _collect(name, value, deps, data, depth=0):
+    if inspect.isfunction(value) or inspect.isclass(value):
+        if _is_project_code(value):
+            deps.append(value)
+    elif isinstance(value, (bool, int, float, str, bytes, type(None))):
+        data.append(f"{name}={value!r}")
+    elif isinstance(value, (list, tuple, set, frozenset, dict)) and depth < 3:
+        items = value.items() if isinstance(value, dict) else enumerate(sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value)
+        for k, v in items:
+            _collect(f"{name}[{k!r}]", v, deps, data, depth + 1)
+
+def code_version(fn):
+    """
+    Hash of fn's source, the source of every project function / class it reaches (transitively,
+    through module globals, project-module attributes, closures and containers like stage
+    registries) and the values of the plain-data globals they read.
+    """
+    parts, seen, todo = [], set(), [fn]
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        try: parts.append(inspect.getsource(obj))
+        except (OSError, TypeError): parts.append(getattr(obj, '__qualname__', repr(obj)))
+        deps, data = _references(obj)
+        parts.extend(data)
+        todo.extend(reversed(deps))
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()[:16]
+
+def run_stage(name, fn, *args, **kwargs):
+    """No-cache stand-in with the same signature as StageCache.run."""
+    return fn(*args, **kwargs)
+
+# =========================
+# 2) Cache
+# =========================
+class StageCache:
+    def __init__(self, cache_dir=".stage_cache"):
+        self.cache_dir = cache_dir
+        self.report = []
+        self._keys = {}          # id(output) -> (output, key): lineage of cached outputs
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _fingerprint(self, obj):
+        known = self._keys.get(id(obj))
+        if known is not None and known[0] is obj:
+            return 'stage:' + known[1]
+        if isinstance(obj, (list, tuple)) and not isinstance(obj, str) and any(isinstance(o, pd.DataFrame) for o in obj):
+            return [self._fingerprint(o) for o in obj]
+        return data_hash(obj)
+
+    def key(self, name, fn, args, kwargs):
+        payload = json.dumps({
+            'v': CACHE_VERSION, 'stage': name, 'code': code_version(fn),
+            'args': [self._fingerprint(a) for a in args],
+            'kwargs': {k: self._fingerprint(v) for k, v in sorted(kwargs.items())},
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, name, key)
+
+    def _save(self, path, output):
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        parts = output if isinstance(output, tuple) else (output,)
+        files = []
+        for i, part in enumerate(parts):
+            if isinstance(part, pd.DataFrame) and pyarrow is not None:
+                try:
+                    part.to_parquet(os.path.join(tmp, f'{i}.parquet'), index=True)
+                    files.append(f'{i}.parquet'); continue
+                except Exception as e:
+                    logger.warning(f"[cache] Parquet write failed ({e}), using joblib")
+            joblib.dump(part, os.path.join(tmp, f'{i}.joblib'))
+            files.append(f'{i}.joblib')
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'files': files, 'tuple': isinstance(output, tuple), 'created': time.time()}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    def _load(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        parts = [pd.read_parquet(os.path.join(path, fn)) if fn.endswith('.parquet') else joblib.load(os.path.join(path, fn))
+                 for fn in meta['files']]
+        return tuple(parts) if meta['tuple'] else parts[0]
+
+    def _remember(self, output, key):
+        for part in (output if isinstance(output, tuple) else (output,)):
+            self._keys[id(part)] = (part, key)
+
+    def run(self, name, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), loading it from the cache when the stage key is unchanged."""
+        start = time.perf_counter()
+        key = self.key(name, fn, args, kwargs)
+        path = self._path(name, key)
+        hit = os.path.exists(os.path.join(path, 'meta.json'))
+        output = None
+        if hit:
+            try:
+                output = self._load(path)
+            except Exception as e:
+                logger.warning(f"[cache] {name}: unreadable entry ({e}), recomputing")
+                hit = False
+        if not hit:
+            output = fn(*args, **kwargs)
+            self._save(path, output)
+        self._remember(output, key)
+        row = {'stage': name, 'key': key, 'status': 'hit' if hit else 'miss',
+               'seconds': round(time.perf_counter() - start, 3)}
+        self.report.append(row)
+        logger.info(f"[cache] {name}: {row['status']} ({row['seconds']}s, key {key})")
+        return output
+
+    def report_df(self):
+        return pd.DataFrame(self.report, columns=['stage','key','status','seconds'])
+
+    def entries(self):
+        """Stored entries per stage: key, size (MB) and creation time."""
+        rows = []
+        for stage in sorted(os.listdir(self.cache_dir)):
+            stage_dir = os.path.join(self.cache_dir, stage)
+            if not os.path.isdir(stage_dir): continue
+            for key in sorted(os.listdir(stage_dir)):
+                meta_path = os.path.join(stage_dir, key, 'meta.json')
+                if not os.path.exists(meta_path): continue
+                with open(meta_path) as f: meta = json.load(f)
+                size = sum(os.path.getsize(os.path.join(stage_dir, key, fn)) for fn in meta['files'])
+                rows.append({'stage': stage, 'key': key, 'size_mb': round(size / 1024**2, 2),
+                             'created': pd.Timestamp(meta['created'], unit='s').floor('s')})
+        return pd.DataFrame(rows, columns=['stage','key','size_mb','created'])
+
+    def clear(self, stage=None):
+        target = os.path.join(self.cache_dir, stage) if stage else self.cache_dir
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+# =========================
+# 3) CLI
+# =========================
+def _load_pipeline(path):
+    """Import a pipeline script by path (handles names like pm_model_fullpipeline(Opt).py)."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    name = os.path.splitext(os.path.basename(path))[0].replace('(', '_').replace(')', '')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+if __name__=="__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Pipeline stage cache")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_run = sub.add_parser('run', help="run a pipeline with the cache and report stage hits/misses")
+    p_run.add_argument('--pipeline', default="pm_model_fullpipeline3.py")
+    p_run.add_argument('--sensor-csv', default="feedmill_clean_long.csv")
+    p_run.add_argument('--breakdown-csv', default="breakdown_log_detailed.csv")
+    p_run.add_argument('--out-dir', default="artifacts")
+    p_status = sub.add_parser('status', help="list cached entries")
+    p_clear = sub.add_parser('clear', help="delete cached entries")
+    p_clear.add_argument('--stage', default=None)
+    for p in (p_run, p_status, p_clear):
+        p.add_argument('--cache-dir', default=".stage_cache")
+    args = parser.parse_args()
+
+    if args.cmd == 'run':
+        pipeline = _load_pipeline(args.pipeline)
+        pipeline.run_pipeline(args.sensor_csv, args.breakdown_csv, args.out_dir, cache_dir=args.cache_dir)
+        report = pd.read_csv(os.path.join(args.out_dir, 'stage_cache_report.csv'))
+        print(report.to_string(index=False))
+        print(f"\n{(report['status']=='hit').sum()}/{len(report)} stages from cache, "
+              f"{report.loc[report['status']=='miss','seconds'].sum():.1f}s recomputed")
+    elif args.cmd == 'status':
+        entries = StageCache(args.cache_dir).entries()
+        print(entries.to_string(index=False) if len(entries) else "Cache is empty")
+    else:
+        StageCache(args.cache_dir).clear(args.stage)
+        print(f"Cleared {args.stage or 'all stages'} in {args.cache_dir}")
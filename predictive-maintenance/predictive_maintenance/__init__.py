@@ -0,0 +1,17 @@
+"""
+Predictive maintenance training pipeline (Class III Sugarcane Mill)
+
+One configurable implementation of the pm_model_fullpipeline* variants:
+
+    from predictive_maintenance import load_config, run_pipeline
+    result = run_pipeline(load_config("pipeline_config.json", clustering="kmeans"))
+
+or from the command line:
+
+    python -m predictive_maintenance --config pipeline_config.json --set clustering=kmeans float_dtype=float64
+"""
+from .config import PipelineConfig, load_config, parse_overrides
+from .pipeline import run_pipeline, compute_metrics
+from .stages import CLUSTERERS
+
+__all__ = ['PipelineConfig', 'load_config', 'parse_overrides', 'run_pipeline', 'compute_metrics', 'CLUSTERERS']
@@ -0,0 +1,16 @@
+import argparse, logging
+from .config import load_config, parse_overrides
+from .pipeline import run_pipeline
+
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+
+parser = argparse.ArgumentParser(prog="python -m predictive_maintenance", description="Run the configurable training pipeline")
+parser.add_argument('--config', default=None, help="JSON config file (see pipeline_config.json)")
+parser.add_argument('--set', nargs='*', default=[], metavar='KEY=VALUE', help="override config keys, e.g. clustering=kmeans fft=true")
+args = parser.parse_args()
+
+config = load_config(args.config, **parse_overrides(args.set))
+result = run_pipeline(config)
+print(result['stage_times'].to_string(index=False))
+if result['cache'] is not None:
+    print(result['cache'].to_string(index=False))
@@ -0,0 +1,88 @@
+# =========================================
+# Pipeline configuration
+# - One dataclass for every tunable of the pipeline
+# - Loaded from a JSON file (pipeline_config.json) + key=value overrides
+# - Stage implementation switches: clustering, float_dtype, fft
+# =========================================
+
+import json
+from dataclasses import dataclass, field, asdict, fields
+from typing import Dict, List, Optional
+
+CLUSTERING_CHOICES = ('kmeans', 'minibatch', 'none')
+FLOAT_DTYPES = ('float32', 'float64')
+
+@dataclass
+class PipelineConfig:
+    # Inputs / outputs
+    sensor_csv: str = "feedmill_clean_long.csv"
+    breakdown_csv: str = "breakdown_log_detailed.csv"
+    out_dir: str = "artifacts"
+    cache_dir: Optional[str] = None
+    wide_parquet: Optional[str] = None      # out-of-core: label + pivot sensor_csv in chunks into this Parquet file
+    pivot_chunksize: int = 1_000_000        # long rows per chunk when building wide_parquet
+
+    # Labeling
+    label_window_hours: float = 8
+    label_thresholds: Dict[str, float] = field(default_factory=lambda: {'Winding':80, 'Oil Gear':70, 'Vrms':4.5})
+
+    # Features
+    float_dtype: str = 'float32'            # 'float32' | 'float64'
+    roll_windows: List[int] = field(default_factory=lambda: [3,5,10])
+    drop_constant: bool = True              # drop sensors with a single distinct value before rolling
+    fft: bool = False
+    fft_window: int = 32
+
+    # Clustering layer
+    clustering: str = 'minibatch'           # 'kmeans' | 'minibatch' | 'none'
+    n_clusters: int = 4
+    cluster_batch_size: int = 10000
+
+    # Anomaly layer
+    iso_n_estimators: int = 100
+    iso_contamination: float = 0.02
+
+    # Stacked ensemble
+    n_splits: int = 5
+    smote: bool = True
+    random_state: int = 42
+
+    # Outputs
+    alert_thresholds: Optional[Dict[str, float]] = None
+    include_cluster_alerts: bool = False
+    shap_sample_size: int = 2000
+    lead_horizon_hours: Optional[float] = 24
+
+    def __post_init__(self):
+        if self.clustering not in CLUSTERING_CHOICES:
+            raise ValueError(f"clustering must be one of {CLUSTERING_CHOICES}, got {self.clustering!r}")
+        if self.float_dtype not in FLOAT_DTYPES:
+            raise ValueError(f"float_dtype must be one of {FLOAT_DTYPES}, got {self.float_dtype!r}")
+
+    def to_dict(self):
+        return asdict(self)
+
+    def replace(self, **overrides):
+        return PipelineConfig(**{**self.to_dict(), **overrides})
+
+def load_config(path=None, **overrides):
+    """PipelineConfig from a JSON file (optional) with keyword overrides; unknown keys raise ValueError."""
+    values = {}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            values = json.load(f)
+    values.update(overrides)
+    known = {f.name for f in fields(PipelineConfig)}
+    unknown = sorted(set(values) - known)
+    if unknown:
+        raise ValueError(f"Unknown pipeline config keys: {', '.join(unknown)}")
+    return PipelineConfig(**values)
+
+def parse_overrides(pairs):
+    """['clustering=kmeans', 'fft=true'] -> {'clustering': 'kmeans', 'fft': True} (values parsed as JSON when possible)."""
+    overrides = {}
+    for pair in pairs or []:
+        key, _, raw = pair.partition('=')
+        try: overrides[key] = json.loads(raw)
+        except json.JSONDecodeError: overrides[key] = raw
+    return overrides
@@ -0,0 +1,126 @@
+# =========================================
+# Configurable pipeline runner
+# load -> label -> pivot/features (or chunked label + pivot to Parquet when wide_parquet is set) -> clustering -> IsolationForest -> stacked ensemble
+# -> metrics / lead time / alerts / SHAP / artifacts, every stage driven by PipelineConfig
+# =========================================
+
+import os, json, logging
+import numpy as np
+import joblib
+from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score, precision_recall_curve, auc
+
+from pm_dtypes import memory_stage, memory_report_df, MEMORY_REPORT
+from pm_alerts import build_alerts, write_alerts_json
+from pm_lead_time import lead_time_report, save_lead_time_report
+from pm_shap import global_importance
+from pm_stage_cache import StageCache, run_stage
+from pm_pivot_chunked import read_wide
+
+from .config import PipelineConfig
+from . import stages
+
+logger = logging.getLogger()
+def info(msg): logger.info(msg)
+def warn(msg): logger.warning(msg)
+
+def compute_metrics(df_feat, pred_col='stack_pred', target_col='FailureLabel'):
+    y_true, y_prob = df_feat[target_col], df_feat[pred_col]
+    report = classification_report(y_true, y_prob>0.5, digits=4)
+    cm = confusion_matrix(y_true, y_prob>0.5)
+    roc = roc_auc_score(y_true, y_prob) if y_true.nunique() > 1 else float('nan')
+    precision, recall, _ = precision_recall_curve(y_true, y_prob)
+    return report, cm, roc, auc(recall, precision)
+
+def save_artifacts(out_dir, stack_res, km_model, iso_model):
+    for model_type,lst in stack_res['models_fitted'].items():
+        for i,(m,s) in enumerate(lst):
+            joblib.dump(m, os.path.join(out_dir,f"{model_type}_fold{i}.pkl"))
+            if s: joblib.dump(s, os.path.join(out_dir,f"{model_type}_scaler_fold{i}.pkl"))
+    joblib.dump(stack_res['meta_clf'], os.path.join(out_dir,'meta_model.pkl'))
+    if km_model is not None: joblib.dump(km_model, os.path.join(out_dir,'kmeans_model.pkl'))
+    joblib.dump(iso_model, os.path.join(out_dir,'isolation_forest.pkl'))
+
+def run_pipeline(config=None, save=True):
+    """
+    Run the full pipeline for one configuration.
+
+    Args:
+        config: PipelineConfig (defaults to PipelineConfig())
+        save: write models, predictions, alerts and reports to config.out_dir
+
+    Returns:
+        dict with df_feat, alerts_df, report, cm, roc, pr_auc, lead_time (report dict), stage_times, cache (hit/miss rows)
+    """
+    cfg = config or PipelineConfig()
+    os.makedirs(cfg.out_dir, exist_ok=True)
+    MEMORY_REPORT.clear()
+    cache = StageCache(cfg.cache_dir) if cfg.cache_dir else None
+    stage = cache.run if cache else run_stage
+
+    df, wide = None, None
+    if cfg.wide_parquet:
+        # Out-of-core: the long export is labelled + pivoted chunk by chunk, only the wide table is loaded
+        with memory_stage('load_data'):
+            breakdown_df = stages.load_breakdown(cfg.breakdown_csv)
+        with memory_stage('chunked_pivot'):
+            if not os.path.exists(cfg.wide_parquet) or os.path.getmtime(cfg.wide_parquet) < os.path.getmtime(cfg.sensor_csv):
+                stages.pivot_to_parquet(cfg.sensor_csv, breakdown_df, cfg.wide_parquet, label_window_hours=cfg.label_window_hours,
+                                        thresholds=cfg.label_thresholds, chunksize=cfg.pivot_chunksize)
+            wide = read_wide(cfg.wide_parquet)
+    else:
+        with memory_stage('load_data'):
+            df, breakdown_df = stage('load_data', stages.load_data, cfg.sensor_csv, cfg.breakdown_csv, float_dtype=cfg.float_dtype)
+        with memory_stage('hybrid_labeling'):
+            df = stage('hybrid_labeling', stages.hybrid_labeling, df, breakdown_df,
+                       label_window_hours=cfg.label_window_hours, thresholds=cfg.label_thresholds)
+    with memory_stage('pivot_and_features'):
+        df_feat = stage('pivot_and_features', stages.pivot_and_features, df, roll_windows=list(cfg.roll_windows),
+                        fft=cfg.fft, fft_window=cfg.fft_window, drop_constant=cfg.drop_constant, float_dtype=cfg.float_dtype,
+                        wide=wide)
+    with memory_stage('clustering'):
+        df_feat, km_model = stage('add_cluster_features', stages.add_cluster_features, df_feat, method=cfg.clustering,
+                                  n_clusters=cfg.n_clusters, batch_size=cfg.cluster_batch_size,
+                                  random_state=cfg.random_state, float_dtype=cfg.float_dtype)
+    with memory_stage('isolation_forest'):
+        df_feat, iso_model = stage('anomaly_layer', stages.anomaly_layer, df_feat, n_estimators=cfg.iso_n_estimators,
+                                   contamination=cfg.iso_contamination, random_state=cfg.random_state, float_dtype=cfg.float_dtype)
+
+    feature_cols = stages.feature_columns(df_feat)
+    with memory_stage('stacked_ensemble'):
+        stack_res = stage('train_stacked_ensemble', stages.train_stacked_ensemble, df_feat, feature_cols,
+                          n_splits=cfg.n_splits, smote=cfg.smote, random_state=cfg.random_state, float_dtype=cfg.float_dtype)
+    df_feat['stack_pred'] = stack_res['meta_clf'].predict_proba(stack_res['oof_preds'])[:,1]
+
+    # Metrics & lead time
+    report, cm, roc, pr_auc = compute_metrics(df_feat)
+    lead = lead_time_report(df_feat, breakdown_df, horizon_hours=cfg.lead_horizon_hours)
+    info(f"\nClassification Report:\n{report}")
+    info(f"ROC-AUC: {roc:.4f}, PR-AUC: {pr_auc:.4f}")
+
+    alerts_df = build_alerts(df_feat, cfg.alert_thresholds, include_cluster=cfg.include_cluster_alerts)
+
+    if save:
+        out = lambda name: os.path.join(cfg.out_dir, name)
+        with open(out('pipeline_config.json'), 'w', encoding='utf-8') as f:
+            json.dump(cfg.to_dict(), f, indent=2)
+        save_lead_time_report(lead, out('lead_time_report.json'))
+        write_alerts_json(alerts_df, out('alerts.json'))
+
+        xgb_model, xgb_scaler = stack_res['models_fitted']['xgb'][0]
+        importance, shap_values = global_importance(df_feat, feature_cols, xgb_model, xgb_scaler,
+                                                    sample_size=cfg.shap_sample_size, random_state=cfg.random_state)
+        if importance is not None:
+            np.save(out('shap_values.npy'), shap_values)
+            importance.to_csv(out('shap_importance.csv'), index=False)
+        else:
+            info("Skipping SHAP computation")
+
+        save_artifacts(cfg.out_dir, stack_res, km_model, iso_model)
+        df_feat.to_csv(out('stack_predictions.csv'), index=False)
+        memory_report_df().to_csv(out('memory_report.csv'), index=False)
+        if cache: cache.report_df().to_csv(out('stage_cache_report.csv'), index=False)
+        info(f"Artifacts saved to {cfg.out_dir}")
+
+    return {'df_feat': df_feat, 'alerts_df': alerts_df, 'report': report, 'cm': cm, 'roc': roc, 'pr_auc': pr_auc,
+            'lead_time': lead, 'stage_times': memory_report_df(),
+            'cache': cache.report_df() if cache else None}
@@ -0,0 +1,271 @@
+# =========================================
+# Pipeline stages (single implementation of what the pm_model_fullpipeline* scripts duplicate)
+# - Every stage takes its parameters explicitly so the stage cache keys on them
+# - Float dtype is a policy (float32 fast path / float64 reference)
+# - Clustering implementation is pluggable: CLUSTERERS[name](n_clusters, batch_size, random_state)
+# - Rolling features built in one block per window, FFT via sliding windows in row blocks
+# =========================================
+
+import logging
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.model_selection import GroupKFold
+from sklearn.preprocessing import StandardScaler
+from sklearn.linear_model import LogisticRegression
+from sklearn.ensemble import RandomForestClassifier, IsolationForest
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from pm_dtypes import DTYPE_POLICY, read_long_csv, apply_long_policy, pivot_wide, to_float32, feature_matrix
+from pm_pivot_chunked import pivot_long_csv_chunked
+
+try: import xgboost as xgb
+except: xgb=None
+try: import lightgbm as lgb
+except: lgb=None
+try: from imblearn.combine import SMOTEENN
+except: SMOTEENN=None
+
+logger = logging.getLogger()
+def info(msg): logger.info(msg)
+def warn(msg): logger.warning(msg)
+
+NON_FEATURE_COLS = ['FailureLabel','anomaly_flag','anomaly_score']
+
+def dtype_policy(float_dtype='float32'):
+    return {**DTYPE_POLICY, 'float_dtype': float_dtype}
+
+def _cast_floats(df, float_dtype):
+    if float_dtype == 'float32':
+        return to_float32(df)
+    float_cols = df.select_dtypes(include=['float32']).columns
+    if len(float_cols):
+        df[float_cols] = df[float_cols].astype(float_dtype)
+    return df
+
+# =========================
+# 1) Load
+# =========================
+def load_data(sensor_csv, breakdown_csv, float_dtype='float32'):
+    info("Loading sensor data...")
+    policy = dtype_policy(float_dtype)
+    df = read_long_csv(sensor_csv, policy)
+    df['DateTime'] = pd.to_datetime(df['DateTime'], errors='coerce')
+    df['machine_type'] = 'Feed Mill 1'
+    apply_long_policy(df, policy)
+    return df, load_breakdown(breakdown_csv)
+
+def load_breakdown(breakdown_csv):
+    info("Loading breakdown data...")
+    try:
+        breakdown_df = pd.read_csv(breakdown_csv)
+        if 'Date' in breakdown_df.columns:
+            date = breakdown_df['Date'].astype(str)+' '
+            if 'TimeStart' in breakdown_df.columns and 'TimeEnd' in breakdown_df.columns:
+                breakdown_df['DateTimeStart'] = pd.to_datetime(date+breakdown_df['TimeStart'].astype(str), errors='coerce')
+                breakdown_df['DateTimeEnd'] = pd.to_datetime(date+breakdown_df['TimeEnd'].astype(str), errors='coerce')
+            else:
+                breakdown_df['DateTimeStart'] = pd.to_datetime(date+breakdown_df.get('Time','00:00:00').astype(str), errors='coerce')
+                breakdown_df['DateTimeEnd'] = breakdown_df['DateTimeStart'] + pd.to_timedelta(breakdown_df.get('Duration_min',0), unit='m')
+        breakdown_df['machine_type'] = breakdown_df.get('Machine','Feed Mill 1')
+    except Exception as e:
+        logger.error(f"Failed to load breakdown CSV: {e}")
+        breakdown_df = pd.DataFrame(columns=['DateTimeStart','DateTimeEnd','machine_type'])
+    return breakdown_df
+
+# =========================
+# 2) Hybrid labeling
+# =========================
+def hybrid_labeling(df, breakdown_df, label_window_hours=8, thresholds=None, current_stats=None):
+    """current_stats: (mean, std) of all Current readings; taken from df when None (pass it when df is one chunk)."""
+    info("Applying hybrid labeling...")
+    thresholds = thresholds or {'Winding':80, 'Oil Gear':70, 'Vrms':4.5}
+    df['FailureLabel'] = np.int8(0)
+
+    # Breakdown windows (lead-time before DateTimeStart)
+    for _, r in breakdown_df.dropna(subset=['DateTimeStart','DateTimeEnd']).iterrows():
+        start = r['DateTimeStart'] - pd.Timedelta(hours=label_window_hours)
+        machine = r.get('machine_type','Feed Mill 1')
+        mask = (df['machine_type']==machine) & (df['DateTime']>=start) & (df['DateTime']<=r['DateTimeEnd'])
+        df.loc[mask,'FailureLabel'] = 1
+
+    # Threshold + current spike (> mu + 3*std) labeling
+    name = df['SensorName']
+    is_current = name.str.contains('Current', case=False, na=False)
+    mask = (name.str.contains('Winding', case=False, na=False) & (df['Value']>thresholds['Winding'])) | \
+           (name.str.contains('Oil Gear', case=False, na=False) & (df['Value']>thresholds['Oil Gear'])) | \
+           (name.eq('Vrms_Est_mm_s') & (df['Value']>thresholds['Vrms']))
+    if current_stats is None and is_current.any():
+        current = df.loc[is_current, 'Value']
+        current_stats = (current.mean(), current.std())
+    if current_stats is not None:
+        mask |= is_current & (df['Value'] > current_stats[0]+3*current_stats[1])
+    df.loc[mask, 'FailureLabel'] = 1
+    info(f"Hybrid labeling done. Class counts:\n{df['FailureLabel'].value_counts()}")
+    return df
+
+def scan_long_csv(sensor_csv, chunksize=1_000_000):
+    """One pass over SensorName/Value: sorted sensor names and (mean, std) of the Current readings."""
+    names, n, total, total_sq = set(), 0, 0.0, 0.0
+    for chunk in pd.read_csv(sensor_csv, usecols=['SensorName','Value'], dtype={'SensorName':'category'}, chunksize=chunksize):
+        names.update(chunk['SensorName'].cat.categories)
+        current = chunk.loc[chunk['SensorName'].str.contains('Current', case=False, na=False), 'Value'].dropna().to_numpy('float64')
+        n += len(current); total += current.sum(); total_sq += (current**2).sum()
+    stats = None
+    if n > 1:
+        mean = total / n
+        stats = (mean, float(np.sqrt(max(total_sq - n*mean*mean, 0.0) / (n - 1))))
+    return sorted(map(str, names)), stats
+
+def pivot_to_parquet(sensor_csv, breakdown_df, out_path, label_window_hours=8, thresholds=None, chunksize=1_000_000):
+    """
+    Out-of-core load + label + pivot: the long CSV is labelled and pivoted chunk by chunk into a wide
+    Parquet file with a FailureLabel column (see pm_pivot_chunked); the long frame is never held whole.
+    """
+    sensors, current_stats = scan_long_csv(sensor_csv, chunksize)
+
+    def label_chunk(chunk):
+        chunk['machine_type'] = 'Feed Mill 1'
+        apply_long_policy(chunk)
+        return hybrid_labeling(chunk, breakdown_df, label_window_hours, thresholds, current_stats)
+
+    return pivot_long_csv_chunked(sensor_csv, out_path, sensors, chunksize, label_fn=label_chunk)
+
+# =========================
+# 3) Pivot + features
+# =========================
+def fft_feature(values, window, block_rows=100_000):
+    """Mean |rFFT| of the de-meaned trailing window at every row (0 until the first full window)."""
+    arr = np.nan_to_num(np.asarray(values, dtype='float32'))
+    out = np.zeros(len(arr), dtype='float32')
+    if len(arr) < window:
+        return out
+    windows = sliding_window_view(arr, window)
+    for start in range(0, len(windows), block_rows):
+        block = windows[start:start+block_rows]
+        spec = np.abs(np.fft.rfft(block - block.mean(axis=1, keepdims=True), axis=1))
+        out[start+window-1:start+window-1+len(block)] = spec.mean(axis=1)
+    return out
+
+def pivot_and_features(df, roll_windows=(3,5,10), fft=False, fft_window=32, drop_constant=True,
+                       float_dtype='float32', wide=None):
+    info("Pivoting and computing features...")
+    policy = dtype_policy(float_dtype)
+    # wide: pre-pivoted table (pivot_to_parquet / read_wide); df is then only used when wide has no labels
+    if wide is None:
+        wide = pivot_wide(df.sort_values('DateTime'), policy)
+    wide = wide.sort_values('DateTime').ffill()     # forward fill only: no look-ahead
+    if 'FailureLabel' not in wide.columns:
+        wide = wide.merge(df[['DateTime','FailureLabel']].drop_duplicates(), on='DateTime', how='left')
+
+    numeric_cols = [c for c in wide.select_dtypes(include=[np.number]).columns if c != 'FailureLabel']
+    if drop_constant:
+        numeric_cols = [c for c in numeric_cols if wide[c].nunique()>1]
+
+    base = wide[numeric_cols]
+    new_cols = {}
+    for w in roll_windows:
+        rolled = base.rolling(w, min_periods=1)
+        mean, std = rolled.mean(), rolled.std()
+        delta = base.diff(w)
+        blocks = {'rollmean': mean, 'rollstd': std.fillna(0), 'rollmin': rolled.min(), 'rollmax': rolled.max(),
+                  'delta': delta, 'slope': delta/w, 'zscore': (base-mean)/std.replace(0,1)}
+        for kind, frame in blocks.items():
+            for c in numeric_cols:
+                new_cols[f'{c}_{kind}_{w}'] = frame[c].to_numpy()
+
+    if fft:
+        info("Computing FFT features...")
+        for c in numeric_cols:
+            new_cols[f'{c}_fft_mean_{fft_window}'] = fft_feature(base[c].to_numpy(), fft_window)
+
+    wide = pd.concat([wide, pd.DataFrame(new_cols, index=wide.index)], axis=1)
+    wide.columns = [str(c).strip().replace(' ','_').replace('/','_').replace('-','_') for c in wide.columns]
+    return _cast_floats(wide, float_dtype)
+
+# =========================
+# 4) Clustering layer
+# =========================
+CLUSTERERS = {
+    'kmeans': lambda n_clusters, batch_size, random_state: KMeans(n_clusters=n_clusters, random_state=random_state),
+    'minibatch': lambda n_clusters, batch_size, random_state: MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size,
+                                                                              random_state=random_state),
+}
+
+def add_cluster_features(df_feat, method='minibatch', n_clusters=4, batch_size=10000, random_state=42, float_dtype='float32'):
+    if method == 'none':
+        return df_feat, None
+    info(f"Adding clustering features ({method})...")
+    num_cols = [c for c in df_feat.select_dtypes(include=[np.number]).columns if c not in NON_FEATURE_COLS]
+    X = feature_matrix(df_feat, num_cols, dtype_policy(float_dtype))
+    km = CLUSTERERS[method](n_clusters, batch_size, random_state)
+    df_feat['cluster'] = km.fit_predict(X).astype('int8')
+    return df_feat, km
+
+# =========================
+# 5) Anomaly layer
+# =========================
+def anomaly_layer(df_feat, n_estimators=100, contamination=0.02, random_state=42, float_dtype='float32'):
+    info("Running IsolationForest...")
+    num_cols = [c for c in df_feat.select_dtypes(include=[np.number]).columns if c != 'FailureLabel']
+    X = feature_matrix(df_feat, num_cols, dtype_policy(float_dtype))
+    iso_model = IsolationForest(n_estimators=n_estimators, contamination=contamination, n_jobs=-1, random_state=random_state)
+    df_feat['anomaly_flag'] = (iso_model.fit_predict(X)==-1).astype('int8')
+    df_feat['anomaly_score'] = (-iso_model.decision_function(X)).astype(float_dtype)
+    info(f"Anomalies detected: {df_feat['anomaly_flag'].sum()}")
+    return df_feat, iso_model
+
+# =========================
+# 6) Stacked ensemble
+# =========================
+def feature_columns(df_feat):
+    return [c for c in df_feat.select_dtypes(include=[np.number]).columns if c not in NON_FEATURE_COLS]
+
+def train_stacked_ensemble(df_feat, feature_cols, target_col='FailureLabel', n_splits=5, smote=True,
+                           random_state=42, float_dtype='float32'):
+    info("Training stacked ensemble...")
+    X = df_feat[feature_cols].fillna(0).astype(float_dtype)
+    y = df_feat[target_col].astype(int)
+    groups = np.arange(len(df_feat))
+    oof_preds = np.zeros((len(X),3))
+    models_fitted = {'xgb':[], 'lgb':[], 'rf':[]}
+
+    for fold,(train_idx,val_idx) in enumerate(GroupKFold(n_splits=n_splits).split(X,y,groups),1):
+        info(f"Fold {fold}")
+        X_tr, X_val, y_tr = X.iloc[train_idx], X.iloc[val_idx], y.iloc[train_idx]
+        if smote and SMOTEENN:
+            X_tr, y_tr = SMOTEENN(random_state=random_state).fit_resample(X_tr, y_tr)
+
+        scaler = StandardScaler()
+        X_tr_s, X_val_s = scaler.fit_transform(X_tr), scaler.transform(X_val)
+
+        # Slot 0: XGB on scaled inputs (RF fallback)
+        if xgb:
+            scale_pos_weight = (len(y_tr)-sum(y_tr))/max(sum(y_tr),1)
+            clf = xgb.XGBClassifier(n_estimators=200, max_depth=6, learning_rate=0.08, scale_pos_weight=scale_pos_weight,
+                                    n_jobs=-1, random_state=random_state, eval_metric='logloss')
+            clf.fit(X_tr_s, y_tr)
+            oof_preds[val_idx,0] = clf.predict_proba(X_val_s)[:,1]
+            models_fitted['xgb'].append((clf, scaler))
+        else:
+            clf = RandomForestClassifier(n_estimators=200, max_depth=8, n_jobs=-1, random_state=random_state).fit(X_tr, y_tr)
+            oof_preds[val_idx,0] = clf.predict_proba(X_val)[:,1]
+            models_fitted['xgb'].append((clf, None))
+
+        # Slot 1: LGB (RF fallback)
+        if lgb:
+            clf = lgb.LGBMClassifier(n_estimators=200, max_depth=6, learning_rate=0.08, n_jobs=-1,
+                                     random_state=random_state, verbose=-1).fit(X_tr, y_tr)
+        else:
+            clf = RandomForestClassifier(n_estimators=150, max_depth=8, n_jobs=-1, random_state=random_state).fit(X_tr, y_tr)
+        oof_preds[val_idx,1] = clf.predict_proba(X_val)[:,1]
+        models_fitted['lgb'].append((clf, None))
+
+        # Slot 2: RF
+        clf = RandomForestClassifier(n_estimators=200, max_depth=12, n_jobs=-1, random_state=random_state).fit(X_tr, y_tr)
+        oof_preds[val_idx,2] = clf.predict_proba(X_val)[:,1]
+        models_fitted['rf'].append((clf, None))
+
+    meta_clf = LogisticRegression().fit(oof_preds, y)
+    info("Stacked ensemble trained.")
+    return {'oof_preds':oof_preds, 'meta_clf':meta_clf, 'models_fitted':models_fitted}
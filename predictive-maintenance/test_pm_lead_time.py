@@ -0,0 +1,35 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from pm_lead_time import LEAD_TIME_AGG, event_lead_times, failure_events, lead_time_report, lead_time_summary
+
+
+def _predictions(labels, preds):
+    return pd.DataFrame({'DateTime': pd.date_range('2024-01-01', periods=len(labels), freq='h'),
+                         'FailureLabel': labels, 'stack_pred': preds})
+
+
+def test_summary_without_events():
+    df = _predictions([0] * 6, [0.0] * 6)
+    events = failure_events(df_feat=df)
+    assert events.empty
+
+    summary = lead_time_summary(event_lead_times(df, events))
+    assert set(summary) == set(LEAD_TIME_AGG)
+    assert summary['events'] == 0 and summary['detected'] == 0
+    assert all(math.isnan(summary[k]) for k in LEAD_TIME_AGG if k not in ('events', 'detected'))
+
+
+def test_report_without_events():
+    report = lead_time_report(_predictions([0] * 6, [0.9] * 6))
+    assert report['overall']['events'] == 0
+    assert report['by_machine'].empty and report['by_cause'].empty
+
+
+def test_summary_with_detected_event():
+    df = _predictions([0, 0, 0, 1, 1, 0], [0.0, 0.9, 0.9, 0.9, 0.0, 0.0])
+    summary = lead_time_summary(event_lead_times(df, failure_events(df_feat=df)))
+    assert summary['events'] == 1 and summary['detected'] == 1
+    assert np.isclose(summary['p50_first_hrs'], 2.0) and np.isclose(summary['p50_last_hrs'], 0.0)
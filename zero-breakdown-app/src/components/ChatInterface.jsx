@@ -8,6 +8,7 @@ const API_URL = 'http://localhost:8000'
 function ChatInterface({ messages, setMessages }) {
   const [input, setInput] = useState('')
   const [loading, setLoading] = useState(false)
+  const [sessionId, setSessionId] = useState(null)
 
   const sendMessage = async () => {
     if (!input.trim()) return
@@ -20,8 +21,11 @@ function ChatInterface({ messages, setMessages }) {
     try {
       // ใช้ Orchestrator endpoint แทน
       const response = await axios.post(`${API_URL}/api/orchestrator-chat`, {
-        message: input
+        message: input,
+        session_id: sessionId
       })
+      // ใช้ session เดิมในคำถามถัดไป เพื่อให้ถามต่อเนื่องได้
+      setSessionId(response.data.session_id)
 
       const assistantMessage = {
         role: 'assistant',